@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Compara o parser de transações com o xmltodict
+
+    python benchmarks/bench_parser.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+import xmltodict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shuup_pagseguro.pagseguro.parser import parse_transaction  # noqa (E402)
+from shuup_pagseguro_tests import TRANSACTION_XML  # noqa (E402)
+
+ITERATIONS = 5000
+KEPT_OBJECTS = 1000
+
+
+def measure_memory(parse, content):
+    tracemalloc.start()
+    kept = [parse(content) for __ in range(KEPT_OBJECTS)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size / KEPT_OBJECTS
+
+
+def main():
+    content = TRANSACTION_XML.encode("utf-8")
+    parsers = [
+        ("xmltodict", xmltodict.parse),
+        ("parse_transaction", parse_transaction),
+    ]
+
+    for name, parse in parsers:
+        elapsed = timeit.timeit(lambda: parse(content), number=ITERATIONS)
+        print("{0:<20} {1:>8.1f} us/parse {2:>10.0f} bytes/object".format(
+            name, elapsed / ITERATIONS * 1e6, measure_memory(parse, content)
+        ))
+
+
+if __name__ == "__main__":
+    main()
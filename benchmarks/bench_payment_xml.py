@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Compara a geração do XML de pagamento com a renderização do antigo
+template Jinja (`pagseguro/xml/payment.jinja`)
+
+    python benchmarks/bench_payment_xml.py
+
+O template é compilado uma única vez: é medida apenas a renderização,
+sem a busca do template pelo loader do Django.
+
+Os dois documentos não são idênticos byte a byte (veja
+`serialize_payment`), então a verificação compara o XML interpretado.
+"""
+from __future__ import print_function
+
+from decimal import Decimal
+import os
+import sys
+import timeit
+
+import jinja2
+import xmltodict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shuup_pagseguro.constants import PagSeguroPaymentMethod  # noqa (E402)
+from shuup_pagseguro.pagseguro.serializer import serialize_payment  # noqa (E402)
+
+ITERATIONS = 5000
+LINES = 5
+
+PAYMENT_TEMPLATE = """
+<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<payment>
+    <currency>BRL</currency>
+
+    {% if service.choice_identifier == PagSeguroPaymentMethod.BOLETO.value %}
+    <method>boleto</method>
+    {% elif service.choice_identifier == PagSeguroPaymentMethod.ONLINE_DEBIT.value %}
+    <method>eft</method>
+    {% endif %}
+
+    <mode>default</mode>
+
+    <items>
+        {%- for order_line in lines %}
+        <item>
+            <id>{{ order_line.ordering }}</id>
+            <description>{{ order_line.text }}</description>
+            <amount>{{ '%0.2f'|format(order_line.base_unit_price_value|float) }}</amount>
+            <quantity>{{ order_line.quantity|int }}</quantity>
+        </item>
+        {% endfor -%}
+    </items>
+
+    <reference>{{ order.identifier }}</reference>
+
+    <extraAmount>{{ '%0.2f'|format(extra_amount|float) }}</extraAmount>
+
+    <sender>
+        <name>{{ order.shipping_address.name }}</name>
+        <email>{{ order.email }}</email>
+
+        {% if customer_cpf or customer_cnpj %}
+        <documents>
+            <document>
+                {%- if customer_cpf %}
+                <type>CPF</type>
+                <value>{{ customer_cpf }}</value>
+                {%- elif customer_cnpj -%}
+                <type>CNPJ</type>
+                <value>{{ customer_cnpj }}</value>
+                {% endif -%}
+            </document>
+        </documents>
+        {% endif %}
+
+        {#- O telefone deve ser valido com DD contendo 2 digitos e o numero entre 7 e 9 digitos -#}
+        {%- if phone_area_code|length == 2 and phone_number|length >= 7 and phone_number|length <= 9 %}
+        <phone>
+            <areaCode>{{ phone_area_code|int }}</areaCode>
+            <number>{{ phone_number|int }}</number>
+        </phone>
+        {% endif -%}
+
+        <hash>{{ order.payment_data.pagseguro.sender_hash }}</hash>
+    </sender>
+
+    <shipping>
+        <type>3</type>
+        <address>
+            <street>{{ order.shipping_address.street }}</street>
+            {%- if order.shipping_address.extra and order.shipping_address.extra.numero %}
+            <number>{{ order.shipping_address.extra.numero }}</number>
+            {% endif -%}
+            <complement>{{ order.shipping_address.street2 }}</complement>
+            <district>{{ order.shipping_address.street3 }}</district>
+            <postalCode>{{ postal_code }}</postalCode>
+            <city>{{ order.shipping_address.city }}</city>
+            <state>{{ order.shipping_address.region }}</state>
+            <country>BRA</country>
+        </address>
+    </shipping>
+
+    {% if service.choice_identifier == PagSeguroPaymentMethod.ONLINE_DEBIT.value %}
+    <bank>
+        <name>{{ order.payment_data.pagseguro.bank_name }}</name>
+    </bank>
+    {% endif %}
+
+</payment>
+""".lstrip()
+
+
+class Obj(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def get_payment_data():
+    service = Obj(choice_identifier=PagSeguroPaymentMethod.ONLINE_DEBIT.value)
+    address = Obj(name="José Comprador", street="Av. Brig. Faria Lima", street2="5o andar",
+                  street3="Jardim Paulistano", city="Sao Paulo", region="SP", extra={"numero": "1384"})
+    order = Obj(identifier="ABC123", email="comprador@uol.com.br", shipping_address=address,
+                payment_data={"pagseguro": {"sender_hash": "abcdef", "bank_name": "itau"}})
+    lines = [
+        Obj(ordering=index, text="Produto {0}".format(index),
+            base_unit_price_value=Decimal("24.90"), quantity=Decimal(1))
+        for index in range(LINES)
+    ]
+    return (service, order, lines, Decimal("10.00"), "01452002", "11", "56273440", "12345678909", "")
+
+
+def main():
+    template = jinja2.Environment(autoescape=True).from_string(PAYMENT_TEMPLATE)
+    service, order, lines, extra_amount, postal_code, area_code, number, cpf, cnpj = get_payment_data()
+
+    def render_template():
+        return template.render({
+            "order": order,
+            "service": service,
+            "lines": lines,
+            "extra_amount": extra_amount,
+            "postal_code": postal_code,
+            "phone_area_code": area_code,
+            "phone_number": number,
+            "customer_cpf": cpf,
+            "customer_cnpj": cnpj,
+            "PagSeguroPaymentMethod": PagSeguroPaymentMethod
+        })
+
+    def serialize():
+        return serialize_payment(service, order, lines, extra_amount, postal_code,
+                                 phone_area_code=area_code, phone_number=number,
+                                 customer_cpf=cpf, customer_cnpj=cnpj)
+
+    # mesmos elementos, ordem e conteúdo; espaços entre as tags não são comparados
+    assert xmltodict.parse(render_template()) == xmltodict.parse(serialize())
+
+    for name, function in [("jinja template", render_template), ("serialize_payment", serialize)]:
+        elapsed = timeit.timeit(function, number=ITERATIONS)
+        print("{0:<20} {1:>8.1f} us/payment".format(name, elapsed / ITERATIONS * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -35,6 +35,11 @@ REQUIRES = [
     'xmltodict'
 ]
 
+EXTRAS_REQUIRE = {
+    # cliente assíncrono (shuup_pagseguro.pagseguro.aio)
+    'async': ['aiohttp>=3.3'],
+}
+
 if __name__ == '__main__':
     setuptools.setup(
         name=NAME,
@@ -47,5 +52,12 @@ if __name__ == '__main__':
         packages=["shuup_pagseguro"],
         include_package_data=True,
         install_requires=REQUIRES,
-        entry_points={"shuup.addon": "shuup_pagseguro=shuup_pagseguro"}
+        extras_require=EXTRAS_REQUIRE,
+        entry_points={"shuup.addon": "shuup_pagseguro=shuup_pagseguro"},
+        python_requires='>=3.5',
+        classifiers=[
+            'Programming Language :: Python :: 3',
+            'Programming Language :: Python :: 3.5',
+            'Programming Language :: Python :: 3.6',
+        ]
     )
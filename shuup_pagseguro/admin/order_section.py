@@ -30,7 +30,7 @@ class PagSeguroOrderSection(Section):
     def get_context_data(order):
         return {
             'order': order,
-            'payments': PagSeguroPayment.objects.filter(order=order).order_by('id'),
+            'payments': PagSeguroPayment.objects.filter(order=order).prefetch_related('events').order_by('id'),
 
             # utils
             'PagSeguroTransactionStatus': PagSeguroTransactionStatus,
@@ -38,3 +38,7 @@ class ShuupPagSeguroAppConfig(AppConfig):
             "shuup_pagseguro.notify_events:PagSeguroPaymentStatusChanged",
         ]
     }
+
+    def ready(self):
+        super(ShuupPagSeguroAppConfig, self).ready()
+        import shuup_pagseguro.signal_handlers  # noqa (F401)
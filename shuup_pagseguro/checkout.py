@@ -19,7 +19,8 @@ from shuup_pagseguro.constants import (
     PagSeguroBank, PagSeguroDebitBankMap, PagSeguroPaymentMethodIdentifier
 )
 from shuup_pagseguro.models import PagSeguroPaymentProcessor
-from shuup_pagseguro.pagseguro import PagSeguro
+from shuup_pagseguro.registry import get_pagseguro_config
+from shuup_pagseguro.session_pool import get_session_id
 
 logger = logging.getLogger(__name__)
 
@@ -31,15 +32,20 @@ class PagSeguroCheckoutPhase(CheckoutPhaseViewMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super(PagSeguroCheckoutPhase, self).get_context_data(**kwargs)
-        context['ps_session_id'] = PagSeguro.create_from_config(self.request.shop.pagseguro_config).get_session_id()
+        context['ps_session_id'] = get_session_id(self.request.shop, self.storage)
         context['next_phase'] = self.next_phase
         context['payment_method'] = self.request.basket.payment_method
-        context['pagseguro_config'] = self.request.shop.pagseguro_config
+        context['pagseguro_config'] = get_pagseguro_config(self.request.shop)
         context['current_bank_option'] = self.storage.get("bank_option")
         return context
 
     def post(self, request, *args, **kwargs):
+        # mantém o ID de sessão já entregue a este checkout
+        ps_session = self.storage.get("ps_session")
         self.storage.reset()
+        if ps_session:
+            self.storage.set("ps_session", ps_session)
+
         payment_method = request.POST.get('paymentMethod')
 
         # check for payment method
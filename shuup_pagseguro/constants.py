@@ -117,3 +117,28 @@ PagSeguroDebitBankMap = {
     "306": PagSeguroBank.Banrisul,
     "307": PagSeguroBank.HSBC
 }
+
+
+class PagSeguroNotificationStatus(Enum):
+    """
+    Estado do processamento de uma notificação recebida do PagSeguro
+    """
+    Pending = 1
+    Processing = 2
+    Done = 3
+    Failed = 4
+
+    class Labels:
+        Pending = _("Pending")
+        Processing = _("Processing")
+        Done = _("Done")
+        Failed = _("Failed")
+
+
+# estados a partir dos quais uma transação raramente sofre alterações
+PagSeguroFinalTransactionStatuses = (
+    PagSeguroTransactionStatus.Available,
+    PagSeguroTransactionStatus.Refunded,
+    PagSeguroTransactionStatus.Canceled,
+    PagSeguroTransactionStatus.Debited,
+)
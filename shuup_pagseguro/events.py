@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from datetime import timedelta
+from functools import partial
+import logging
+import traceback
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils.timezone import now
+
+from shuup_pagseguro.constants import PagSeguroNotificationStatus, PagSeguroTransactionStatus
+from shuup_pagseguro.models import PagSeguroQueuedEvent
+from shuup_pagseguro.notify_events import PagSeguroPaymentStatusChanged
+from shuup_pagseguro.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+def send_status_changed_event(order, old_status, new_status):
+    """
+    Dispara o evento de mudança de estado para uso no Shuup Notify
+    :type order: shuup.core.models.Order
+    :type old_status: int
+    :type new_status: int
+    """
+    PagSeguroPaymentStatusChanged(
+        order=order,
+        customer_email=order.email,
+        customer_phone=order.phone,
+        language=order.language,
+        new_status=PagSeguroTransactionStatus(new_status),
+        old_status=PagSeguroTransactionStatus(old_status)
+    ).run()
+
+
+def _send_committed_event(order, old_status, new_status):
+    try:
+        send_status_changed_event(order, old_status, new_status)
+    except Exception:
+        logger.exception("PagSeguro event exception")
+
+
+def queue_status_changed_event(order, old_status, new_status):
+    """
+    Enfileira o evento de mudança de estado do pedido
+
+    Com `PAGSEGURO_DEFER_EVENTS` desativado, o evento é enviado assim que a
+    transação atual for confirmada (`transaction.on_commit`): os scripts do
+    Shuup Notify não são executados com os pagamentos e pedidos bloqueados
+    e apenas mudanças efetivamente gravadas geram eventos.
+
+    Caso contrário, se o pedido já possui um evento aguardando o envio, a
+    mudança é agrupada a ele: o evento mantém o estado anterior original e
+    passa a ter o novo estado mais recente. Deve ser chamado com o pedido
+    bloqueado (ver `StatusChangeProcessor`), para que mudanças
+    simultâneas do mesmo pedido não criem eventos separados.
+
+    :type order: shuup.core.models.Order
+    """
+    if not get_setting("PAGSEGURO_DEFER_EVENTS"):
+        transaction.on_commit(partial(_send_committed_event, order, old_status, new_status))
+        return
+
+    coalesced = PagSeguroQueuedEvent.objects.filter(
+        order_id=order.pk, status=PagSeguroNotificationStatus.Pending
+    ).update(new_status=new_status, coalesced=F("coalesced") + 1)
+
+    if not coalesced:
+        PagSeguroQueuedEvent.objects.create(
+            order_id=order.pk,
+            old_status=old_status,
+            new_status=new_status,
+            dispatch_after=now() + timedelta(seconds=get_setting("PAGSEGURO_EVENT_COALESCE_WINDOW"))
+        )
+
+
+def claim_events(limit):
+    """
+    Reserva até `limit` eventos prontos para envio (ver `claim_notifications`)
+    :rtype: list[int]
+    """
+    current_time = now()
+    lease_until = current_time + timedelta(seconds=get_setting("PAGSEGURO_NOTIFICATION_LEASE"))
+    candidates = PagSeguroQueuedEvent.objects.filter(
+        Q(status=PagSeguroNotificationStatus.Pending) | Q(status=PagSeguroNotificationStatus.Processing),
+        dispatch_after__lte=current_time
+    ).order_by("dispatch_after").values_list("pk", "dispatch_after")[:limit]
+
+    claimed = []
+    for pk, dispatch_after in candidates:
+        updated = PagSeguroQueuedEvent.objects.filter(pk=pk, dispatch_after=dispatch_after).update(
+            status=PagSeguroNotificationStatus.Processing,
+            dispatch_after=lease_until
+        )
+        if updated:
+            claimed.append(pk)
+
+    return claimed
+
+
+def dispatch_event(event_id):
+    """
+    Envia um evento previamente reservado
+    :rtype: str
+    :return: "delivered", "skipped" (o pedido voltou ao estado original) ou "failed"
+    """
+    # carregado após a reserva: inclui as mudanças agrupadas até então
+    event = PagSeguroQueuedEvent.objects.select_related("order").get(pk=event_id)
+    event.attempts += 1
+
+    try:
+        if event.old_status != event.new_status:
+            send_status_changed_event(event.order, event.old_status, event.new_status)
+
+    except Exception:
+        logger.exception("PagSeguro event dispatch exception")
+        event.last_error = traceback.format_exc()
+
+        if event.attempts >= get_setting("PAGSEGURO_NOTIFICATION_MAX_ATTEMPTS"):
+            event.status = PagSeguroNotificationStatus.Failed
+        else:
+            delay = get_setting("PAGSEGURO_NOTIFICATION_RETRY_DELAY") * (2 ** (event.attempts - 1))
+            event.status = PagSeguroNotificationStatus.Pending
+            event.dispatch_after = now() + timedelta(seconds=delay)
+
+        event.save(update_fields=("attempts", "status", "dispatch_after", "last_error"))
+        return "failed"
+
+    event.status = PagSeguroNotificationStatus.Done
+    event.dispatched_on = now()
+    event.last_error = ""
+    event.save(update_fields=("attempts", "status", "dispatched_on", "last_error"))
+    return ("delivered" if event.old_status != event.new_status else "skipped")
+
+
+def dispatch_pending_events(batch_size=100):
+    """
+    Envia um lote de eventos cujo intervalo de agrupamento terminou
+    :rtype: dict
+    :return: quantidade de eventos enviados, descartados e com falha
+    """
+    stats = {"delivered": 0, "skipped": 0, "failed": 0}
+
+    for event_id in claim_events(batch_size):
+        stats[dispatch_event(event_id)] += 1
+
+    return stats
+
+
+def get_event_stats():
+    """
+    Contadores dos eventos de mudança de estado
+
+    - queued: eventos aguardando o envio
+    - coalesced: mudanças agrupadas a um evento já existente
+    - delivered: eventos enviados ao Shuup Notify
+    - failed: eventos descartados após esgotar as tentativas
+
+    :rtype: dict
+    """
+    queryset = PagSeguroQueuedEvent.objects.all()
+    delivered = queryset.filter(status=PagSeguroNotificationStatus.Done).exclude(old_status=F("new_status"))
+
+    return {
+        "queued": queryset.filter(status__in=(PagSeguroNotificationStatus.Pending,
+                                              PagSeguroNotificationStatus.Processing)).count(),
+        "coalesced": (queryset.aggregate(total=Sum("coalesced"))["total"] or 0),
+        "delivered": delivered.count(),
+        "failed": queryset.filter(status=PagSeguroNotificationStatus.Failed).count(),
+    }
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
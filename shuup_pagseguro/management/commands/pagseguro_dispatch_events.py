@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from shuup_pagseguro.events import dispatch_pending_events, get_event_stats
+
+
+class Command(BaseCommand):
+    help = "Send the queued PagSeguro status change events to Shuup Notify"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100,
+                            help="Number of events claimed at once")
+        parser.add_argument("--loop", action="store_true", default=False,
+                            help="Keep sending events until interrupted")
+        parser.add_argument("--sleep", type=float, default=5,
+                            help="Seconds to wait when no event is due (with --loop)")
+        parser.add_argument("--stats", action="store_true", default=False,
+                            help="Only show the counts of queued, coalesced, delivered and failed events")
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.stdout.write("Queued: {queued}, coalesced: {coalesced}, delivered: {delivered}, "
+                              "failed: {failed}".format(**get_event_stats()))
+            return
+
+        while True:
+            stats = dispatch_pending_events(batch_size=options["batch_size"])
+            dispatched = sum(stats.values())
+            if dispatched:
+                self.stdout.write("Delivered: {delivered}, skipped: {skipped}, failed: {failed}".format(**stats))
+
+            if not options["loop"]:
+                break
+
+            if not dispatched:
+                time.sleep(options["sleep"])
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from shuup_pagseguro.notifications import process_pending_notifications
+
+
+class Command(BaseCommand):
+    help = "Process the PagSeguro notifications waiting in the inbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4,
+                            help="Number of notifications processed in parallel")
+        parser.add_argument("--batch-size", type=int, default=100,
+                            help="Number of notifications claimed at once")
+        parser.add_argument("--loop", action="store_true", default=False,
+                            help="Keep draining the inbox until interrupted")
+        parser.add_argument("--sleep", type=float, default=5,
+                            help="Seconds to wait when the inbox is empty (with --loop)")
+
+    def handle(self, *args, **options):
+        while True:
+            stats = process_pending_notifications(concurrency=options["concurrency"],
+                                                  batch_size=options["batch_size"])
+            if stats["processed"] or stats["failed"]:
+                self.stdout.write("Processed: {processed}, failed: {failed}".format(**stats))
+
+            if not options["loop"]:
+                break
+
+            if not (stats["processed"] or stats["failed"]):
+                time.sleep(options["sleep"])
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import make_aware, now
+
+from shuup.core.models import Shop
+from shuup_pagseguro.reconciliation import Reconciler
+from shuup_pagseguro.refresh import parse_age
+
+
+def parse_date(value):
+    date = parse_datetime(value) or parse_datetime("{0}T00:00".format(value))
+    if date is None:
+        raise ValueError("Invalid date: {0}".format(value))
+    return (make_aware(date) if date.tzinfo is None else date)
+
+
+class Command(BaseCommand):
+    help = "Compare local PagSeguro payments with the transactions in PagSeguro"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shop", type=int, required=True, help="Shop ID")
+        parser.add_argument("--since", type=parse_date, help="Start date (default: 1 day ago)")
+        parser.add_argument("--until", type=parse_date, help="End date (default: now)")
+        parser.add_argument("--window", type=parse_age, default=parse_age("1d"),
+                            help="Size of each reconciled window (e.g. 6h, 1d)")
+        parser.add_argument("--resume", action="store_true", default=False,
+                            help="Start from the last reconciled window")
+        parser.add_argument("--fix", action="store_true", default=False,
+                            help="Fix the drifts found instead of only reporting them")
+
+    def handle(self, *args, **options):
+        shop = Shop.objects.filter(pk=options["shop"]).first()
+        if not shop:
+            raise CommandError("Shop {0} not found".format(options["shop"]))
+
+        until = options["until"] or now()
+        since = options["since"] or (until - parse_age("1d"))
+        reconciler = Reconciler(shop, fix=options["fix"], window=options["window"])
+        counter = Counter()
+
+        for drift in reconciler.reconcile(since, until, resume=options["resume"]):
+            counter[drift.kind] += 1
+            if drift.fixed:
+                counter["fixed"] += 1
+            self.stdout.write("{0}".format(drift))
+
+        self.stdout.write("Drifts: {0}".format(dict(counter) or 0))
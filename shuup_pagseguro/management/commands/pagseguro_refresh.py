@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from shuup_pagseguro.refresh import get_stale_payments, parse_age, refresh_payments
+from shuup_pagseguro.scheduler import get_due_payments
+
+
+class Command(BaseCommand):
+    help = "Refresh PagSeguro payments which are not in a final status"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--due", action="store_true", default=False,
+                            help="Refresh the payments whose scheduled check is due, "
+                                 "instead of every stale payment")
+        parser.add_argument("--shop", type=int, help="Only refresh payments of this shop ID")
+        parser.add_argument("--older-than", type=parse_age, default=parse_age("30m"),
+                            help="Only refresh payments not updated for this long (e.g. 30m, 6h, 2d)")
+        parser.add_argument("--status", type=int, action="append", dest="statuses",
+                            help="Only refresh payments with this status (may be repeated)")
+        parser.add_argument("--limit", type=int, help="Maximum number of payments to refresh")
+        parser.add_argument("--concurrency", type=int, default=8,
+                            help="Number of concurrent requests to PagSeguro")
+        parser.add_argument("--batch-size", type=int, default=100,
+                            help="Number of payments written per transaction")
+        parser.add_argument("--dry-run", action="store_true", default=False,
+                            help="Only count the payments which would be refreshed")
+
+    def handle(self, *args, **options):
+        if options["due"]:
+            queryset = get_due_payments(shop=options["shop"])
+        else:
+            queryset = get_stale_payments(shop=options["shop"],
+                                          older_than=options["older_than"],
+                                          statuses=options["statuses"]).order_by("pk")
+
+        if options["limit"]:
+            pks = list(queryset.values_list("pk", flat=True)[:options["limit"]])
+            queryset = queryset.model.objects.filter(pk__in=pks)
+
+        stats = refresh_payments(queryset,
+                                 concurrency=options["concurrency"],
+                                 batch_size=options["batch_size"],
+                                 dry_run=options["dry_run"])
+
+        if options["dry_run"]:
+            self.stdout.write("Dry run: {0} payments would be refreshed".format(stats.selected))
+        else:
+            self.stdout.write("{0}".format(stats))
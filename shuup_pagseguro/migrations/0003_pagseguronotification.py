@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import enumfields.fields
+
+import shuup_pagseguro.constants
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup', '0010_update_managers'),
+        ('shuup_pagseguro', '0002_larger_payment_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PagSeguroNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=64, verbose_name='notification code')),
+                ('notification_type', models.CharField(blank=True, max_length=32, verbose_name='notification type')),
+                ('status', enumfields.fields.EnumIntegerField(db_index=True, default=1, enum=shuup_pagseguro.constants.PagSeguroNotificationStatus, verbose_name='status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('next_attempt', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='next attempt')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='created on')),
+                ('processed_on', models.DateTimeField(blank=True, null=True, verbose_name='processed on')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shuup.Shop', verbose_name='shop')),
+            ],
+            options={
+                'verbose_name_plural': 'PagSeguro notifications',
+                'verbose_name': 'PagSeguro notification',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicated_notifications(apps, schema_editor):
+    PagSeguroNotification = apps.get_model("shuup_pagseguro", "PagSeguroNotification")
+    duplicated = (PagSeguroNotification.objects.values("code")
+                  .annotate(count=Count("id"), first_id=Min("id"))
+                  .filter(count__gt=1))
+
+    for row in duplicated:
+        PagSeguroNotification.objects.filter(code=row["code"]).exclude(pk=row["first_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_pagseguro', '0003_pagseguronotification'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicated_notifications, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pagseguronotification',
+            name='code',
+            field=models.CharField(max_length=64, unique=True, verbose_name='notification code'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicated_payments(apps, schema_editor):
+    """
+    Remove os pagamentos repetidos de um mesmo pedido, mantendo o mais
+    recente, antes de tornar o código da transação único
+
+    Uma transação pertence a um único pedido: códigos repetidos em pedidos
+    diferentes precisam ser corrigidos manualmente.
+    """
+    PagSeguroPayment = apps.get_model("shuup_pagseguro", "PagSeguroPayment")
+    duplicated = (PagSeguroPayment.objects.values("code")
+                  .annotate(count=Count("id"))
+                  .filter(count__gt=1))
+    conflicts = []
+
+    for row in duplicated:
+        payments = PagSeguroPayment.objects.filter(code=row["code"])
+        order_ids = set(payments.values_list("order_id", flat=True))
+        if len(order_ids) > 1:
+            conflicts.append("{0} (orders {1})".format(row["code"], ", ".join(str(pk) for pk in sorted(order_ids))))
+            continue
+
+        last_id = payments.aggregate(last_id=Max("id"))["last_id"]
+        payments.exclude(pk=last_id).delete()
+
+    if conflicts:
+        raise RuntimeError(
+            "Cannot make the PagSeguro payment code unique: the following transaction codes belong to more "
+            "than one order. Remove the wrong PagSeguroPayment rows and run the migration again: "
+            "{0}".format("; ".join(conflicts))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_pagseguro', '0004_unique_notification_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicated_payments, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pagseguropayment',
+            name='code',
+            field=models.CharField(max_length=40, unique=True, verbose_name='code'),
+        ),
+        migrations.AddField(
+            model_name='pagseguropayment',
+            name='status',
+            field=models.PositiveSmallIntegerField(blank=True, choices=[(1, 'Aguardando pagamento'), (2, 'Em análise'), (3, 'Paga'), (4, 'Disponível'), (5, 'Em disputa'), (6, 'Devolvido'), (7, 'Cancelada'), (8, 'Debitada'), (9, 'Retenção temporária')], db_index=True, null=True, verbose_name='status'),
+        ),
+        migrations.AddField(
+            model_name='pagseguropayment',
+            name='reference',
+            field=models.CharField(blank=True, db_index=True, max_length=200, verbose_name='reference'),
+        ),
+        migrations.AddField(
+            model_name='pagseguropayment',
+            name='last_event_date',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='last event date'),
+        ),
+        migrations.AddField(
+            model_name='pagseguropayment',
+            name='payment_method_code',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True, verbose_name='payment method code'),
+        ),
+        migrations.AddField(
+            model_name='pagseguropayment',
+            name='gross_amount',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=12, null=True, verbose_name='gross amount'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.db import migrations, transaction
+import iso8601
+
+BATCH_SIZE = 500
+
+
+def extract_transaction_fields(data):
+    # cópia de `shuup_pagseguro.utils.extract_transaction_fields` com as
+    # colunas existentes nesta migração
+    transaction_data = (data or {}).get("transaction") or {}
+    payment_method = transaction_data.get("paymentMethod") or {}
+
+    status = transaction_data.get("status")
+    last_event_date = transaction_data.get("lastEventDate")
+    payment_method_code = payment_method.get("code")
+    gross_amount = transaction_data.get("grossAmount")
+
+    return {
+        "status": (int(status) if status else None),
+        "reference": (transaction_data.get("reference") or ""),
+        "last_event_date": (iso8601.parse_date(last_event_date) if last_event_date else None),
+        "payment_method_code": (int(payment_method_code) if payment_method_code else None),
+        "gross_amount": (Decimal(gross_amount) if gross_amount else None),
+    }
+
+
+def backfill_lookup_columns(apps, schema_editor):
+    PagSeguroPayment = apps.get_model("shuup_pagseguro", "PagSeguroPayment")
+    last_pk = 0
+
+    while True:
+        batch = list(PagSeguroPayment.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", "data")[:BATCH_SIZE])
+        if not batch:
+            break
+
+        with transaction.atomic():
+            for pk, data in batch:
+                PagSeguroPayment.objects.filter(pk=pk).update(**extract_transaction_fields(data))
+
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('shuup_pagseguro', '0005_payment_lookup_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_lookup_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.utils.timezone import now
+
+FINAL_STATUSES = (4, 6, 7, 8)
+
+
+def schedule_pending_payments(apps, schema_editor):
+    # transações não finalizadas são consultadas na próxima execução do agendador
+    PagSeguroPayment = apps.get_model("shuup_pagseguro", "PagSeguroPayment")
+    PagSeguroPayment.objects.exclude(status__in=FINAL_STATUSES).update(next_check=now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_pagseguro', '0006_backfill_payment_lookup_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagseguropayment',
+            name='next_check',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='next check'),
+        ),
+        migrations.AddField(
+            model_name='pagseguropayment',
+            name='check_interval',
+            field=models.PositiveIntegerField(default=0, verbose_name='check interval'),
+        ),
+        migrations.RunPython(schedule_pending_payments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup', '0010_update_managers'),
+        ('shuup_pagseguro', '0007_payment_check_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PagSeguroReconciliationCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_end', models.DateTimeField(verbose_name='window end')),
+                ('last_update', models.DateTimeField(auto_now=True, verbose_name='last update')),
+                ('shop', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pagseguro_reconciliation_checkpoint', to='shuup.Shop', verbose_name='shop')),
+            ],
+            options={
+                'verbose_name_plural': 'PagSeguro reconciliation checkpoints',
+                'verbose_name': 'PagSeguro reconciliation checkpoint',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_pagseguro', '0008_pagseguroreconciliationcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagseguroconfig',
+            name='connect_timeout',
+            field=models.FloatField(blank=True, help_text='Seconds to wait for a connection to PagSeguro. Leave empty to use the default of each endpoint.', null=True, verbose_name='connect timeout'),
+        ),
+        migrations.AddField(
+            model_name='pagseguroconfig',
+            name='read_timeout',
+            field=models.FloatField(blank=True, help_text='Seconds to wait for a PagSeguro response. Leave empty to use the default of each endpoint.', null=True, verbose_name='read timeout'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_pagseguro', '0009_config_timeouts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PagSeguroRateLimitBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='key')),
+                ('tokens', models.FloatField(verbose_name='tokens')),
+                ('updated_at', models.FloatField(verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name_plural': 'PagSeguro rate limit buckets',
+                'verbose_name': 'PagSeguro rate limit bucket',
+            },
+        ),
+    ]
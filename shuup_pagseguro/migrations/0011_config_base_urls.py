@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_pagseguro', '0010_pagseguroratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagseguroconfig',
+            name='base_urls',
+            field=jsonfield.fields.JSONField(blank=True, help_text='Base URL of each PagSeguro endpoint family, e.g. {"default": "http://localhost:8999"}. Families: checkout, session, transaction, notification and search. Leave empty to use the official URLs.', null=True, verbose_name='API base URLs'),
+        ),
+    ]
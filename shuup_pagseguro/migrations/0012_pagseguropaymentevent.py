@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+STATUS_CHOICES = [(1, 'Aguardando pagamento'), (2, 'Em análise'), (3, 'Paga'), (4, 'Disponível'), (5, 'Em disputa'), (6, 'Devolvido'), (7, 'Cancelada'), (8, 'Debitada'), (9, 'Retenção temporária')]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_pagseguro', '0011_config_base_urls'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagseguropayment',
+            name='fee_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='fee amount'),
+        ),
+        migrations.AddField(
+            model_name='pagseguropayment',
+            name='net_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='net amount'),
+        ),
+        migrations.CreateModel(
+            name='PagSeguroPaymentEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_status', models.PositiveSmallIntegerField(blank=True, choices=STATUS_CHOICES, null=True, verbose_name='old status')),
+                ('new_status', models.PositiveSmallIntegerField(blank=True, choices=STATUS_CHOICES, db_index=True, null=True, verbose_name='new status')),
+                ('event_date', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='event date')),
+                ('fee_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='fee amount')),
+                ('net_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='net amount')),
+                ('notification_code', models.CharField(blank=True, db_index=True, max_length=64, verbose_name='notification code')),
+                ('created_on', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created on')),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='shuup_pagseguro.PagSeguroPayment', verbose_name='payment')),
+            ],
+            options={
+                'ordering': ('pk',),
+                'verbose_name_plural': 'PagSeguro payment events',
+                'verbose_name': 'PagSeguro payment event',
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.db import migrations, transaction
+import iso8601
+
+BATCH_SIZE = 500
+
+
+def extract_event_fields(data):
+    # cópia dos campos de `shuup_pagseguro.utils.extract_transaction_fields`
+    # usados nesta migração
+    transaction_data = (data or {}).get("transaction") or {}
+    status = transaction_data.get("status")
+    last_event_date = transaction_data.get("lastEventDate")
+    fee_amount = transaction_data.get("feeAmount")
+    net_amount = transaction_data.get("netAmount")
+
+    return {
+        "status": (int(status) if status else None),
+        "last_event_date": (iso8601.parse_date(last_event_date) if last_event_date else None),
+        "fee_amount": (Decimal(fee_amount) if fee_amount else None),
+        "net_amount": (Decimal(net_amount) if net_amount else None),
+    }
+
+
+def backfill_payment_events(apps, schema_editor):
+    """
+    Preenche as colunas de taxas e inicia o histórico de cada pagamento
+    existente com o seu estado atual
+    """
+    PagSeguroPayment = apps.get_model("shuup_pagseguro", "PagSeguroPayment")
+    PagSeguroPaymentEvent = apps.get_model("shuup_pagseguro", "PagSeguroPaymentEvent")
+    last_pk = 0
+
+    while True:
+        batch = list(PagSeguroPayment.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", "data")[:BATCH_SIZE])
+        if not batch:
+            break
+
+        with transaction.atomic():
+            events = []
+            for pk, data in batch:
+                fields = extract_event_fields(data)
+                PagSeguroPayment.objects.filter(pk=pk).update(fee_amount=fields["fee_amount"],
+                                                              net_amount=fields["net_amount"])
+                events.append(PagSeguroPaymentEvent(
+                    payment_id=pk,
+                    new_status=fields["status"],
+                    event_date=fields["last_event_date"],
+                    fee_amount=fields["fee_amount"],
+                    net_amount=fields["net_amount"]
+                ))
+            PagSeguroPaymentEvent.objects.bulk_create(events)
+
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('shuup_pagseguro', '0012_pagseguropaymentevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_payment_events, migrations.RunPython.noop),
+    ]
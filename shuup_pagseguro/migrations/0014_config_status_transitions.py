@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup_pagseguro', '0013_backfill_payment_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagseguroconfig',
+            name='status_transitions',
+            field=jsonfield.fields.JSONField(blank=True, help_text='Order actions applied on each transaction status change, as [old status, new status, [actions]] rules ("*" matches any status), e.g. [["*", 7, ["cancel"]], ["*", 3, ["pay"]]]. Actions: cancel and pay. Leave empty to use the default rules.', null=True, verbose_name='status transitions'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import enumfields.fields
+
+import shuup_pagseguro.constants
+
+
+STATUS_CHOICES = [(1, 'Aguardando pagamento'), (2, 'Em análise'), (3, 'Paga'), (4, 'Disponível'), (5, 'Em disputa'), (6, 'Devolvido'), (7, 'Cancelada'), (8, 'Debitada'), (9, 'Retenção temporária')]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuup', '0010_update_managers'),
+        ('shuup_pagseguro', '0014_config_status_transitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PagSeguroQueuedEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_status', models.PositiveSmallIntegerField(choices=STATUS_CHOICES, verbose_name='old status')),
+                ('new_status', models.PositiveSmallIntegerField(choices=STATUS_CHOICES, verbose_name='new status')),
+                ('coalesced', models.PositiveIntegerField(default=0, verbose_name='coalesced events')),
+                ('status', enumfields.fields.EnumIntegerField(db_index=True, default=1, enum=shuup_pagseguro.constants.PagSeguroNotificationStatus, verbose_name='status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('dispatch_after', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='dispatch after')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='created on')),
+                ('dispatched_on', models.DateTimeField(blank=True, null=True, verbose_name='dispatched on')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shuup.Order', verbose_name='order')),
+            ],
+            options={
+                'verbose_name_plural': 'PagSeguro queued events',
+                'verbose_name': 'PagSeguro queued event',
+            },
+        ),
+    ]
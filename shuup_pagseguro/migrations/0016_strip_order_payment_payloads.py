@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 500
+
+
+def strip_order_payment_payloads(apps, schema_editor):
+    """
+    Remove dos pedidos a cópia dos dados da transação (`_data`), que
+    também está guardada em PagSeguroPayment.data
+    """
+    Order = apps.get_model("shuup", "Order")
+    last_pk = 0
+
+    while True:
+        batch = list(
+            Order.objects.filter(pk__gt=last_pk, pagseguropayment__isnull=False)
+            .distinct().order_by("pk").values_list("pk", "payment_data")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        with transaction.atomic():
+            for pk, payment_data in batch:
+                pagseguro_data = (payment_data or {}).get("pagseguro")
+                if isinstance(pagseguro_data, dict) and "_data" in pagseguro_data:
+                    del pagseguro_data["_data"]
+                    Order.objects.filter(pk=pk).update(payment_data=payment_data)
+
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('shuup_pagseguro', '0015_pagseguroqueuedevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(strip_order_payment_payloads, migrations.RunPython.noop),
+    ]
@@ -10,18 +10,28 @@ from __future__ import unicode_literals
 
 import logging
 
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.shortcuts import redirect
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
+from enumfields import EnumIntegerField
 from jsonfield.fields import JSONField
+import six
 
 from shuup.core.models._orders import Order
 from shuup.core.models._service_base import ServiceChoice
 from shuup.core.models._service_payment import PaymentProcessor
 from shuup.core.models._shops import Shop
-from shuup_pagseguro.constants import PagSeguroPaymentMethod
-from shuup_pagseguro.pagseguro import PagSeguro
+from shuup_pagseguro.constants import (
+    PagSeguroNotificationStatus, PagSeguroPaymentMethod, PagSeguroTransactionStatus
+)
+from shuup_pagseguro.pagseguro import deadline, PagSeguroDeadlineExceeded, PagSeguroUnavailable
+from shuup_pagseguro.registry import get_pagseguro
+from shuup_pagseguro.scheduler import FINAL_STATUSES, SCHEDULE_FIELDS, schedule_next_check
+from shuup_pagseguro.settings import get_setting
+from shuup_pagseguro.utils import extract_transaction_fields, TRANSACTION_FIELDS
 from six.moves import urllib
 
 logger = logging.getLogger(__name__)
@@ -49,10 +59,11 @@ class PagSeguroPaymentProcessor(PaymentProcessor):
         :rtype: django.http.HttpResponse|None
         """
 
-        pagseguro = PagSeguro.create_from_config(order.shop.pagseguro_config)
+        pagseguro = get_pagseguro(order.shop_id)
 
         try:
-            result = pagseguro.pay(service, order)
+            with deadline(get_setting("PAGSEGURO_DEADLINES")["payment"]):
+                result = pagseguro.pay(service, order)
 
             if result.error:
                 logger.error("PagSeguro Payment Request Errors: {0}", result.errors)
@@ -60,19 +71,28 @@ class PagSeguroPaymentProcessor(PaymentProcessor):
                 return redirect(urls.cancel_url)
 
             else:
-                payment, __ = PagSeguroPayment.objects.get_or_create(order=order, code=result.code)
+                payment, created = PagSeguroPayment.objects.get_or_create(order=order, code=result.code)
                 payment.data = result._data
                 payment.save()
+                if created:
+                    payment.add_event(None)
 
-                # salva os dados adicionais da transação do pagseguro
+                # guarda no pedido apenas a referência da transação: os dados
+                # completos ficam em PagSeguroPayment.data
                 order.payment_data["pagseguro"].update({
                     "payment_link": result.payment_link,
                     "code": result.code,
-                    "_data": result._data,
                 })
                 order.save()
                 return redirect(urls.return_url)
 
+        except (PagSeguroUnavailable, PagSeguroDeadlineExceeded):
+            logger.warning("PagSeguro is unavailable, payment request for order %s not sent", order.pk)
+            params = ("?" + urllib.parse.urlencode({
+                "problem": _("PagSeguro is temporarily unavailable, please try again in a few minutes")
+            }))
+            return redirect(urls.cancel_url + params)
+
         except:
             logger.exception("PagSeguro Payment Request Exception")
             params = ("?" + urllib.parse.urlencode({"problem": _("Internal error")}))
@@ -85,10 +105,29 @@ class PagSeguroPaymentProcessor(PaymentProcessor):
 @python_2_unicode_compatible
 class PagSeguroPayment(models.Model):
     order = models.ForeignKey(Order, verbose_name=_("order"))
-    code = models.CharField(verbose_name=_("code"), max_length=40)
+    code = models.CharField(verbose_name=_("code"), max_length=40, unique=True)
     last_update = models.DateTimeField(verbose_name=_("last update"), auto_now=True)
     data = JSONField(blank=True, null=True, verbose_name=_('pagseguro data'))
 
+    # colunas extraídas de `data` para consultas indexadas
+    status = models.PositiveSmallIntegerField(verbose_name=_("status"),
+                                              choices=PagSeguroTransactionStatus.choices(),
+                                              null=True, blank=True, db_index=True)
+    reference = models.CharField(verbose_name=_("reference"), max_length=200, blank=True, db_index=True)
+    last_event_date = models.DateTimeField(verbose_name=_("last event date"), null=True, blank=True, db_index=True)
+    payment_method_code = models.PositiveIntegerField(verbose_name=_("payment method code"),
+                                                      null=True, blank=True, db_index=True)
+    gross_amount = models.DecimalField(verbose_name=_("gross amount"), max_digits=12, decimal_places=2,
+                                       null=True, blank=True, db_index=True)
+    fee_amount = models.DecimalField(verbose_name=_("fee amount"), max_digits=12, decimal_places=2,
+                                     null=True, blank=True)
+    net_amount = models.DecimalField(verbose_name=_("net amount"), max_digits=12, decimal_places=2,
+                                     null=True, blank=True)
+
+    # agendamento da próxima consulta da transação (ver shuup_pagseguro.scheduler)
+    next_check = models.DateTimeField(verbose_name=_("next check"), null=True, blank=True, db_index=True)
+    check_interval = models.PositiveIntegerField(verbose_name=_("check interval"), default=0)
+
     class Meta:
         verbose_name = _('PagSeguro payments')
         verbose_name_plural = _('PagSeguro payments')
@@ -96,10 +135,110 @@ class PagSeguroPayment(models.Model):
     def __str__(self):
         return "PagSeguroPayment {0} for Order {1}".format(self.code, self.order)
 
+    def save(self, *args, **kwargs):
+        self.sync_from_data()
+
+        # agenda a primeira consulta de transações ainda não finalizadas
+        if self.next_check is None and self.status and self.status not in FINAL_STATUSES:
+            schedule_next_check(self, changed=True)
+
+        super(PagSeguroPayment, self).save(*args, **kwargs)
+
+    def sync_from_data(self):
+        """
+        Atualiza as colunas indexadas a partir de `data`
+        """
+        for field, value in extract_transaction_fields(self.data).items():
+            setattr(self, field, value)
+
+    def set_data(self, data):
+        """
+        Substitui os dados da transação e atualiza as colunas indexadas
+        :rtype: list[str]
+        :return: os campos alterados (vazio se o PagSeguro retornou os mesmos dados)
+        """
+        if data == self.data:
+            return []
+
+        old_values = dict((field, getattr(self, field)) for field in TRANSACTION_FIELDS)
+        self.data = data
+        self.sync_from_data()
+        return ["data"] + [field for field in TRANSACTION_FIELDS if getattr(self, field) != old_values[field]]
+
+    def save_changes(self, changed_fields):
+        """
+        Grava apenas os campos alterados, o agendamento da próxima consulta
+        e a data da última atualização, sem reescrever `data` quando os
+        dados da transação não mudaram
+        :type changed_fields: list[str]
+        """
+        if self.pk is None:
+            self.save()
+        else:
+            self.save(update_fields=list(changed_fields) + list(SCHEDULE_FIELDS) + ["last_update"])
+
+    def add_event(self, old_status, notification_code=""):
+        """
+        Registra no histórico a mudança para o estado atual do pagamento
+        :type old_status: int|None
+        :rtype: PagSeguroPaymentEvent
+        """
+        return PagSeguroPaymentEvent.objects.create(
+            payment=self,
+            old_status=old_status,
+            new_status=self.status,
+            event_date=self.last_event_date,
+            fee_amount=self.fee_amount,
+            net_amount=self.net_amount,
+            notification_code=notification_code or ""
+        )
+
     def refresh(self):
-        pagseguro = PagSeguro.create_from_config(self.order.shop.pagseguro_config)
-        self.data = pagseguro.get_transaction_info(self.code)
-        self.save()
+        from shuup_pagseguro.transitions import apply_status_changes, StatusChange
+
+        pagseguro = get_pagseguro(self.order.shop_id)
+        old_state = (self.status, self.last_event_date)
+        with deadline(get_setting("PAGSEGURO_DEADLINES")["refresh"]):
+            changed_fields = self.set_data(pagseguro.get_transaction_info(self.code))
+        schedule_next_check(self, changed=((self.status, self.last_event_date) != old_state))
+
+        with transaction.atomic():
+            self.save_changes(changed_fields)
+
+            if self.status != old_state[0]:
+                self.add_event(old_state[0])
+                if old_state[0] and self.status:
+                    apply_status_changes([StatusChange(self, old_state[0], self.status)])
+
+
+@python_2_unicode_compatible
+class PagSeguroPaymentEvent(models.Model):
+    """
+    Histórico (somente inclusão) das mudanças de estado de um pagamento
+    """
+    payment = models.ForeignKey(PagSeguroPayment, verbose_name=_("payment"), related_name="events")
+    old_status = models.PositiveSmallIntegerField(verbose_name=_("old status"),
+                                                  choices=PagSeguroTransactionStatus.choices(),
+                                                  null=True, blank=True)
+    new_status = models.PositiveSmallIntegerField(verbose_name=_("new status"),
+                                                  choices=PagSeguroTransactionStatus.choices(),
+                                                  null=True, blank=True, db_index=True)
+    event_date = models.DateTimeField(verbose_name=_("event date"), null=True, blank=True, db_index=True)
+    fee_amount = models.DecimalField(verbose_name=_("fee amount"), max_digits=12, decimal_places=2,
+                                     null=True, blank=True)
+    net_amount = models.DecimalField(verbose_name=_("net amount"), max_digits=12, decimal_places=2,
+                                     null=True, blank=True)
+    notification_code = models.CharField(verbose_name=_("notification code"), max_length=64,
+                                         blank=True, db_index=True)
+    created_on = models.DateTimeField(verbose_name=_("created on"), auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = _('PagSeguro payment event')
+        verbose_name_plural = _('PagSeguro payment events')
+        ordering = ("pk",)
+
+    def __str__(self):
+        return "PagSeguroPaymentEvent {0} -> {1} for {2}".format(self.old_status, self.new_status, self.payment_id)
 
 
 class PagSeguroConfig(models.Model):
@@ -112,9 +251,134 @@ class PagSeguroConfig(models.Model):
                                   default=False,
                                   help_text=_('Enable this to activate Developer mode (testing).'))
 
+    connect_timeout = models.FloatField(verbose_name=_("connect timeout"), null=True, blank=True,
+                                        help_text=_("Seconds to wait for a connection to PagSeguro. "
+                                                    "Leave empty to use the default of each endpoint."))
+    read_timeout = models.FloatField(verbose_name=_("read timeout"), null=True, blank=True,
+                                     help_text=_("Seconds to wait for a PagSeguro response. "
+                                                 "Leave empty to use the default of each endpoint."))
+    base_urls = JSONField(verbose_name=_("API base URLs"), null=True, blank=True,
+                          help_text=_('Base URL of each PagSeguro endpoint family, e.g. '
+                                      '{"default": "http://localhost:8999"}. Families: checkout, session, '
+                                      'transaction, notification and search. Leave empty to use the official URLs.'))
+    status_transitions = JSONField(verbose_name=_("status transitions"), null=True, blank=True,
+                                   help_text=_('Order actions applied on each transaction status change, as '
+                                               '[old status, new status, [actions]] rules ("*" matches any '
+                                               'status), e.g. [["*", 7, ["cancel"]], ["*", 3, ["pay"]]]. '
+                                               'Actions: cancel and pay. Leave empty to use the default rules.'))
+
     class Meta:
         verbose_name = _('PagSeguro configuration')
         verbose_name_plural = _('PagSeguro configurations')
 
+    def clean(self):
+        from shuup_pagseguro.transitions import validate_transition_rules
+
+        if self.status_transitions is not None:
+            try:
+                validate_transition_rules(self.status_transitions)
+            except (TypeError, ValueError) as exc:
+                raise ValidationError({"status_transitions": six.text_type(exc)})
+
     def __str__(self):  # pragma: no cover
         return _('PagSeguro Configuration for {0}').format(self.shop)
+
+
+@python_2_unicode_compatible
+class PagSeguroNotification(models.Model):
+    """
+    Caixa de entrada das notificações recebidas do PagSeguro
+
+    A view de notificação apenas registra o código recebido; o
+    processamento é feito pelo comando `pagseguro_process_notifications`.
+    """
+    shop = models.ForeignKey(Shop, verbose_name=_("shop"))
+    code = models.CharField(verbose_name=_("notification code"), max_length=64, unique=True)
+    notification_type = models.CharField(verbose_name=_("notification type"), max_length=32, blank=True)
+    status = EnumIntegerField(PagSeguroNotificationStatus,
+                              verbose_name=_("status"),
+                              default=PagSeguroNotificationStatus.Pending,
+                              db_index=True)
+    attempts = models.PositiveIntegerField(verbose_name=_("attempts"), default=0)
+    next_attempt = models.DateTimeField(verbose_name=_("next attempt"), default=now, db_index=True)
+    last_error = models.TextField(verbose_name=_("last error"), blank=True)
+    created_on = models.DateTimeField(verbose_name=_("created on"), auto_now_add=True)
+    processed_on = models.DateTimeField(verbose_name=_("processed on"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('PagSeguro notification')
+        verbose_name_plural = _('PagSeguro notifications')
+
+    def __str__(self):
+        return "PagSeguroNotification {0} ({1})".format(self.code, self.status)
+
+
+@python_2_unicode_compatible
+class PagSeguroQueuedEvent(models.Model):
+    """
+    Evento de mudança de estado de um pedido aguardando o envio ao
+    Shuup Notify pelo comando `pagseguro_dispatch_events`
+
+    Mudanças do mesmo pedido antes do envio são agrupadas no mesmo
+    registro, mantendo o primeiro estado anterior e o último novo estado.
+    """
+    order = models.ForeignKey(Order, verbose_name=_("order"))
+    old_status = models.PositiveSmallIntegerField(verbose_name=_("old status"),
+                                                  choices=PagSeguroTransactionStatus.choices())
+    new_status = models.PositiveSmallIntegerField(verbose_name=_("new status"),
+                                                  choices=PagSeguroTransactionStatus.choices())
+    coalesced = models.PositiveIntegerField(verbose_name=_("coalesced events"), default=0)
+    status = EnumIntegerField(PagSeguroNotificationStatus,
+                              verbose_name=_("status"),
+                              default=PagSeguroNotificationStatus.Pending,
+                              db_index=True)
+    attempts = models.PositiveIntegerField(verbose_name=_("attempts"), default=0)
+    dispatch_after = models.DateTimeField(verbose_name=_("dispatch after"), default=now, db_index=True)
+    last_error = models.TextField(verbose_name=_("last error"), blank=True)
+    created_on = models.DateTimeField(verbose_name=_("created on"), auto_now_add=True)
+    dispatched_on = models.DateTimeField(verbose_name=_("dispatched on"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('PagSeguro queued event')
+        verbose_name_plural = _('PagSeguro queued events')
+
+    def __str__(self):
+        return "PagSeguroQueuedEvent {0} -> {1} for Order {2} ({3})".format(
+            self.old_status, self.new_status, self.order_id, self.status
+        )
+
+
+@python_2_unicode_compatible
+class PagSeguroReconciliationCheckpoint(models.Model):
+    """
+    Fim da última janela de tempo conciliada de cada loja, permitindo
+    retomar a conciliação de onde ela parou
+    """
+    shop = models.OneToOneField(Shop, verbose_name=_("shop"), related_name="pagseguro_reconciliation_checkpoint")
+    window_end = models.DateTimeField(verbose_name=_("window end"))
+    last_update = models.DateTimeField(verbose_name=_("last update"), auto_now=True)
+
+    class Meta:
+        verbose_name = _('PagSeguro reconciliation checkpoint')
+        verbose_name_plural = _('PagSeguro reconciliation checkpoints')
+
+    def __str__(self):
+        return "PagSeguroReconciliationCheckpoint {0} for Shop {1}".format(self.window_end, self.shop_id)
+
+
+@python_2_unicode_compatible
+class PagSeguroRateLimitBucket(models.Model):
+    """
+    Token bucket de uma conta do PagSeguro compartilhado entre os
+    processos (`PAGSEGURO_RATE_LIMIT_MODE = "database"`)
+    """
+    key = models.CharField(verbose_name=_("key"), max_length=255, unique=True)
+    tokens = models.FloatField(verbose_name=_("tokens"))
+    updated_at = models.FloatField(verbose_name=_("updated at"))
+
+    class Meta:
+        verbose_name = _('PagSeguro rate limit bucket')
+        verbose_name_plural = _('PagSeguro rate limit buckets')
+
+    def __str__(self):
+        return "PagSeguroRateLimitBucket {0} ({1:.2f} tokens)".format(self.key, self.tokens)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import traceback
+
+from django.db import connection, IntegrityError, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from shuup_pagseguro.constants import PagSeguroNotificationStatus
+from shuup_pagseguro.models import PagSeguroNotification, PagSeguroPayment
+from shuup_pagseguro.pagseguro import deadline, PagSeguroUnavailable
+from shuup_pagseguro.registry import get_pagseguro
+from shuup_pagseguro.scheduler import schedule_next_check
+from shuup_pagseguro.settings import get_setting
+from shuup_pagseguro.transitions import StatusChange, StatusChangeProcessor
+from shuup_pagseguro.utils import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# códigos de notificação já registrados por este processo
+_seen_notifications = LRUCache(get_setting("PAGSEGURO_NOTIFICATION_DEDUP_CACHE_SIZE"))
+
+
+def enqueue_notification(shop, notification_code, notification_type=""):
+    """
+    Registra uma notificação recebida para processamento posterior
+
+    O PagSeguro reenvia a mesma notificação quando não obtém resposta a
+    tempo. Notificações repetidas são descartadas primeiro pelo cache em
+    memória e depois pelo índice único do código no banco de dados.
+
+    :rtype: PagSeguroNotification|None
+    :return: a notificação registrada ou None caso seja repetida
+    """
+    if notification_code in _seen_notifications:
+        return None
+
+    notification = None
+
+    if not PagSeguroNotification.objects.filter(code=notification_code).exists():
+        try:
+            with transaction.atomic():
+                notification = PagSeguroNotification.objects.create(
+                    shop=shop,
+                    code=notification_code,
+                    notification_type=notification_type or ""
+                )
+        except IntegrityError:
+            # registrada simultaneamente por outro processo
+            pass
+
+    _seen_notifications.set(notification_code)
+    return notification
+
+
+class NotificationResult(object):
+    """
+    Resultado da consulta de uma notificação ao PagSeguro
+    """
+    __slots__ = ("notification", "transaction_info", "error", "error_details")
+
+    def __init__(self, notification, transaction_info=None, error=None, error_details=""):
+        self.notification = notification
+        self.transaction_info = transaction_info
+        self.error = error
+        self.error_details = error_details
+
+    def set_error(self, error):
+        self.error = error
+        self.error_details = traceback.format_exc()
+
+
+def fetch_notification(notification):
+    """
+    Obtém do PagSeguro as informações da transação notificada
+    :type notification: PagSeguroNotification
+    :rtype: NotificationResult
+    """
+    result = NotificationResult(notification)
+
+    try:
+        pagseguro = get_pagseguro(notification.shop_id)
+        with deadline(get_setting("PAGSEGURO_DEADLINES")["notification"]):
+            result.transaction_info = pagseguro.get_notification_info(notification.code)
+
+        # a transação mudou: consultas guardadas no cache estão desatualizadas
+        pagseguro.invalidate_transaction_cache(result.transaction_info["transaction"]["code"])
+    except Exception as exc:
+        if not isinstance(exc, PagSeguroUnavailable):
+            logger.exception("PagSeguro notification exception")
+        result.set_error(exc)
+
+    return result
+
+
+def _update_payment(payments, result, processor):
+    payment = payments.get(result.transaction_info["transaction"]["code"])
+    if payment is None:
+        raise PagSeguroPayment.DoesNotExist(
+            "PagSeguroPayment {0} does not exist".format(result.transaction_info["transaction"]["code"])
+        )
+
+    old_status = payment.status
+    changed_fields = payment.set_data(result.transaction_info)
+    schedule_next_check(payment, changed=True)
+    payment.save_changes(changed_fields)
+
+    # Alteração de estado!
+    if payment.status != old_status:
+        payment.add_event(old_status, result.notification.code)
+        if old_status and payment.status:
+            processor.apply(StatusChange(payment, old_status, payment.status))
+
+
+def save_notification_results(results):
+    """
+    Atualiza os pagamentos notificados e aplica as mudanças de estado em
+    uma única transação
+
+    Os pagamentos e, em seguida, os seus pedidos são bloqueados na ordem
+    da chave primária, de forma que workers simultâneos não entram em
+    deadlock nem aplicam duas vezes os efeitos de uma mesma mudança de
+    estado. Cada notificação é gravada em um savepoint próprio: a falha
+    de uma delas não desfaz as demais.
+
+    :type results: list[NotificationResult]
+    """
+    fetched = [result for result in results if result.error is None]
+    if not fetched:
+        return
+
+    processor = StatusChangeProcessor()
+
+    with transaction.atomic():
+        codes = set(result.transaction_info["transaction"]["code"] for result in fetched)
+        payments = dict(
+            (payment.code, payment)
+            for payment in PagSeguroPayment.objects.select_for_update().filter(code__in=codes).order_by("pk")
+        )
+        processor.lock_orders(list(payments.values()))
+
+        for result in fetched:
+            try:
+                with transaction.atomic():
+                    _update_payment(payments, result, processor)
+            except Exception as exc:
+                logger.exception("PagSeguro notification exception")
+                result.set_error(exc)
+
+
+def claim_notifications(limit):
+    """
+    Reserva até `limit` notificações prontas para processamento
+
+    A reserva é feita com um UPDATE condicional por registro, de forma que
+    vários workers (inclusive em máquinas diferentes) possam consumir a
+    caixa de entrada ao mesmo tempo sem processar a mesma notificação.
+    Notificações cuja reserva expirou voltam a ser elegíveis.
+
+    :rtype: list[int]
+    """
+    current_time = now()
+    lease_until = current_time + timedelta(seconds=get_setting("PAGSEGURO_NOTIFICATION_LEASE"))
+    candidates = PagSeguroNotification.objects.filter(
+        Q(status=PagSeguroNotificationStatus.Pending) | Q(status=PagSeguroNotificationStatus.Processing),
+        next_attempt__lte=current_time
+    ).order_by("next_attempt").values_list("pk", "next_attempt")[:limit]
+
+    claimed = []
+    for pk, next_attempt in candidates:
+        updated = PagSeguroNotification.objects.filter(pk=pk, next_attempt=next_attempt).update(
+            status=PagSeguroNotificationStatus.Processing,
+            next_attempt=lease_until
+        )
+        if updated:
+            claimed.append(pk)
+
+    return claimed
+
+
+def finish_notification(result):
+    """
+    Registra o resultado do processamento de uma notificação previamente
+    reservada, agendando uma nova tentativa (com espera exponencial) em
+    caso de falha
+    :type result: NotificationResult
+    :rtype: bool
+    :return: se a notificação foi processada com sucesso
+    """
+    notification = result.notification
+    notification.attempts += 1
+
+    if isinstance(result.error, PagSeguroUnavailable):
+        # o PagSeguro está fora do ar: aguarda sem consumir uma tentativa
+        notification.status = PagSeguroNotificationStatus.Pending
+        notification.next_attempt = now() + timedelta(seconds=(result.error.retry_after or 0) + 1)
+        notification.save(update_fields=("status", "next_attempt"))
+        return False
+
+    if result.error is not None:
+        notification.last_error = result.error_details
+
+        if notification.attempts >= get_setting("PAGSEGURO_NOTIFICATION_MAX_ATTEMPTS"):
+            notification.status = PagSeguroNotificationStatus.Failed
+        else:
+            delay = get_setting("PAGSEGURO_NOTIFICATION_RETRY_DELAY") * (2 ** (notification.attempts - 1))
+            notification.status = PagSeguroNotificationStatus.Pending
+            notification.next_attempt = now() + timedelta(seconds=delay)
+
+        notification.save(update_fields=("attempts", "status", "next_attempt", "last_error"))
+        return False
+
+    notification.status = PagSeguroNotificationStatus.Done
+    notification.processed_on = now()
+    notification.last_error = ""
+    notification.save(update_fields=("attempts", "status", "processed_on", "last_error"))
+    return True
+
+
+def _fetch_notification_in_thread(notification):
+    try:
+        return fetch_notification(notification)
+    finally:
+        # cada thread possui a sua conexão com o banco de dados
+        connection.close()
+
+
+def process_pending_notifications(concurrency=1, batch_size=100):
+    """
+    Processa um lote de notificações pendentes
+
+    As consultas ao PagSeguro são feitas em paralelo por até `concurrency`
+    threads; os resultados do lote são gravados pela thread atual em uma
+    única transação (ver `save_notification_results`).
+
+    :rtype: dict
+    :return: quantidade de notificações processadas com sucesso e com falha
+    """
+    stats = {"processed": 0, "failed": 0}
+    notifications = list(PagSeguroNotification.objects.filter(pk__in=claim_notifications(batch_size)).order_by("pk"))
+
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(_fetch_notification_in_thread, notifications))
+    else:
+        results = [fetch_notification(notification) for notification in notifications]
+
+    save_notification_results(results)
+
+    for result in results:
+        stats["processed" if finish_notification(result) else "failed"] += 1
+
+    return stats
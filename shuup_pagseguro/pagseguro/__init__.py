@@ -6,28 +6,66 @@
 #
 # This source code is licensed under the AGPLv3 license found in the
 # LICENSE file in the root directory of this source tree.
+from datetime import timedelta
 from decimal import Decimal
 import re
+import time
 
-from django.template.loader import get_template
+from django.utils import timezone
 import requests
+from six.moves.urllib.parse import urlparse
 import xmltodict
 
-from shuup_pagseguro.constants import PagSeguroPaymentMethod
+from shuup_pagseguro.pagseguro.coalescing import get_transaction_cache, SingleFlight
+from shuup_pagseguro.pagseguro.connection import get_connection_pool
+from shuup_pagseguro.pagseguro.deadline import deadline, get_remaining_time  # noqa (F401)
+from shuup_pagseguro.pagseguro.exceptions import (  # noqa (F401)
+    PagSeguroDeadlineExceeded, PagSeguroException, PagSeguroUnavailable
+)
+from shuup_pagseguro.pagseguro.parser import parse_session_id, parse_transaction
+from shuup_pagseguro.pagseguro.ratelimit import get_rate_limiter
+from shuup_pagseguro.pagseguro.resilience import get_circuit_breaker, RetryPolicy
+from shuup_pagseguro.pagseguro.serializer import serialize_payment
+from shuup_pagseguro.settings import get_setting
 
 phone_matcher = re.compile("\(?(\d{2})\)?\D*(\d+)\D*(\d*)")
 
-PAGSEGURO_WS_CHECKOUT_URL = "https://ws.pagseguro.uol.com.br/v2/transactions"
-PAGSEGURO_WS_CHECKOUT_URL_SANDBOX = "https://ws.sandbox.pagseguro.uol.com.br/v2/transactions"
+PAGSEGURO_WS_BASE_URL = "https://ws.pagseguro.uol.com.br"
+PAGSEGURO_WS_BASE_URL_SANDBOX = "https://ws.sandbox.pagseguro.uol.com.br"
 
-PAGSEGURO_WS_SESSION_URL = "https://ws.pagseguro.uol.com.br/v2/sessions"
-PAGSEGURO_WS_SESSION_URL_SANDBOX = "https://ws.sandbox.pagseguro.uol.com.br/v2/sessions"
+# caminho de cada família de endpoints, relativo à URL base
+PAGSEGURO_WS_PATHS = {
+    "checkout": "/v2/transactions",
+    "session": "/v2/sessions",
+    "transaction": "/v3/transactions/{0}",
+    "notification": "/v3/transactions/notifications/{0}",
+    "search": "/v2/transactions",
+}
 
-PAGSEGURO_WS_TRANSACTION_URL = "https://ws.pagseguro.uol.com.br/v3/transactions/{0}"
-PAGSEGURO_WS_TRANSACTION_URL_SANDBOX = "https://ws.sandbox.pagseguro.uol.com.br/v3/transactions/{0}"
+PAGSEGURO_WS_CHECKOUT_URL = PAGSEGURO_WS_BASE_URL + PAGSEGURO_WS_PATHS["checkout"]
+PAGSEGURO_WS_CHECKOUT_URL_SANDBOX = PAGSEGURO_WS_BASE_URL_SANDBOX + PAGSEGURO_WS_PATHS["checkout"]
 
-PAGSEGURO_WS_NOTIFICATION_URL = "https://ws.pagseguro.uol.com.br/v3/transactions/notifications/{0}"
-PAGSEGURO_WS_NOTIFICATION_URL_SANDBOX = "https://ws.sandbox.pagseguro.uol.com.br/v3/transactions/notifications/{0}"
+PAGSEGURO_WS_SESSION_URL = PAGSEGURO_WS_BASE_URL + PAGSEGURO_WS_PATHS["session"]
+PAGSEGURO_WS_SESSION_URL_SANDBOX = PAGSEGURO_WS_BASE_URL_SANDBOX + PAGSEGURO_WS_PATHS["session"]
+
+PAGSEGURO_WS_TRANSACTION_URL = PAGSEGURO_WS_BASE_URL + PAGSEGURO_WS_PATHS["transaction"]
+PAGSEGURO_WS_TRANSACTION_URL_SANDBOX = PAGSEGURO_WS_BASE_URL_SANDBOX + PAGSEGURO_WS_PATHS["transaction"]
+
+PAGSEGURO_WS_NOTIFICATION_URL = PAGSEGURO_WS_BASE_URL + PAGSEGURO_WS_PATHS["notification"]
+PAGSEGURO_WS_NOTIFICATION_URL_SANDBOX = PAGSEGURO_WS_BASE_URL_SANDBOX + PAGSEGURO_WS_PATHS["notification"]
+
+PAGSEGURO_WS_SEARCH_URL = PAGSEGURO_WS_BASE_URL + PAGSEGURO_WS_PATHS["search"]
+PAGSEGURO_WS_SEARCH_URL_SANDBOX = PAGSEGURO_WS_BASE_URL_SANDBOX + PAGSEGURO_WS_PATHS["search"]
+
+# consultas idênticas em andamento, compartilhadas entre as threads
+_lookups = SingleFlight()
+
+# intervalo máximo de datas aceito pela consulta de transações
+PAGSEGURO_SEARCH_MAX_RANGE = timedelta(days=30)
+PAGSEGURO_SEARCH_MAX_PAGE_SIZE = 1000
+
+# precisão das datas da consulta de transações, cujos limites são inclusivos
+PAGSEGURO_SEARCH_DATE_RESOLUTION = timedelta(minutes=1)
 
 
 class PagSeguroPaymentResult(object):
@@ -48,22 +86,61 @@ class PagSeguroPaymentResult(object):
             self.payment_link = data["transaction"].get("paymentLink")
 
 
-class PagSeguroException(Exception):
-    def __init__(self, status_code, error):
-        self.status_code = status_code
-        self.error = error
-
-
-class PagSeguro(object):
+class PagSeguroRequest(object):
+    """
+    Requisição ao PagSeguro, independente do cliente HTTP utilizado
+    """
+    __slots__ = ("endpoint", "method", "url", "params", "data", "headers")
+
+    def __init__(self, endpoint, method, url, params=None, data=None, headers=None):
+        self.endpoint = endpoint
+        self.method = method
+        self.url = url
+        self.params = params
+        self.data = data
+        self.headers = headers
+
+    @property
+    def kwargs(self):
+        kwargs = {"params": self.params}
+        if self.data is not None:
+            kwargs["data"] = self.data
+        if self.headers:
+            kwargs["headers"] = self.headers
+        return kwargs
+
+
+class BasePagSeguro(object):
+    """
+    Construção das requisições e interpretação das respostas do PagSeguro,
+    compartilhadas pelos clientes síncrono (`PagSeguro`) e assíncrono
+    (`shuup_pagseguro.pagseguro.aio.AsyncPagSeguro`)
+    """
     email = None
     token = None
     sandbox = False
     notification_url = None
+    connect_timeout = None
+    read_timeout = None
+    base_urls = None
 
-    def __init__(self, email, token, sandbox=False):
+    def __init__(self, email, token, sandbox=False, connect_timeout=None, read_timeout=None, base_urls=None):
         self.email = email
         self.token = token
         self.sandbox = sandbox
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.base_urls = base_urls
+
+    @classmethod
+    def create_from_config(cls, pagseguro_config, **kwargs):
+        return cls(pagseguro_config.email,
+                   pagseguro_config.token,
+                   pagseguro_config.sandbox,
+                   connect_timeout=pagseguro_config.connect_timeout,
+                   read_timeout=pagseguro_config.read_timeout,
+                   base_urls=pagseguro_config.base_urls,
+                   **kwargs)
 
     def _create_params(self):
         return {
@@ -71,101 +148,152 @@ class PagSeguro(object):
             'token': self.token
         }
 
-    @classmethod
-    def create_from_config(cls, pagseguro_config):
-        return cls(pagseguro_config.email,
-                   pagseguro_config.token,
-                   pagseguro_config.sandbox)
-
-    def get_session_id(self):
+    def get_base_url(self, endpoint):
         """
-        Obtém um ID de sessão
+        URL base da família de endpoints
+
+        Usa, nesta ordem, a URL da configuração da loja, a do setting
+        `PAGSEGURO_BASE_URLS` e a URL oficial do ambiente (produção ou
+        sandbox). Em cada uma, a chave "default" vale para as famílias
+        sem URL própria.
+
+        :param endpoint: família do endpoint (session, notification, transaction, search, checkout)
         :rtype: str
-        :return: ID de uma nova sessão
         """
-        url = PAGSEGURO_WS_SESSION_URL_SANDBOX if self.sandbox else PAGSEGURO_WS_SESSION_URL
-        response = requests.post(url, params=self._create_params())
+        for base_urls in (self.base_urls, get_setting("PAGSEGURO_BASE_URLS")):
+            base_url = ((base_urls or {}).get(endpoint) or (base_urls or {}).get("default"))
+            if base_url:
+                return base_url.rstrip("/")
 
-        # Tudo limpo
-        if response.status_code == 200:
-            result = xmltodict.parse(response.content)
-            return result["session"]["id"]
-        else:
-            raise PagSeguroException(response.status_code, response.content)
+        return (PAGSEGURO_WS_BASE_URL_SANDBOX if self.sandbox else PAGSEGURO_WS_BASE_URL)
 
-    def get_notification_info(self, notification_code):
+    def _get_url(self, endpoint, *args):
+        return self.get_base_url(endpoint) + PAGSEGURO_WS_PATHS[endpoint].format(*args)
+
+    def _get_endpoint_timeout(self, endpoint):
         """
-        Obtém as informações de uma transação
-        :rtype: dict
-        :return: dicionário contento informações de uma transação
+        Timeouts de conexão e de leitura do endpoint
+        :rtype: tuple[float,float]
         """
-        url = PAGSEGURO_WS_NOTIFICATION_URL_SANDBOX if self.sandbox else PAGSEGURO_WS_NOTIFICATION_URL
-        url = url.format(notification_code)
-        response = requests.get(url, params=self._create_params())
+        connect_timeout, read_timeout = get_setting("PAGSEGURO_TIMEOUTS").get(endpoint, (None, None))
+        return (self.connect_timeout or connect_timeout, self.read_timeout or read_timeout)
 
-        # Tudo limpo
-        if response.status_code == 200:
-            return xmltodict.parse(response.content)
-        else:
-            raise PagSeguroException(response.status_code, response.content)
+    def _get_lookup_key(self, request):
+        return (self.email, request.url)
 
-    def get_transaction_info(self, transaction_code):
+    def invalidate_transaction_cache(self, transaction_code):
         """
-        Obtém as informações de uma transação
-        :rtype: dict
-        :return: dicionário contento informações de uma transação
+        Descarta a consulta da transação guardada no cache, se houver
         """
-        url = PAGSEGURO_WS_TRANSACTION_URL_SANDBOX if self.sandbox else PAGSEGURO_WS_TRANSACTION_URL
-        url = url.format(transaction_code)
-        response = requests.get(url, params=self._create_params())
+        get_transaction_cache().invalidate(self._get_lookup_key(self._build_transaction_request(transaction_code)))
+
+    def _build_session_request(self):
+        return PagSeguroRequest("session", "post", self._get_url("session"), params=self._create_params())
+
+    def _build_notification_request(self, notification_code):
+        url = self._get_url("notification", notification_code)
+        return PagSeguroRequest("notification", "get", url, params=self._create_params())
+
+    def _build_transaction_request(self, transaction_code):
+        url = self._get_url("transaction", transaction_code)
+        return PagSeguroRequest("transaction", "get", url, params=self._create_params())
+
+    def _build_search_request(self, initial_date, final_date, page, page_size):
+        url = self._get_url("search")
+        params = self._create_params()
+        params.update({
+            "initialDate": _format_search_date(initial_date),
+            "finalDate": _format_search_date(final_date),
+            "page": page,
+            "maxPageResults": page_size
+        })
+        return PagSeguroRequest("search", "get", url, params=params)
 
+    def _build_pay_request(self, payment_xml):
+        url = self._get_url("checkout")
+        headers = {'Content-Type': 'application/xml'}
+        return PagSeguroRequest("checkout", "post", url,
+                                params=self._create_params(), data=payment_xml, headers=headers)
+
+    def _parse_session_response(self, status_code, content):
         # Tudo limpo
-        if response.status_code == 200:
-            return xmltodict.parse(response.content)
+        if status_code == 200:
+            return parse_session_id(content)
         else:
-            raise PagSeguroException(response.status_code, response.content)
+            raise PagSeguroException(status_code, content)
 
-    def pay(self, service, order):
+    def _parse_transaction_response(self, status_code, content):
+        # Tudo limpo
+        if status_code == 200:
+            return xmltodict.parse(content)
+        else:
+            raise PagSeguroException(status_code, content)
+
+    def _parse_transaction_object_response(self, status_code, content):
+        if status_code == 200:
+            return parse_transaction(content)
+        else:
+            raise PagSeguroException(status_code, content)
+
+    def _parse_search_response(self, status_code, content):
         """
-        Faz a transação do pagamento
-        :type service: shuup.core.models.PaymentMethod
-        :type order: shuup.core.models.Order
-        :rtype: PagSeguroPaymentResult
-        :return: sucesso ou erro
+        :rtype: tuple[int,list[dict]]
+        :return: o total de páginas e as transações da página
         """
-        payment_xml = self._get_payment_xml(service, order)
+        if status_code != 200:
+            raise PagSeguroException(status_code, content)
 
-        url = PAGSEGURO_WS_CHECKOUT_URL_SANDBOX if self.sandbox else PAGSEGURO_WS_CHECKOUT_URL
-        headers = {'Content-Type': 'application/xml'}
-        response = requests.post(url, params=self._create_params(), data=payment_xml, headers=headers)
+        result = xmltodict.parse(content)["transactionSearchResult"]
+        total_pages = int(result.get("totalPages") or 0)
+        transactions = (result.get("transactions") or {}).get("transaction") or []
 
+        # um único resultado não é retornado como lista
+        if not isinstance(transactions, list):
+            transactions = [transactions]
+
+        return (total_pages, transactions)
+
+    def _parse_pay_response(self, status_code, content):
         # Erro!!
-        if response.status_code == 500:
-            raise PagSeguroException(response.status_code, response.content)
+        if status_code == 500:
+            raise PagSeguroException(status_code, content)
         else:
-            result = xmltodict.parse(response.content)
+            result = xmltodict.parse(content)
             return PagSeguroPaymentResult(result)
 
+    def _get_search_windows(self, initial_date, final_date):
+        """
+        Divide o período em janelas aceitas pela consulta do PagSeguro
+
+        Os limites da consulta incluem o minuto inicial e o final: cada
+        janela começa no minuto seguinte ao fim da anterior, de forma que as
+        transações do minuto da divisa não são retornadas duas vezes.
+
+        :rtype: collections.Iterable[tuple[datetime.datetime,datetime.datetime]]
+        """
+        window_start = truncate_search_date(initial_date)
+        final_date = truncate_search_date(final_date)
+
+        while window_start <= final_date:
+            window_end = min(window_start + PAGSEGURO_SEARCH_MAX_RANGE, final_date)
+            yield (window_start, window_end)
+            window_start = window_end + PAGSEGURO_SEARCH_DATE_RESOLUTION
+
     def _get_payment_xml(self, service, order):
         """
         Gera o XML para pagamento do PagSeguro
         :type service: shuup.core.models.PaymentMethod
         :type order: shuup.core.models.Order
         """
-        template = get_template("pagseguro/xml/payment.jinja")
+        from shuup_pagseguro.payload import load_payment_order
 
         phone_area_code = ""
         phone_number = ""
         cpf = ""
         cnpj = ""
 
-        lines = []
-        total_lines = Decimal()
-
-        for line in order.lines.all():
-            if line.taxful_price.value > 0:
-                lines.append(line)
-                total_lines = total_lines + line.taxful_price.value
+        lines = load_payment_order(order)
+        total_lines = sum((line.taxful_price.value for line in lines), Decimal())
 
         extra_amount = (order.taxful_total_price.value - total_lines)
         postal_code = "".join([d for d in order.shipping_address.postal_code if d.isdigit()])
@@ -182,15 +310,222 @@ class PagSeguro(object):
         if hasattr(order.creator, 'pj_person') and order.creator.pj_person.cnpj:
             cnpj = "".join([d for d in order.creator.pj_person.cnpj if d.isdigit()])
 
-        return template.render({
-            "order": order,
-            "service": service,
-            "lines": lines,
-            "extra_amount": extra_amount,
-            "postal_code": postal_code,
-            "phone_area_code": phone_area_code,
-            "phone_number": phone_number,
-            "customer_cpf": cpf,
-            "customer_cnpj": cnpj,
-            "PagSeguroPaymentMethod": PagSeguroPaymentMethod
-        })
+        return serialize_payment(service, order, lines, extra_amount, postal_code,
+                                 phone_area_code=phone_area_code,
+                                 phone_number=phone_number,
+                                 customer_cpf=cpf,
+                                 customer_cnpj=cnpj)
+
+
+class PagSeguro(BasePagSeguro):
+
+    @property
+    def session(self):
+        """
+        Sessão HTTP persistente desta conta, compartilhada no processo
+        :rtype: requests.Session
+        """
+        return get_connection_pool(self.email, self.sandbox).get_session()
+
+    def _request(self, endpoint, method, url, **kwargs):
+        """
+        Faz uma requisição ao PagSeguro
+
+        Erros de conexão e respostas 5xx são repetidos conforme a política
+        do endpoint e contabilizados pelo circuit breaker do host, que faz
+        as requisições falharem imediatamente enquanto o PagSeguro estiver
+        indisponível. Os timeouts de cada tentativa e as esperas entre elas
+        são limitados ao prazo atual (ver `deadline`). Cada tentativa
+        respeita o limite de requisições da conta (ver `ratelimit`).
+
+        :param endpoint: família do endpoint (session, notification, transaction, search, checkout)
+        :rtype: requests.Response
+        :raises PagSeguroUnavailable: se o circuito do host estiver aberto
+        :raises PagSeguroDeadlineExceeded: se o prazo atual se esgotar
+        """
+        policy = RetryPolicy.for_endpoint(endpoint)
+        breaker = get_circuit_breaker(urlparse(url).netloc)
+        limiter = get_rate_limiter(self.email)
+        attempt = 0
+
+        while True:
+            attempt += 1
+            if limiter:
+                limiter.acquire(endpoint)
+
+            timeout = self._get_timeout(endpoint)
+            breaker.before_request()
+            error = response = None
+
+            try:
+                response = getattr(self.session, method)(url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                breaker.record_failure()
+                error = exc
+            except Exception:
+                breaker.record_failure()
+                raise
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                if response.status_code < 500:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+
+            delay = policy.get_delay(attempt)
+            remaining = get_remaining_time()
+
+            # sem tentativas ou sem tempo para uma nova tentativa
+            if attempt >= policy.max_attempts or (remaining is not None and delay >= remaining):
+                if error is not None:
+                    raise error
+                return response
+
+            time.sleep(delay)
+
+    def _get_timeout(self, endpoint):
+        """
+        Obtém os timeouts de conexão e de leitura do endpoint, limitados
+        ao tempo restante do prazo atual
+        :rtype: tuple[float,float]
+        """
+        connect_timeout, read_timeout = self._get_endpoint_timeout(endpoint)
+        remaining = get_remaining_time()
+
+        if remaining is not None:
+            if remaining <= 0:
+                raise PagSeguroDeadlineExceeded()
+            connect_timeout = min(connect_timeout or remaining, remaining)
+            read_timeout = min(read_timeout or remaining, remaining)
+
+        return (connect_timeout, read_timeout)
+
+    def _send(self, request):
+        """
+        :type request: PagSeguroRequest
+        :rtype: tuple[int,bytes]
+        """
+        response = self._request(request.endpoint, request.method, request.url, **request.kwargs)
+        return (response.status_code, response.content)
+
+    def _send_lookup(self, request, cache=False):
+        """
+        Envia uma consulta, compartilhando a requisição com as consultas
+        idênticas já em andamento em outras threads
+        :param cache: guarda a resposta no cache de transações
+        :rtype: tuple[int,bytes]
+        """
+        key = self._get_lookup_key(request)
+
+        if cache:
+            cached = get_transaction_cache().get(key)
+            if cached is not None:
+                return cached
+
+        def fetch():
+            result = self._send(request)
+            if cache and result[0] == 200:
+                get_transaction_cache().set(key, result)
+            return result
+
+        return _lookups.do(key, fetch)
+
+    def get_session_id(self):
+        """
+        Obtém um ID de sessão
+        :rtype: str
+        :return: ID de uma nova sessão
+        """
+        return self._parse_session_response(*self._send(self._build_session_request()))
+
+    def get_notification_info(self, notification_code):
+        """
+        Obtém as informações de uma transação
+        :rtype: dict
+        :return: dicionário contento informações de uma transação
+        """
+        return self._parse_transaction_response(*self._send_lookup(self._build_notification_request(notification_code)))
+
+    def get_transaction_info(self, transaction_code):
+        """
+        Obtém as informações de uma transação
+        :rtype: dict
+        :return: dicionário contento informações de uma transação
+        """
+        request = self._build_transaction_request(transaction_code)
+        return self._parse_transaction_response(*self._send_lookup(request, cache=True))
+
+    def get_notification(self, notification_code):
+        """
+        Obtém a transação de uma notificação como objeto
+        :rtype: shuup_pagseguro.pagseguro.parser.Transaction
+        """
+        request = self._build_notification_request(notification_code)
+        return self._parse_transaction_object_response(*self._send_lookup(request))
+
+    def get_transaction(self, transaction_code):
+        """
+        Obtém uma transação como objeto, com os valores já convertidos
+        (mais rápido que `get_transaction_info` quando os dados não
+        precisam ser armazenados)
+        :rtype: shuup_pagseguro.pagseguro.parser.Transaction
+        """
+        request = self._build_transaction_request(transaction_code)
+        return self._parse_transaction_object_response(*self._send_lookup(request, cache=True))
+
+    def search_transactions(self, initial_date, final_date, page_size=100):
+        """
+        Consulta as transações realizadas em um período
+
+        Gerador que percorre as páginas do resultado, retornando uma
+        transação por vez. Apenas uma página é mantida em memória e
+        períodos maiores que o aceito pelo PagSeguro são divididos em
+        janelas consultadas em sequência.
+
+        :type initial_date: datetime.datetime
+        :type final_date: datetime.datetime
+        :rtype: collections.Iterable[dict]
+        :return: resumo de cada transação encontrada
+        """
+        page_size = min(page_size, PAGSEGURO_SEARCH_MAX_PAGE_SIZE)
+
+        for window_start, window_end in self._get_search_windows(initial_date, final_date):
+            page = 1
+            total_pages = 1
+
+            while page <= total_pages:
+                request = self._build_search_request(window_start, window_end, page, page_size)
+                total_pages, transactions = self._parse_search_response(*self._send(request))
+
+                for transaction in transactions:
+                    yield transaction
+
+                page += 1
+
+    def pay(self, service, order):
+        """
+        Faz a transação do pagamento
+        :type service: shuup.core.models.PaymentMethod
+        :type order: shuup.core.models.Order
+        :rtype: PagSeguroPaymentResult
+        :return: sucesso ou erro
+        """
+        payment_xml = self._get_payment_xml(service, order)
+        return self._parse_pay_response(*self._send(self._build_pay_request(payment_xml)))
+
+
+def truncate_search_date(value):
+    """
+    Descarta os segundos da data, que não são considerados pela consulta de transações
+    :type value: datetime.datetime
+    :rtype: datetime.datetime
+    """
+    return value.replace(second=0, microsecond=0)
+
+
+def _format_search_date(value):
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.strftime("%Y-%m-%dT%H:%M")
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+import asyncio
+
+from django.core.exceptions import ImproperlyConfigured
+from six.moves.urllib.parse import urlparse
+
+from shuup_pagseguro.pagseguro import BasePagSeguro, PAGSEGURO_SEARCH_MAX_PAGE_SIZE
+from shuup_pagseguro.pagseguro.coalescing import get_transaction_cache
+from shuup_pagseguro.pagseguro.ratelimit import DatabaseTokenBucket, get_rate_limiter
+from shuup_pagseguro.pagseguro.resilience import get_circuit_breaker, RetryPolicy
+from shuup_pagseguro.settings import get_setting
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+class AsyncSingleFlight(object):
+    """
+    Agrupa consultas idênticas e simultâneas em um event loop
+
+    A primeira corrotina executa a consulta; as demais aguardam o mesmo
+    future e recebem o mesmo resultado ou a mesma exceção. Se a corrotina
+    que executa a consulta for cancelada, as demais refazem a consulta.
+    """
+
+    def __init__(self):
+        self._futures = {}
+
+    async def do(self, key, coroutine_function):
+        loop = asyncio.get_event_loop()
+        # cada event loop tem as suas próprias consultas
+        key = (id(loop), key)
+
+        future = self._futures.get(key)
+        while future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # a própria corrotina foi cancelada, não a consulta compartilhada
+                if not future.cancelled():
+                    raise
+            future = self._futures.get(key)
+
+        future = self._futures[key] = loop.create_future()
+        try:
+            result = await coroutine_function()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # evita o aviso de exceção não recuperada quando não há outras corrotinas aguardando
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+
+_lookups = AsyncSingleFlight()
+
+
+def create_client_session(limit=None):
+    """
+    Cria uma sessão HTTP assíncrona que pode ser compartilhada entre
+    vários clientes (por exemplo, um por loja) no mesmo event loop
+    :rtype: aiohttp.ClientSession
+    """
+    if aiohttp is None:
+        raise ImproperlyConfigured("The aiohttp package is required to use the async PagSeguro client.")
+
+    limit = (get_setting("PAGSEGURO_ASYNC_POOL_LIMIT") if limit is None else limit)
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=limit))
+
+
+class AsyncPagSeguro(BasePagSeguro):
+    """
+    Cliente assíncrono do PagSeguro
+
+    Possui os mesmos métodos do cliente síncrono (`PagSeguro`), porém
+    como corrotinas, permitindo manter centenas de consultas em andamento
+    em um único processo. As requisições são construídas e as respostas
+    interpretadas pelo mesmo código do cliente síncrono.
+
+    O prazo (`deadline`) é específico de cada thread e não é considerado
+    aqui; utilize `asyncio.wait_for` para limitar o tempo de uma operação.
+    """
+
+    def __init__(self, email, token, sandbox=False, connect_timeout=None, read_timeout=None, base_urls=None,
+                 session=None):
+        if aiohttp is None:
+            raise ImproperlyConfigured("The aiohttp package is required to use the async PagSeguro client.")
+
+        super(AsyncPagSeguro, self).__init__(email, token, sandbox, connect_timeout, read_timeout, base_urls)
+        self._session = session
+        self._owns_session = (session is None)
+
+    @property
+    def session(self):
+        """
+        :rtype: aiohttp.ClientSession
+        """
+        if self._session is None:
+            self._session = create_client_session()
+        return self._session
+
+    async def close(self):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _fetch(self, request, timeout):
+        """
+        Executa uma única tentativa da requisição
+        :type request: shuup_pagseguro.pagseguro.PagSeguroRequest
+        :rtype: tuple[int,bytes]
+        """
+        connect_timeout, read_timeout = timeout
+        client_timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+
+        async with self.session.request(request.method, request.url, timeout=client_timeout,
+                                        **request.kwargs) as response:
+            return (response.status, await response.read())
+
+    async def _send(self, request):
+        """
+        Faz uma requisição ao PagSeguro, com as mesmas novas tentativas, o
+        mesmo circuit breaker e o mesmo limite de requisições do cliente
+        síncrono
+        :type request: shuup_pagseguro.pagseguro.PagSeguroRequest
+        :rtype: tuple[int,bytes]
+        """
+        policy = RetryPolicy.for_endpoint(request.endpoint)
+        breaker = get_circuit_breaker(urlparse(request.url).netloc)
+        limiter = get_rate_limiter(self.email)
+        timeout = self._get_endpoint_timeout(request.endpoint)
+        attempt = 0
+
+        while True:
+            attempt += 1
+            if limiter:
+                await self._wait_rate_limit(limiter, request.endpoint)
+
+            breaker.before_request()
+            error = result = None
+
+            try:
+                result = await self._fetch(request, timeout)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                breaker.record_failure()
+                error = exc
+            except BaseException as exc:
+                # erros inesperados contam como falha; o cancelamento da
+                # requisição apenas libera a requisição de teste do circuito
+                if isinstance(exc, Exception) and not isinstance(exc, asyncio.CancelledError):
+                    breaker.record_failure()
+                else:
+                    breaker.release()
+                raise
+            else:
+                if result[0] < 500:
+                    breaker.record_success()
+                    return result
+                breaker.record_failure()
+
+            if attempt >= policy.max_attempts:
+                if error is not None:
+                    raise error
+                return result
+
+            await asyncio.sleep(policy.get_delay(attempt))
+
+    async def _wait_rate_limit(self, limiter, endpoint):
+        wait = limiter.check_wait(await self._take_token(limiter, endpoint))
+        while wait:
+            await asyncio.sleep(wait)
+            wait = limiter.check_wait(await self._take_token(limiter, endpoint))
+
+    async def _take_token(self, limiter, endpoint):
+        """
+        Retira um token do bucket do limitador. No modo "database" a retirada
+        é uma transação no banco de dados, feita no executor do event loop
+        para não bloqueá-lo.
+        :rtype: float
+        """
+        reserve = limiter.get_reserve(endpoint)
+        if isinstance(limiter.bucket, DatabaseTokenBucket):
+            return await asyncio.get_event_loop().run_in_executor(None, limiter.bucket.try_acquire, reserve)
+        return limiter.bucket.try_acquire(reserve)
+
+    async def _send_lookup(self, request, cache=False):
+        """
+        Envia uma consulta, compartilhando a requisição com as consultas
+        idênticas já em andamento no event loop
+        :param cache: guarda a resposta no cache de transações
+        :rtype: tuple[int,bytes]
+        """
+        key = self._get_lookup_key(request)
+
+        if cache:
+            cached = get_transaction_cache().get(key)
+            if cached is not None:
+                return cached
+
+        async def fetch():
+            result = await self._send(request)
+            if cache and result[0] == 200:
+                get_transaction_cache().set(key, result)
+            return result
+
+        return await _lookups.do(key, fetch)
+
+    async def get_session_id(self):
+        """
+        Obtém um ID de sessão
+        :rtype: str
+        """
+        return self._parse_session_response(*(await self._send(self._build_session_request())))
+
+    async def get_notification_info(self, notification_code):
+        """
+        Obtém as informações de uma transação a partir de uma notificação
+        :rtype: dict
+        """
+        request = self._build_notification_request(notification_code)
+        return self._parse_transaction_response(*(await self._send_lookup(request)))
+
+    async def get_transaction_info(self, transaction_code):
+        """
+        Obtém as informações de uma transação
+        :rtype: dict
+        """
+        request = self._build_transaction_request(transaction_code)
+        return self._parse_transaction_response(*(await self._send_lookup(request, cache=True)))
+
+    async def get_notification(self, notification_code):
+        """
+        Obtém a transação de uma notificação como objeto
+        :rtype: shuup_pagseguro.pagseguro.parser.Transaction
+        """
+        request = self._build_notification_request(notification_code)
+        return self._parse_transaction_object_response(*(await self._send_lookup(request)))
+
+    async def get_transaction(self, transaction_code):
+        """
+        Obtém uma transação como objeto
+        :rtype: shuup_pagseguro.pagseguro.parser.Transaction
+        """
+        request = self._build_transaction_request(transaction_code)
+        return self._parse_transaction_object_response(*(await self._send_lookup(request, cache=True)))
+
+    def search_transactions(self, initial_date, final_date, page_size=100):
+        """
+        Consulta as transações realizadas em um período
+
+        Utilize com `async for`; as páginas são buscadas conforme
+        o resultado é percorrido.
+
+        :rtype: collections.AsyncIterator[dict]
+        """
+        return _AsyncTransactionSearch(self, initial_date, final_date, min(page_size, PAGSEGURO_SEARCH_MAX_PAGE_SIZE))
+
+    async def pay(self, service, order):
+        """
+        Faz a transação do pagamento
+
+        O XML do pagamento consulta o banco de dados (`load_payment_order`),
+        então é gerado no executor do event loop para não bloqueá-lo.
+
+        :type service: shuup.core.models.PaymentMethod
+        :type order: shuup.core.models.Order
+        :rtype: shuup_pagseguro.pagseguro.PagSeguroPaymentResult
+        """
+        payment_xml = await asyncio.get_event_loop().run_in_executor(None, self._get_payment_xml, service, order)
+        return self._parse_pay_response(*(await self._send(self._build_pay_request(payment_xml))))
+
+
+class _AsyncTransactionSearch(object):
+    """
+    Iterador assíncrono sobre as páginas da consulta de transações
+    """
+
+    def __init__(self, pagseguro, initial_date, final_date, page_size):
+        self.pagseguro = pagseguro
+        self.page_size = page_size
+        self._windows = pagseguro._get_search_windows(initial_date, final_date)
+        self._window = None
+        self._page = 1
+        self._total_pages = 0
+        self._transactions = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._transactions:
+            if self._page > self._total_pages:
+                self._window = next(self._windows, None)
+                if self._window is None:
+                    raise StopAsyncIteration
+                self._page = 1
+                self._total_pages = 1
+
+            request = self.pagseguro._build_search_request(self._window[0], self._window[1],
+                                                           self._page, self.page_size)
+            self._total_pages, transactions = self.pagseguro._parse_search_response(
+                *(await self.pagseguro._send(request))
+            )
+            self._transactions = list(reversed(transactions))
+            self._page += 1
+
+        return self._transactions.pop()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+import threading
+import time
+
+from shuup_pagseguro.pagseguro.deadline import get_remaining_time
+from shuup_pagseguro.pagseguro.exceptions import PagSeguroDeadlineExceeded
+from shuup_pagseguro.settings import get_setting
+from shuup_pagseguro.utils import LRUCache
+
+
+class _Call(object):
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Agrupa chamadas idênticas e simultâneas
+
+    A primeira thread a chamar `do` com uma chave executa a função; as
+    demais aguardam e recebem o mesmo resultado (ou a mesma exceção),
+    sem repetir a requisição ao PagSeguro.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = (call is None)
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            return self._wait(call)
+
+        try:
+            call.result = function()
+        except BaseException as exc:
+            # inclusive KeyboardInterrupt/SystemExit: quem aguarda recebe a mesma exceção
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+        return call.result
+
+    def _wait(self, call):
+        # a espera também respeita o prazo da thread que aguarda
+        remaining = get_remaining_time()
+        if not call.event.wait(None if remaining is None else max(remaining, 0)):
+            raise PagSeguroDeadlineExceeded()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class TransactionCache(object):
+    """
+    Cache de curta duração das respostas de consulta de transações
+    (desativado quando `PAGSEGURO_TRANSACTION_CACHE_TTL` é 0)
+    """
+
+    def __init__(self, maxsize=None):
+        self._data = LRUCache(get_setting("PAGSEGURO_TRANSACTION_CACHE_SIZE") if maxsize is None else maxsize)
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry and entry[0] > time.time():
+            return entry[1]
+        return None
+
+    def set(self, key, value, ttl=None):
+        ttl = (get_setting("PAGSEGURO_TRANSACTION_CACHE_TTL") if ttl is None else ttl)
+        if ttl:
+            self._data.set(key, (time.time() + ttl, value))
+
+    def invalidate(self, key):
+        self._data.discard(key)
+
+    def clear(self):
+        self._data.clear()
+
+
+_transaction_cache = None
+_transaction_cache_lock = threading.Lock()
+
+
+def get_transaction_cache():
+    """
+    :rtype: TransactionCache
+    """
+    global _transaction_cache
+
+    if _transaction_cache is None:
+        with _transaction_cache_lock:
+            if _transaction_cache is None:
+                _transaction_cache = TransactionCache()
+
+    return _transaction_cache
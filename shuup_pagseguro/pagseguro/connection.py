@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from shuup_pagseguro.settings import get_setting
+
+
+class ConnectionPool(object):
+    """
+    Pool de conexões HTTP persistentes (keep-alive) de uma conta em um host
+
+    O adaptador (e o pool do urllib3 que ele contém) é compartilhado entre
+    todas as threads do processo, enquanto cada thread recebe sua própria
+    `requests.Session` montada sobre ele, evitando compartilhar o estado
+    mutável da sessão (cookies, headers) entre threads.
+    """
+
+    def __init__(self, pool_connections=None, pool_maxsize=None, keep_alive=None):
+        if pool_connections is None:
+            pool_connections = get_setting("PAGSEGURO_HTTP_POOL_CONNECTIONS")
+        if pool_maxsize is None:
+            pool_maxsize = get_setting("PAGSEGURO_HTTP_POOL_MAXSIZE")
+        if keep_alive is None:
+            keep_alive = get_setting("PAGSEGURO_HTTP_KEEP_ALIVE")
+
+        self.keep_alive = keep_alive
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self._local = threading.local()
+
+    def get_session(self):
+        """
+        Obtém a sessão HTTP da thread atual
+        :rtype: requests.Session
+        """
+        session = getattr(self._local, "session", None)
+
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+
+            if not self.keep_alive:
+                session.headers["Connection"] = "close"
+
+            self._local.session = session
+
+        return session
+
+    def close(self):
+        self.adapter.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(email, sandbox=False):
+    """
+    Obtém o pool de conexões de uma conta para o ambiente informado
+    (produção ou sandbox), criando-o caso ainda não exista
+    :rtype: ConnectionPool
+    """
+    key = (email, bool(sandbox))
+    pool = _pools.get(key)
+
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool()
+
+    return pool
+
+
+def close_connection_pools():
+    """
+    Fecha e descarta todos os pools de conexão do processo
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
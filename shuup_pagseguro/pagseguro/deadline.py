@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from contextlib import contextmanager
+import threading
+import time
+
+_local = threading.local()
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Define o tempo total disponível para as requisições ao PagSeguro
+    feitas pela thread atual dentro do bloco
+
+    Prazos aninhados nunca estendem o prazo externo. O prazo usa o relógio
+    monotônico, então ajustes no relógio do sistema não o alteram.
+
+    :type seconds: float|None
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+
+    expires_at = (time.monotonic() + seconds if seconds is not None else None)
+    if stack and stack[-1] is not None:
+        expires_at = (min(expires_at, stack[-1]) if expires_at is not None else stack[-1])
+
+    stack.append(expires_at)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def get_remaining_time():
+    """
+    Tempo restante, em segundos, do prazo atual
+    :rtype: float|None
+    :return: o tempo restante ou None se não houver prazo
+    """
+    stack = getattr(_local, "stack", None)
+    if not stack or stack[-1] is None:
+        return None
+    return stack[-1] - time.monotonic()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+
+
+class PagSeguroException(Exception):
+    def __init__(self, status_code, error):
+        self.status_code = status_code
+        self.error = error
+
+
+class PagSeguroUnavailable(PagSeguroException):
+    """
+    O PagSeguro está indisponível e as requisições ao host estão suspensas
+    (circuit breaker aberto)
+    """
+
+    def __init__(self, host, retry_after=None):
+        super(PagSeguroUnavailable, self).__init__(503, "PagSeguro unavailable: {0}".format(host))
+        self.host = host
+        self.retry_after = retry_after
+
+
+class PagSeguroDeadlineExceeded(PagSeguroException):
+    """
+    O tempo total disponível para as requisições ao PagSeguro se esgotou
+    """
+
+    def __init__(self):
+        super(PagSeguroDeadlineExceeded, self).__init__(504, "PagSeguro deadline exceeded")
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from decimal import Decimal
+from xml.etree.ElementTree import XMLPullParser
+
+import iso8601
+import six
+
+# tamanho dos blocos entregues ao parser incremental
+CHUNK_SIZE = 16 * 1024
+
+
+class Item(object):
+    __slots__ = ("id", "description", "quantity", "amount")
+
+    def __init__(self):
+        self.id = None
+        self.description = None
+        self.quantity = None
+        self.amount = None
+
+
+class Sender(object):
+    __slots__ = ("name", "email", "phone_area_code", "phone_number")
+
+    def __init__(self):
+        self.name = None
+        self.email = None
+        self.phone_area_code = None
+        self.phone_number = None
+
+
+class Fees(object):
+    __slots__ = ("fee_amount", "intermediation_rate_amount", "intermediation_fee_amount")
+
+    def __init__(self):
+        self.fee_amount = None
+        self.intermediation_rate_amount = None
+        self.intermediation_fee_amount = None
+
+
+class Transaction(object):
+    """
+    Transação do PagSeguro com os valores já convertidos
+    (Decimal para valores, datetime para datas e int para códigos)
+    """
+    __slots__ = (
+        "code", "reference", "type", "status", "date", "last_event_date", "escrow_end_date",
+        "payment_method_type", "payment_method_code", "payment_link", "gross_amount", "discount_amount",
+        "net_amount", "extra_amount", "installment_count", "fees", "items", "sender"
+    )
+
+    def __init__(self):
+        self.code = None
+        self.reference = None
+        self.type = None
+        self.status = None
+        self.date = None
+        self.last_event_date = None
+        self.escrow_end_date = None
+        self.payment_method_type = None
+        self.payment_method_code = None
+        self.payment_link = None
+        self.gross_amount = None
+        self.discount_amount = None
+        self.net_amount = None
+        self.extra_amount = None
+        self.installment_count = None
+        self.fees = Fees()
+        self.items = []
+        self.sender = Sender()
+
+
+def _parse_datetime(value):
+    return iso8601.parse_date(value)
+
+
+# caminho do elemento => (objeto de destino, atributo, conversão)
+TRANSACTION_FIELDS = {
+    ("transaction", "code"): (None, "code", six.text_type),
+    ("transaction", "reference"): (None, "reference", six.text_type),
+    ("transaction", "type"): (None, "type", int),
+    ("transaction", "status"): (None, "status", int),
+    ("transaction", "date"): (None, "date", _parse_datetime),
+    ("transaction", "lastEventDate"): (None, "last_event_date", _parse_datetime),
+    ("transaction", "escrowEndDate"): (None, "escrow_end_date", _parse_datetime),
+    ("transaction", "paymentMethod", "type"): (None, "payment_method_type", int),
+    ("transaction", "paymentMethod", "code"): (None, "payment_method_code", int),
+    ("transaction", "paymentLink"): (None, "payment_link", six.text_type),
+    ("transaction", "grossAmount"): (None, "gross_amount", Decimal),
+    ("transaction", "discountAmount"): (None, "discount_amount", Decimal),
+    ("transaction", "netAmount"): (None, "net_amount", Decimal),
+    ("transaction", "extraAmount"): (None, "extra_amount", Decimal),
+    ("transaction", "installmentCount"): (None, "installment_count", int),
+    ("transaction", "feeAmount"): ("fees", "fee_amount", Decimal),
+    ("transaction", "creditorFees", "intermediationRateAmount"): ("fees", "intermediation_rate_amount", Decimal),
+    ("transaction", "creditorFees", "intermediationFeeAmount"): ("fees", "intermediation_fee_amount", Decimal),
+    ("transaction", "sender", "name"): ("sender", "name", six.text_type),
+    ("transaction", "sender", "email"): ("sender", "email", six.text_type),
+    ("transaction", "sender", "phone", "areaCode"): ("sender", "phone_area_code", six.text_type),
+    ("transaction", "sender", "phone", "number"): ("sender", "phone_number", six.text_type),
+}
+
+ITEM_PATH = ("transaction", "items", "item")
+ITEM_FIELDS = {
+    "id": ("id", six.text_type),
+    "description": ("description", six.text_type),
+    "quantity": ("quantity", int),
+    "amount": ("amount", Decimal),
+}
+
+
+def _iter_events(content):
+    """
+    Entrega o conteúdo ao parser em blocos, gerando os eventos à medida
+    que são produzidos
+    """
+    parser = XMLPullParser(events=("start", "end"))
+
+    for index in range(0, len(content), CHUNK_SIZE):
+        parser.feed(content[index:index + CHUNK_SIZE])
+        for event in parser.read_events():
+            yield event
+
+    parser.close()
+    for event in parser.read_events():
+        yield event
+
+
+def parse_transaction(content):
+    """
+    Interpreta o XML de uma transação (consulta ou notificação)
+
+    O documento é percorrido de forma incremental e cada elemento é
+    descartado assim que seu valor é lido, sem montar a árvore completa.
+
+    :type content: bytes|str
+    :rtype: Transaction
+    """
+    transaction = Transaction()
+    path = []
+    item = None
+
+    for event, element in _iter_events(content):
+        if event == "start":
+            path.append(element.tag)
+            if tuple(path) == ITEM_PATH:
+                item = Item()
+            continue
+
+        key = tuple(path)
+        text = (element.text or "").strip()
+
+        if key == ITEM_PATH:
+            transaction.items.append(item)
+            item = None
+        elif item is not None and len(key) == 4 and key[:3] == ITEM_PATH:
+            field = ITEM_FIELDS.get(key[3])
+            if field and text:
+                setattr(item, field[0], field[1](text))
+        else:
+            field = TRANSACTION_FIELDS.get(key)
+            if field and text:
+                target = (getattr(transaction, field[0]) if field[0] else transaction)
+                setattr(target, field[1], field[2](text))
+
+        element.clear()
+        path.pop()
+
+    return transaction
+
+
+def parse_session_id(content):
+    """
+    Obtém o ID do XML de criação de sessão
+    :type content: bytes|str
+    :rtype: str
+    """
+    for event, element in _iter_events(content):
+        if event == "end" and element.tag == "id":
+            return six.text_type(element.text or "").strip()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+import time
+
+from shuup_pagseguro.pagseguro.deadline import get_remaining_time
+from shuup_pagseguro.pagseguro.exceptions import PagSeguroDeadlineExceeded
+from shuup_pagseguro.settings import get_setting
+
+# classes de prioridade, da maior para a menor
+CHECKOUT = "checkout"
+NOTIFICATION = "notification"
+BACKGROUND = "background"
+
+_local = threading.local()
+
+
+@contextmanager
+def request_priority(priority):
+    """
+    Define a classe de prioridade das requisições feitas pela thread atual
+    dentro do bloco, no lugar da classe do endpoint (por exemplo, para
+    obter IDs de sessão antecipadamente sem consumir a reserva do checkout)
+
+    :type priority: str
+    """
+    previous = getattr(_local, "priority", None)
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def get_request_priority():
+    """
+    Classe de prioridade definida por `request_priority` para a thread atual
+    :rtype: str|None
+    """
+    return getattr(_local, "priority", None)
+
+
+def _take_token(tokens, updated_at, current_time, rate, capacity, reserve):
+    """
+    Reabastece o bucket e tenta retirar uma ficha
+
+    Uma classe de prioridade só pode retirar fichas enquanto o bucket
+    mantiver a sua reserva (fração da capacidade), que fica disponível
+    apenas para as classes de maior prioridade.
+
+    :rtype: tuple[float,float]
+    :return: as fichas restantes e o tempo de espera (0 se a ficha foi retirada)
+    """
+    tokens = min(capacity, tokens + max(current_time - updated_at, 0) * rate)
+    needed = 1 + reserve * capacity
+
+    if tokens >= needed:
+        return (tokens - 1, 0)
+
+    return (tokens, (needed - tokens) / rate)
+
+
+class TokenBucket(object):
+    """
+    Token bucket mantido na memória do processo
+    """
+
+    def __init__(self, key, rate, capacity):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.time()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, reserve=0):
+        """
+        :rtype: float
+        :return: 0 se a ficha foi retirada ou o tempo, em segundos, até haver fichas
+        """
+        with self._lock:
+            current_time = time.time()
+            self.tokens, wait = _take_token(self.tokens, self.updated_at, current_time,
+                                            self.rate, self.capacity, reserve)
+            self.updated_at = current_time
+            return wait
+
+
+class DatabaseTokenBucket(object):
+    """
+    Token bucket guardado no banco de dados, compartilhado por todos os
+    processos e servidores que atendem a conta
+
+    Cada ficha é retirada em uma transação própria, que bloqueia a linha do
+    bucket apenas durante a retirada. Se a thread atual já estiver em uma
+    transação (por exemplo, com `ATOMIC_REQUESTS` ou no lote de uma
+    notificação), o bloqueio duraria até o fim dela: nesse caso a ficha é
+    retirada pela conexão de uma thread auxiliar.
+    """
+
+    def __init__(self, key, rate, capacity):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    def try_acquire(self, reserve=0):
+        from django.db import connection
+
+        if connection.in_atomic_block:
+            return _get_token_executor().submit(self._take_token_in_worker, reserve).result()
+        return self._take_token(reserve)
+
+    def _take_token_in_worker(self, reserve):
+        from django.db import close_old_connections
+
+        close_old_connections()
+        return self._take_token(reserve)
+
+    def _take_token(self, reserve):
+        from django.db import transaction
+        from shuup_pagseguro.models import PagSeguroRateLimitBucket
+
+        with transaction.atomic():
+            PagSeguroRateLimitBucket.objects.get_or_create(
+                key=self.key, defaults={"tokens": self.capacity, "updated_at": time.time()}
+            )
+            bucket = PagSeguroRateLimitBucket.objects.select_for_update().get(key=self.key)
+
+            current_time = time.time()
+            bucket.tokens, wait = _take_token(bucket.tokens, bucket.updated_at, current_time,
+                                              self.rate, self.capacity, reserve)
+            bucket.updated_at = current_time
+            bucket.save(update_fields=["tokens", "updated_at"])
+            return wait
+
+
+_token_executor = None
+_token_executor_lock = threading.Lock()
+
+
+def _get_token_executor():
+    """
+    Thread auxiliar, com a sua própria conexão ao banco de dados, que retira
+    as fichas dos buckets fora da transação da thread atual
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    global _token_executor
+
+    if _token_executor is None:
+        with _token_executor_lock:
+            if _token_executor is None:
+                _token_executor = ThreadPoolExecutor(max_workers=1)
+
+    return _token_executor
+
+
+class RateLimiter(object):
+    """
+    Limite de requisições de uma conta do PagSeguro, com prioridade para
+    o checkout, depois para as notificações e por último para as tarefas
+    em segundo plano (atualização e conciliação de pagamentos)
+    """
+
+    def __init__(self, bucket, reserves=None, priorities=None):
+        self.bucket = bucket
+        self.reserves = (get_setting("PAGSEGURO_RATE_LIMIT_RESERVES") if reserves is None else reserves)
+        self.priorities = (get_setting("PAGSEGURO_RATE_LIMIT_PRIORITIES") if priorities is None else priorities)
+
+    def get_priority(self, endpoint):
+        return (get_request_priority() or self.priorities.get(endpoint, BACKGROUND))
+
+    def get_reserve(self, endpoint):
+        """
+        Quantidade de tokens que deve sobrar no bucket após a requisição
+        :rtype: float
+        """
+        return self.reserves.get(self.get_priority(endpoint), 0)
+
+    def check_wait(self, wait):
+        """
+        :raises PagSeguroDeadlineExceeded: se a espera ultrapassar o prazo atual
+        """
+        remaining = get_remaining_time()
+
+        if wait and remaining is not None and wait >= remaining:
+            raise PagSeguroDeadlineExceeded()
+
+        return wait
+
+    def try_acquire(self, endpoint):
+        """
+        :param endpoint: família do endpoint (session, notification, transaction, search, checkout)
+        :rtype: float
+        :return: 0 se a requisição pode ser feita ou o tempo até poder tentar novamente
+        :raises PagSeguroDeadlineExceeded: se a espera ultrapassar o prazo atual
+        """
+        return self.check_wait(self.bucket.try_acquire(self.get_reserve(endpoint)))
+
+    def acquire(self, endpoint):
+        """
+        Aguarda até que a requisição possa ser feita
+        """
+        wait = self.try_acquire(endpoint)
+        while wait:
+            time.sleep(wait)
+            wait = self.try_acquire(endpoint)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(email):
+    """
+    Obtém o limitador de requisições da conta
+    :rtype: RateLimiter|None
+    :return: o limitador ou None se o limite estiver desativado
+    """
+    rate = get_setting("PAGSEGURO_RATE_LIMIT_RATE")
+    if not rate:
+        return None
+
+    limiter = _limiters.get(email)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(email)
+            if limiter is None:
+                if get_setting("PAGSEGURO_RATE_LIMIT_MODE") == "database":
+                    bucket_class = DatabaseTokenBucket
+                else:
+                    bucket_class = TokenBucket
+                bucket = bucket_class(email, rate, get_setting("PAGSEGURO_RATE_LIMIT_BURST"))
+                limiter = _limiters[email] = RateLimiter(bucket)
+
+    return limiter
+
+
+def reset_rate_limiters():
+    with _limiters_lock:
+        _limiters.clear()
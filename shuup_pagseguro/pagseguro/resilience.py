@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+import random
+import threading
+import time
+
+from shuup_pagseguro.pagseguro.exceptions import PagSeguroUnavailable
+from shuup_pagseguro.settings import get_setting
+
+
+class RetryPolicy(object):
+    """
+    Política de novas tentativas de um endpoint, com espera exponencial
+    e jitter ("full jitter") entre as tentativas
+    """
+
+    def __init__(self, max_attempts=1, backoff=None, max_backoff=None):
+        self.max_attempts = max_attempts
+        self.backoff = (get_setting("PAGSEGURO_RETRY_BACKOFF") if backoff is None else backoff)
+        self.max_backoff = (get_setting("PAGSEGURO_RETRY_MAX_BACKOFF") if max_backoff is None else max_backoff)
+
+    @classmethod
+    def for_endpoint(cls, endpoint):
+        """
+        Somente endpoints idempotentes são repetidos; a criação de
+        transações (checkout) nunca é repetida automaticamente
+        :rtype: RetryPolicy
+        """
+        return cls(max_attempts=get_setting("PAGSEGURO_RETRY_MAX_ATTEMPTS").get(endpoint, 1))
+
+    def get_delay(self, attempt):
+        """
+        :param attempt: número da tentativa que falhou (a partir de 1)
+        :rtype: float
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** (attempt - 1))))
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker de um host
+
+    Após `failure_threshold` falhas consecutivas o circuito abre e as
+    requisições falham imediatamente com `PagSeguroUnavailable`. Passados
+    `reset_timeout` segundos, uma única requisição de teste é liberada:
+    se ela funcionar o circuito fecha, caso contrário volta a abrir.
+
+    Toda requisição liberada por `before_request` deve terminar com
+    `record_success`, `record_failure` ou `release`, ou o circuito
+    permaneceria indefinidamente aguardando a requisição de teste.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, host, failure_threshold=None, reset_timeout=None):
+        self.host = host
+        self.failure_threshold = (get_setting("PAGSEGURO_CIRCUIT_FAILURE_THRESHOLD")
+                                  if failure_threshold is None else failure_threshold)
+        self.reset_timeout = (get_setting("PAGSEGURO_CIRCUIT_RESET_TIMEOUT")
+                              if reset_timeout is None else reset_timeout)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """
+        :raises PagSeguroUnavailable: se o circuito estiver aberto
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            elapsed = time.time() - self.opened_at
+            if self.state == self.OPEN and elapsed >= self.reset_timeout:
+                # libera uma requisição de teste
+                self.state = self.HALF_OPEN
+                return
+
+            raise PagSeguroUnavailable(self.host, retry_after=max(self.reset_timeout - elapsed, 0))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+    def release(self):
+        """
+        Encerra uma requisição interrompida sem registrar o seu resultado:
+        se ela era a requisição de teste, a próxima requisição a substitui
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host):
+    """
+    :rtype: CircuitBreaker
+    """
+    breaker = _breakers.get(host)
+
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(host)
+            if breaker is None:
+                breaker = _breakers[host] = CircuitBreaker(host)
+
+    return breaker
+
+
+def reset_circuit_breakers():
+    with _breakers_lock:
+        _breakers.clear()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from django.contrib.auth import get_user_model
+from django.db.models import DecimalField, ExpressionWrapper, F
+
+from shuup.core.models import Order, OrderLine
+
+# relacionamentos do usuário com os documentos do cliente (CPF e CNPJ)
+DOCUMENT_RELATIONS = ("pf_person", "pj_person")
+
+
+def _is_cached(instance, field_name):
+    return hasattr(instance, instance._meta.get_field(field_name).get_cache_name())
+
+
+def get_document_relations():
+    """
+    Relacionamentos de documentos existentes no modelo de usuário
+    :rtype: list[str]
+    """
+    field_names = set(field.name for field in get_user_model()._meta.get_fields())
+    return [name for name in DOCUMENT_RELATIONS if name in field_names]
+
+
+def get_payable_lines_queryset():
+    """
+    Linhas com valor positivo, filtradas no banco de dados
+
+    O valor da linha sem impostos (preço unitário x quantidade - desconto)
+    é positivo exatamente quando o valor com impostos também é.
+
+    :rtype: django.db.models.QuerySet
+    """
+    line_price = ExpressionWrapper(
+        F("base_unit_price_value") * F("quantity") - F("discount_amount_value"),
+        output_field=DecimalField(max_digits=36, decimal_places=9)
+    )
+    return OrderLine.objects.annotate(line_price=line_price).filter(line_price__gt=0).prefetch_related("taxes")
+
+
+def load_payment_order(order):
+    """
+    Carrega os dados do pedido necessários para o pagamento
+
+    O endereço de entrega, o criador e os seus documentos são buscados
+    em uma única consulta (apenas os que ainda não estão carregados na
+    instância) e as linhas, com os seus impostos, em outras duas, seja
+    qual for a quantidade de linhas do pedido.
+
+    :type order: shuup.core.models.Order
+    :rtype: list[shuup.core.models.OrderLine]
+    :return: as linhas com valor positivo do pedido
+    """
+    missing = [name for name in ("shipping_address", "creator") if not _is_cached(order, name)]
+
+    if missing:
+        related = list(missing)
+        if "creator" in missing:
+            related.extend("creator__{0}".format(name) for name in get_document_relations())
+
+        loaded = Order.objects.select_related(*related).get(pk=order.pk)
+        for name in missing:
+            setattr(order, name, getattr(loaded, name))
+
+    lines = list(get_payable_lines_queryset().filter(order=order))
+    for line in lines:
+        line.order = order
+
+    return lines
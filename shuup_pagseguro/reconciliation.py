@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from datetime import timedelta
+import logging
+
+from django.db import transaction
+
+from shuup.core.models import Order
+from shuup_pagseguro.constants import PagSeguroTransactionStatus
+from shuup_pagseguro.models import PagSeguroPayment, PagSeguroReconciliationCheckpoint
+from shuup_pagseguro.pagseguro import PAGSEGURO_SEARCH_DATE_RESOLUTION, truncate_search_date
+from shuup_pagseguro.registry import get_pagseguro
+from shuup_pagseguro.scheduler import schedule_next_check
+from shuup_pagseguro.transitions import apply_status_changes, StatusChange
+
+logger = logging.getLogger(__name__)
+
+# estados em que o pedido já deveria possuir um pagamento no Shuup
+PAID_STATUSES = (PagSeguroTransactionStatus.Paid.value, PagSeguroTransactionStatus.Available.value)
+
+# quantidade máxima de códigos por consulta ao banco de dados
+LOOKUP_CHUNK_SIZE = 500
+
+
+class Drift(object):
+    """
+    Divergência entre uma transação do PagSeguro e os dados locais
+    """
+    MISSING_PAYMENT = "missing_payment"
+    STALE_STATUS = "stale_status"
+    MISSING_ORDER_PAYMENT = "missing_order_payment"
+
+    __slots__ = ("kind", "code", "reference", "local_status", "remote_status", "fixed")
+
+    def __init__(self, kind, code, reference=None, local_status=None, remote_status=None):
+        self.kind = kind
+        self.code = code
+        self.reference = reference
+        self.local_status = local_status
+        self.remote_status = remote_status
+        self.fixed = False
+
+    def __str__(self):
+        return "{0} {1} (reference: {2}, local: {3}, remote: {4}){5}".format(
+            self.kind, self.code, self.reference, self.local_status, self.remote_status,
+            (" [fixed]" if self.fixed else "")
+        )
+
+
+class Reconciler(object):
+    """
+    Concilia os pagamentos locais com as transações do PagSeguro
+
+    O período é percorrido em janelas de tempo. As transações de cada
+    janela são ordenadas pelo código e os pagamentos locais correspondentes
+    são lidos em lotes de `LOOKUP_CHUNK_SIZE` códigos, de modo que a
+    memória utilizada é limitada ao tamanho de uma janela. Ao fim de cada
+    janela o progresso é gravado, permitindo retomar a conciliação.
+    """
+
+    def __init__(self, shop, fix=False, window=timedelta(days=1)):
+        self.shop = shop
+        self.fix = fix
+        self.window = window
+        self.pagseguro = get_pagseguro(shop)
+
+    def get_checkpoint(self):
+        checkpoint = PagSeguroReconciliationCheckpoint.objects.filter(shop=self.shop).first()
+        return (checkpoint.window_end if checkpoint else None)
+
+    def save_checkpoint(self, window_end):
+        PagSeguroReconciliationCheckpoint.objects.update_or_create(
+            shop=self.shop, defaults={"window_end": window_end}
+        )
+
+    def reconcile(self, since, until, resume=False):
+        """
+        Concilia o período informado
+        :param resume: começa a partir da última janela conciliada, se houver
+        :rtype: collections.Iterable[Drift]
+        """
+        if resume:
+            since = max(since, self.get_checkpoint() or since)
+
+        window_start = since
+        while window_start < until:
+            window_end = min(window_start + self.window, until)
+
+            for drift in self.reconcile_window(window_start, window_end):
+                yield drift
+
+            self.save_checkpoint(window_end)
+            window_start = window_end
+
+    def reconcile_window(self, window_start, window_end):
+        """
+        Concilia as transações a partir de `window_start` e anteriores ao
+        minuto de `window_end`, que pertence à janela seguinte
+        :rtype: collections.Iterable[Drift]
+        """
+        remote = {}
+        search_end = truncate_search_date(window_end) - PAGSEGURO_SEARCH_DATE_RESOLUTION
+        for summary in self.pagseguro.search_transactions(window_start, search_end):
+            remote[summary["code"]] = summary
+
+        codes = sorted(remote)
+        for index in range(0, len(codes), LOOKUP_CHUNK_SIZE):
+            chunk = codes[index:index + LOOKUP_CHUNK_SIZE]
+            local_payments = self._get_local_payments(chunk)
+
+            for code in chunk:
+                payment = local_payments.get(code)
+                if payment is not None:
+                    for drift in self._compare(payment, remote[code]):
+                        yield drift
+                else:
+                    yield self._handle_missing_payment(remote[code])
+
+    def _get_local_payments(self, codes):
+        """
+        :rtype: dict[str,shuup_pagseguro.models.PagSeguroPayment]
+        """
+        queryset = PagSeguroPayment.objects.filter(code__in=codes).select_related("order")
+        return dict((payment.code, payment) for payment in queryset)
+
+    def _compare(self, payment, summary):
+        remote_status = int(summary["status"])
+
+        if payment.status != remote_status:
+            drift = Drift(Drift.STALE_STATUS, payment.code, summary.get("reference"), payment.status, remote_status)
+            if self.fix:
+                drift.fixed = self._fix_status(payment)
+            yield drift
+
+        if remote_status in PAID_STATUSES and payment.order.can_create_payment():
+            drift = Drift(Drift.MISSING_ORDER_PAYMENT, payment.code, summary.get("reference"),
+                          payment.status, remote_status)
+            if self.fix:
+                drift.fixed = self._fix_order_payment(payment)
+            yield drift
+
+    def _handle_missing_payment(self, summary):
+        drift = Drift(Drift.MISSING_PAYMENT, summary["code"], summary.get("reference"),
+                      remote_status=int(summary["status"]))
+
+        if self.fix and summary.get("reference"):
+            order = Order.objects.filter(shop=self.shop, identifier=summary["reference"]).first()
+            if order:
+                payment = PagSeguroPayment(order=order, code=summary["code"])
+                drift.fixed = self._fix_status(payment)
+
+                if drift.fixed and payment.status in PAID_STATUSES:
+                    self._fix_order_payment(payment)
+
+        return drift
+
+    def _fix_status(self, payment):
+        """
+        Atualiza o pagamento com os dados da transação no PagSeguro
+
+        A consulta ao PagSeguro é feita fora da transação do banco de dados.
+        Em seguida, o pagamento é bloqueado e o seu estado relido: se ele foi
+        alterado nesse meio tempo (por exemplo, por uma notificação), a
+        correção é descartada.
+
+        :rtype: bool
+        """
+        try:
+            transaction_info = self.pagseguro.get_transaction_info(payment.code)
+
+            with transaction.atomic():
+                old_status = payment.status
+                if payment.pk:
+                    current_status = PagSeguroPayment.objects.select_for_update().filter(
+                        pk=payment.pk
+                    ).values_list("status", flat=True).first()
+                    if current_status != old_status:
+                        logger.info("PagSeguro payment %s changed during reconciliation", payment.code)
+                        return False
+
+                changed_fields = payment.set_data(transaction_info)
+                schedule_next_check(payment, changed=True)
+                payment.save_changes(changed_fields)
+
+                if old_status != payment.status:
+                    payment.add_event(old_status)
+                if old_status and payment.status and old_status != payment.status:
+                    apply_status_changes([StatusChange(payment, old_status, payment.status)])
+            return True
+        except Exception:
+            logger.exception("PagSeguro reconciliation exception")
+            return False
+
+    def _fix_order_payment(self, payment):
+        with transaction.atomic():
+            order = Order.objects.select_for_update().get(pk=payment.order_id)
+            if order.can_create_payment():
+                order.create_payment(order.get_total_unpaid_amount(), payment.code)
+                return True
+        return False
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import time
+
+from django.db import transaction
+from django.utils.timezone import now
+
+from shuup_pagseguro.constants import PagSeguroFinalTransactionStatuses
+from shuup_pagseguro.models import PagSeguroPayment
+from shuup_pagseguro.pagseguro import deadline
+from shuup_pagseguro.registry import get_pagseguro
+from shuup_pagseguro.scheduler import schedule_next_check
+from shuup_pagseguro.settings import get_setting
+from shuup_pagseguro.transitions import StatusChange, StatusChangeProcessor
+from shuup_pagseguro.utils import TRANSACTION_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def get_stale_payments(shop=None, older_than=None, statuses=None):
+    """
+    Seleciona os pagamentos em estados não finais que precisam ser atualizados
+
+    :param older_than: tempo mínimo desde a última atualização
+    :type older_than: datetime.timedelta|None
+    :param statuses: estados a considerar (por padrão, todos os não finais)
+    :type statuses: list[int]|None
+    :rtype: django.db.models.QuerySet
+    """
+    queryset = PagSeguroPayment.objects.all()
+
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    else:
+        queryset = queryset.exclude(status__in=[status.value for status in PagSeguroFinalTransactionStatuses])
+
+    if shop:
+        queryset = queryset.filter(order__shop=shop)
+
+    if older_than:
+        queryset = queryset.filter(last_update__lt=(now() - older_than))
+
+    return queryset
+
+
+class RefreshStats(object):
+    def __init__(self):
+        self.selected = 0
+        self.refreshed = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.errors = 0
+        self.started_at = time.time()
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started_at
+
+    @property
+    def rate(self):
+        return (self.selected / self.elapsed if self.elapsed else 0)
+
+    def __str__(self):
+        return ("Selected: {0.selected}, refreshed: {0.refreshed}, changed: {0.changed}, "
+                "unchanged: {0.unchanged}, errors: {0.errors}, "
+                "elapsed: {0.elapsed:.2f}s ({0.rate:.1f} payments/s)").format(self)
+
+
+def _fetch_transaction(args):
+    pagseguro, code = args
+    try:
+        with deadline(get_setting("PAGSEGURO_DEADLINES")["refresh"]):
+            return pagseguro.get_transaction_info(code)
+    except Exception as exc:
+        logger.warning("PagSeguro refresh exception for transaction %s: %s", code, exc)
+        return exc
+
+
+def refresh_payments(queryset, concurrency=8, batch_size=100, dry_run=False, stats=None):
+    """
+    Atualiza os pagamentos consultando o PagSeguro em paralelo
+
+    As consultas são feitas por um pool limitado de threads, enquanto a
+    gravação dos resultados é feita pela thread atual, em uma transação
+    por lote de `batch_size` pagamentos. As mudanças de estado aplicam
+    ao pedido as ações da tabela de transições, assim como as notificações.
+
+    :type queryset: django.db.models.QuerySet
+    :rtype: RefreshStats
+    """
+    stats = stats or RefreshStats()
+    last_pk = 0
+    processor = StatusChangeProcessor()
+    queryset = (queryset.select_related("order")
+                .only("pk", "code", "data", "last_update", "next_check", "check_interval", "order__shop",
+                      *TRANSACTION_FIELDS)
+                .order_by("pk"))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            payments = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not payments:
+                break
+
+            last_pk = payments[-1].pk
+            stats.selected += len(payments)
+
+            if dry_run:
+                continue
+
+            jobs = [(get_pagseguro(payment.order.shop_id), payment.code) for payment in payments]
+            results = list(executor.map(_fetch_transaction, jobs))
+
+            with transaction.atomic():
+                changes = []
+                for payment, result in zip(payments, results):
+                    if isinstance(result, Exception):
+                        stats.errors += 1
+                        continue
+
+                    old_state = (payment.status, payment.last_event_date)
+                    changed_fields = payment.set_data(result)
+                    changed = ((payment.status, payment.last_event_date) != old_state)
+                    schedule_next_check(payment, changed)
+                    payment.save_changes(changed_fields)
+                    if payment.status != old_state[0]:
+                        payment.add_event(old_state[0])
+                        if old_state[0] and payment.status:
+                            changes.append(StatusChange(payment, old_state[0], payment.status))
+
+                    stats.refreshed += 1
+                    if not changed_fields:
+                        stats.unchanged += 1
+                    if changed:
+                        stats.changed += 1
+
+                processor.process(changes)
+
+    return stats
+
+
+def parse_age(value):
+    """
+    Converte uma idade como `30m`, `6h` ou `2d` em timedelta
+    :rtype: datetime.timedelta
+    """
+    units = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+    value = value.strip().lower()
+
+    if value and value[-1] in units:
+        return timedelta(**{units[value[-1]]: int(value[:-1])})
+
+    return timedelta(minutes=int(value))
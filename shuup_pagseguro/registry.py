@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from shuup_pagseguro.pagseguro import PagSeguro
+from shuup_pagseguro.settings import get_setting
+
+
+class PagSeguroRegistryEntry(object):
+    __slots__ = ("config", "client", "loaded_at")
+
+    def __init__(self, config, client, loaded_at):
+        self.config = config
+        self.client = client
+        self.loaded_at = loaded_at
+
+
+class PagSeguroRegistry(object):
+    """
+    Registro, por loja, das configurações do PagSeguro e de seus clientes
+
+    As entradas são carregadas sob demanda e invalidadas pelos sinais de
+    alteração e exclusão de `PagSeguroConfig`. Como os sinais só alcançam
+    o processo atual, as entradas também expiram após
+    `PAGSEGURO_REGISTRY_TTL` segundos para que outros processos
+    enxerguem as alterações.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _get_entry(self, shop):
+        shop_id = getattr(shop, "pk", shop)
+        entry = self._entries.get(shop_id)
+
+        if entry is None or self._is_expired(entry):
+            with self._lock:
+                entry = self._entries.get(shop_id)
+                if entry is None or self._is_expired(entry):
+                    entry = self._entries[shop_id] = self._load(shop_id)
+
+        return entry
+
+    def _is_expired(self, entry):
+        ttl = get_setting("PAGSEGURO_REGISTRY_TTL")
+        return bool(ttl) and (time.time() - entry.loaded_at) > ttl
+
+    def _load(self, shop_id):
+        from shuup_pagseguro.models import PagSeguroConfig
+        config = PagSeguroConfig.objects.get(shop_id=shop_id)
+        return PagSeguroRegistryEntry(config, PagSeguro.create_from_config(config), time.time())
+
+    def get_config(self, shop):
+        """
+        Obtém a configuração do PagSeguro da loja
+        :type shop: shuup.core.models.Shop|int
+        :rtype: shuup_pagseguro.models.PagSeguroConfig
+        """
+        return self._get_entry(shop).config
+
+    def get_client(self, shop):
+        """
+        Obtém o cliente do PagSeguro da loja
+        :type shop: shuup.core.models.Shop|int
+        :rtype: shuup_pagseguro.pagseguro.PagSeguro
+        """
+        return self._get_entry(shop).client
+
+    def invalidate(self, shop):
+        shop_id = getattr(shop, "pk", shop)
+        with self._lock:
+            self._entries.pop(shop_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+registry = PagSeguroRegistry()
+
+
+def get_pagseguro_config(shop):
+    return registry.get_config(shop)
+
+
+def get_pagseguro(shop):
+    return registry.get_client(shop)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.utils.timezone import now
+
+from shuup_pagseguro.constants import PagSeguroFinalTransactionStatuses
+from shuup_pagseguro.settings import get_setting
+
+FINAL_STATUSES = set(status.value for status in PagSeguroFinalTransactionStatuses)
+
+
+def get_check_interval(payment, changed, current_time=None):
+    """
+    Calcula o intervalo, em segundos, até a próxima consulta da transação
+
+    O intervalo parte do valor base do estado da transação e é multiplicado
+    a cada consulta sem alterações, voltando ao valor base quando a
+    transação muda. Transações paradas há muito tempo nunca são consultadas
+    com frequência maior que uma fração do tempo desde o seu último evento.
+
+    :type payment: shuup_pagseguro.models.PagSeguroPayment
+    :param changed: se a última consulta trouxe alterações
+    :rtype: int|None
+    :return: o intervalo ou None caso a transação não precise mais ser consultada
+    """
+    current_time = current_time or now()
+    intervals = get_setting("PAGSEGURO_CHECK_INTERVALS")
+    max_interval = get_setting("PAGSEGURO_CHECK_MAX_INTERVAL")
+    base_interval = intervals.get(payment.status, min(intervals.values()))
+    age = ((current_time - payment.last_event_date).total_seconds() if payment.last_event_date else 0)
+
+    if payment.status in FINAL_STATUSES and age > get_setting("PAGSEGURO_CHECK_MAX_AGE"):
+        return None
+
+    if changed or not payment.check_interval:
+        interval = base_interval
+    else:
+        interval = payment.check_interval * get_setting("PAGSEGURO_CHECK_BACKOFF")
+
+    interval = max(interval, age * get_setting("PAGSEGURO_CHECK_AGE_FACTOR"))
+    return int(min(interval, max_interval))
+
+
+# campos de `PagSeguroPayment` alterados por `schedule_next_check`
+SCHEDULE_FIELDS = ("next_check", "check_interval")
+
+
+def schedule_next_check(payment, changed, current_time=None):
+    """
+    Define quando a transação do pagamento deve ser consultada novamente
+    (não salva o pagamento)
+    :type payment: shuup_pagseguro.models.PagSeguroPayment
+    """
+    current_time = current_time or now()
+    interval = get_check_interval(payment, changed, current_time)
+
+    if interval is None:
+        payment.check_interval = 0
+        payment.next_check = None
+    else:
+        payment.check_interval = interval
+        payment.next_check = current_time + timedelta(seconds=interval)
+
+
+def get_due_payments(shop=None, current_time=None):
+    """
+    Seleciona os pagamentos cuja consulta está vencida, dos mais atrasados
+    para os mais recentes
+    :rtype: django.db.models.QuerySet
+    """
+    from shuup_pagseguro.models import PagSeguroPayment
+    queryset = PagSeguroPayment.objects.filter(next_check__lte=(current_time or now()))
+
+    if shop:
+        queryset = queryset.filter(order__shop=shop)
+
+    return queryset.order_by("next_check")
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from collections import deque
+import logging
+import threading
+import time
+
+from shuup_pagseguro.pagseguro import deadline
+from shuup_pagseguro.pagseguro.ratelimit import BACKGROUND, request_priority
+from shuup_pagseguro.registry import get_pagseguro
+from shuup_pagseguro.settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+class SessionIdPool(object):
+    """
+    Pool de IDs de sessão do PagSeguro pré-obtidos para uma loja
+
+    Cada ID é entregue a um único checkout. Sempre que o pool fica abaixo
+    do tamanho configurado, uma thread em segundo plano busca novos IDs,
+    de modo que a fase de pagamento só precisa aguardar o PagSeguro
+    quando o pool está vazio.
+
+    IDs que expiram em menos de `margin` segundos não são mais entregues:
+    o checkout que recebe um ID precisa de tempo para concluir o pagamento.
+    Esses IDs são substituídos por `maintain()`, chamado periodicamente
+    (ver `start_session_id_pool_maintainer`) enquanto o pool estiver em uso.
+    Os novos IDs são obtidos com a prioridade das tarefas em segundo plano,
+    preservando a reserva do limite de requisições para o checkout.
+    """
+
+    def __init__(self, shop_id, size=None, ttl=None, margin=None):
+        self.shop_id = shop_id
+        self.size = (get_setting("PAGSEGURO_SESSION_POOL_SIZE") if size is None else size)
+        self.ttl = (get_setting("PAGSEGURO_SESSION_TTL") if ttl is None else ttl)
+        self.margin = (get_setting("PAGSEGURO_SESSION_REFRESH_MARGIN") if margin is None else margin)
+        self._ids = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+        self.last_used = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def acquire(self):
+        """
+        Retira um ID de sessão válido do pool
+        :rtype: tuple[str,float]
+        :return: ID da sessão e o instante em que ele expira
+        """
+        pagseguro = get_pagseguro(self.shop_id)
+        entry = None
+
+        with self._lock:
+            self.last_used = time.time()
+            min_expires = time.time() + self.margin
+            while self._ids:
+                entry = self._ids.popleft()
+                if entry[1] > min_expires:
+                    break
+                entry = None
+
+        self.refill_async(pagseguro)
+        return (entry or self._fetch(pagseguro))
+
+    def _fetch(self, pagseguro):
+        return (pagseguro.get_session_id(), time.time() + self.ttl)
+
+    def refill(self, pagseguro):
+        """
+        Completa o pool com novos IDs de sessão
+        """
+        try:
+            with request_priority(BACKGROUND):
+                while len(self._ids) < self.size:
+                    entry = self._fetch(pagseguro)
+                    with self._lock:
+                        self._ids.append(entry)
+        except Exception:
+            logger.exception("PagSeguro session pool refill exception")
+        finally:
+            self._refilling = False
+
+    def prune(self):
+        """
+        Descarta os IDs que expiram dentro da margem de renovação
+        :rtype: int
+        :return: quantidade de IDs descartados
+        """
+        with self._lock:
+            min_expires = time.time() + self.margin
+            valid = [entry for entry in self._ids if entry[1] > min_expires]
+            pruned = len(self._ids) - len(valid)
+            self._ids = deque(valid)
+        return pruned
+
+    def is_idle(self, idle_timeout):
+        """
+        :return: se o pool não é usado há mais de `idle_timeout` segundos
+        :rtype: bool
+        """
+        return (self.last_used is None or time.time() - self.last_used > idle_timeout)
+
+    def maintain(self, idle_timeout=None):
+        """
+        Substitui os IDs próximos de expirar e completa o pool, se ele
+        foi usado nos últimos `idle_timeout` segundos
+        """
+        if idle_timeout is None:
+            idle_timeout = get_setting("PAGSEGURO_SESSION_POOL_IDLE_TIMEOUT")
+
+        self.prune()
+        with self._lock:
+            if self._refilling or len(self._ids) >= self.size or self.is_idle(idle_timeout):
+                return
+            self._refilling = True
+        self.refill(get_pagseguro(self.shop_id))
+
+    def refill_async(self, pagseguro):
+        with self._lock:
+            if self._refilling or len(self._ids) >= self.size:
+                return
+            self._refilling = True
+
+        thread = threading.Thread(target=self.refill, args=(pagseguro,), name="pagseguro-session-pool")
+        thread.daemon = True
+        thread.start()
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_session_id_pool(shop):
+    """
+    :type shop: shuup.core.models.Shop|int
+    :rtype: SessionIdPool
+    """
+    shop_id = getattr(shop, "pk", shop)
+    pool = _pools.get(shop_id)
+
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(shop_id)
+            if pool is None:
+                pool = _pools[shop_id] = SessionIdPool(shop_id)
+
+    return pool
+
+
+def invalidate_session_id_pool(shop):
+    shop_id = getattr(shop, "pk", shop)
+    with _pools_lock:
+        pool = _pools.pop(shop_id, None)
+    if pool:
+        pool.clear()
+
+
+def maintain_session_id_pools():
+    """
+    Renova os pools do processo que foram usados recentemente
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+
+    for pool in pools:
+        try:
+            pool.maintain()
+        except Exception:
+            logger.exception("PagSeguro session pool maintenance exception")
+
+
+_maintainer = None
+_maintainer_lock = threading.Lock()
+
+
+def _run_maintainer(interval):
+    from django.db import close_old_connections
+
+    while True:
+        try:
+            maintain_session_id_pools()
+        except Exception:
+            logger.exception("PagSeguro session pool maintenance exception")
+        finally:
+            close_old_connections()
+        time.sleep(interval)
+
+
+def start_session_id_pool_maintainer():
+    """
+    Inicia, uma única vez por processo, a thread que mantém os pools em uso
+    completos e substitui os IDs antes que eles expirem
+
+    Não faz nada se o pool estiver desativado ou se o setting
+    `PAGSEGURO_SESSION_POOL_MAINTAIN_INTERVAL` for 0.
+
+    :rtype: bool
+    :return: se a thread foi iniciada nesta chamada
+    """
+    global _maintainer
+
+    interval = get_setting("PAGSEGURO_SESSION_POOL_MAINTAIN_INTERVAL")
+    if _maintainer is not None or not interval or not get_setting("PAGSEGURO_SESSION_POOL_SIZE"):
+        return False
+
+    with _maintainer_lock:
+        if _maintainer is not None:
+            return False
+        _maintainer = threading.Thread(target=_run_maintainer, args=(interval,),
+                                       name="pagseguro-session-pool-maintainer")
+        _maintainer.daemon = True
+        _maintainer.start()
+
+    return True
+
+
+def get_session_id(shop, storage=None):
+    """
+    Obtém um ID de sessão para um checkout
+
+    Reutiliza o ID já guardado no `storage` da fase de checkout enquanto
+    ele for válido, evitando consumir um novo ID a cada exibição da página.
+
+    :type shop: shuup.core.models.Shop|int
+    :type storage: shuup.front.checkout.CheckoutPhaseStorage|None
+    :rtype: str
+    """
+    if storage is not None:
+        stored = storage.get("ps_session")
+        if stored and stored["expires"] - get_setting("PAGSEGURO_SESSION_REFRESH_MARGIN") > time.time():
+            return stored["id"]
+
+    with deadline(get_setting("PAGSEGURO_DEADLINES")["checkout_phase"]):
+        if get_setting("PAGSEGURO_SESSION_POOL_SIZE"):
+            session_id, expires = get_session_id_pool(shop).acquire()
+        else:
+            session_id = get_pagseguro(shop).get_session_id()
+            expires = time.time() + get_setting("PAGSEGURO_SESSION_TTL")
+
+    if storage is not None:
+        storage.set("ps_session", {"id": session_id, "expires": expires})
+
+    return session_id
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from django.conf import settings
+
+DEFAULTS = {
+    # Número de pools de conexão mantidos por sessão HTTP (um por host)
+    "PAGSEGURO_HTTP_POOL_CONNECTIONS": 2,
+
+    # Número máximo de conexões mantidas abertas por host
+    "PAGSEGURO_HTTP_POOL_MAXSIZE": 10,
+
+    # Mantém as conexões abertas entre as requisições (HTTP keep-alive)
+    "PAGSEGURO_HTTP_KEEP_ALIVE": True,
+
+    # Número máximo de conexões simultâneas do cliente assíncrono
+    # (compartilhadas entre todos os hosts)
+    "PAGSEGURO_ASYNC_POOL_LIMIT": 100,
+
+    # Tempo, em segundos, que a resposta de uma consulta de transação é
+    # reaproveitada por consultas seguintes (0 desativa o cache). O cache é
+    # descartado quando uma notificação da transação é processada.
+    "PAGSEGURO_TRANSACTION_CACHE_TTL": 0,
+
+    # Número máximo de transações mantidas no cache
+    "PAGSEGURO_TRANSACTION_CACHE_SIZE": 1000,
+
+    # Limite de requisições por conta do PagSeguro, em requisições por
+    # segundo (0 desativa o limite), e o número de requisições que podem
+    # ser feitas de uma só vez
+    "PAGSEGURO_RATE_LIMIT_RATE": 0,
+    "PAGSEGURO_RATE_LIMIT_BURST": 10,
+
+    # "local" mantém o limite na memória de cada processo; "database"
+    # compartilha o mesmo limite entre todos os processos e servidores
+    "PAGSEGURO_RATE_LIMIT_MODE": "local",
+
+    # Classe de prioridade de cada endpoint do PagSeguro
+    "PAGSEGURO_RATE_LIMIT_PRIORITIES": {
+        "checkout": "checkout",
+        "session": "checkout",
+        "notification": "notification",
+        "transaction": "background",
+        "search": "background",
+    },
+
+    # Fração da capacidade reservada às classes de maior prioridade: as
+    # tarefas em segundo plano nunca consomem a metade do limite, que fica
+    # disponível para o checkout e para as notificações
+    "PAGSEGURO_RATE_LIMIT_RESERVES": {
+        "checkout": 0,
+        "notification": 0.2,
+        "background": 0.5,
+    },
+
+    # URL base de cada família de endpoints do PagSeguro (checkout, session,
+    # transaction, notification, search; "default" vale para todas), por
+    # exemplo para utilizar um servidor local ou um proxy. Vazio utiliza as
+    # URLs oficiais. A configuração de cada loja tem precedência.
+    "PAGSEGURO_BASE_URLS": {},
+
+    # Timeouts de conexão e de leitura, em segundos, de cada endpoint do
+    # PagSeguro. Podem ser sobrescritos por loja em PagSeguroConfig.
+    "PAGSEGURO_TIMEOUTS": {
+        "session": (3.05, 10),
+        "notification": (3.05, 20),
+        "transaction": (3.05, 20),
+        "search": (3.05, 30),
+        "checkout": (3.05, 30),
+    },
+
+    # Tempo total, em segundos, disponível para as requisições ao PagSeguro
+    # de cada operação, incluindo novas tentativas
+    "PAGSEGURO_DEADLINES": {
+        "checkout_phase": 10,
+        "payment": 40,
+        "notification": 60,
+        "refresh": 30,
+    },
+
+    # Ações aplicadas ao pedido em cada mudança de estado da transação,
+    # como [estado anterior, novo estado, [ações]] ("*" vale para qualquer
+    # estado). Ações: "cancel" cancela o pedido e "pay" registra o seu
+    # pagamento. Pode ser sobrescrito por loja em PagSeguroConfig.
+    "PAGSEGURO_STATUS_TRANSITIONS": [
+        ["*", 7, ["cancel"]],
+        ["*", 3, ["pay"]],
+    ],
+
+    # Número máximo de tentativas de cada endpoint do PagSeguro. Somente
+    # endpoints idempotentes devem ser repetidos: o checkout cria uma nova
+    # transação a cada requisição e por isso nunca é repetido.
+    "PAGSEGURO_RETRY_MAX_ATTEMPTS": {
+        "session": 3,
+        "notification": 3,
+        "transaction": 3,
+        "search": 3,
+        "checkout": 1,
+    },
+
+    # Espera base e máxima, em segundos, entre as tentativas
+    "PAGSEGURO_RETRY_BACKOFF": 0.2,
+    "PAGSEGURO_RETRY_MAX_BACKOFF": 2,
+
+    # Falhas consecutivas (erros 5xx ou de conexão) que abrem o circuito de um host
+    "PAGSEGURO_CIRCUIT_FAILURE_THRESHOLD": 5,
+
+    # Tempo, em segundos, que o circuito permanece aberto antes de uma nova tentativa
+    "PAGSEGURO_CIRCUIT_RESET_TIMEOUT": 30,
+
+    # Tempo máximo, em segundos, que uma configuração permanece no registro
+    # de lojas antes de ser recarregada do banco de dados (0 desativa)
+    "PAGSEGURO_REGISTRY_TTL": 300,
+
+    # Quantidade de IDs de sessão pré-obtidos mantidos por loja (0 desativa o pool)
+    "PAGSEGURO_SESSION_POOL_SIZE": 5,
+
+    # Tempo, em segundos, durante o qual um ID de sessão é considerado válido
+    "PAGSEGURO_SESSION_TTL": 600,
+
+    # IDs de sessão do pool que expiram em menos deste tempo, em segundos,
+    # não são mais entregues aos checkouts e são substituídos
+    "PAGSEGURO_SESSION_REFRESH_MARGIN": 120,
+
+    # Intervalo, em segundos, com que os pools de IDs de sessão em uso são
+    # completados e renovados em segundo plano, a partir da primeira
+    # requisição de cada processo (0 desativa; o pool é então preenchido
+    # apenas nos checkouts)
+    "PAGSEGURO_SESSION_POOL_MAINTAIN_INTERVAL": 60,
+
+    # Pools não usados por nenhum checkout há mais deste tempo, em segundos,
+    # deixam de ser renovados em segundo plano
+    "PAGSEGURO_SESSION_POOL_IDLE_TIMEOUT": 1800,
+
+    # Número máximo de tentativas de processar uma notificação
+    "PAGSEGURO_NOTIFICATION_MAX_ATTEMPTS": 10,
+
+    # Intervalo base, em segundos, entre as tentativas (dobra a cada falha)
+    "PAGSEGURO_NOTIFICATION_RETRY_DELAY": 30,
+
+    # Tempo, em segundos, que um worker detém uma notificação antes que
+    # ela possa ser retomada por outro (caso o primeiro tenha morrido)
+    "PAGSEGURO_NOTIFICATION_LEASE": 300,
+
+    # Envia os eventos de mudança de estado ao Shuup Notify pelo comando
+    # `pagseguro_dispatch_events` em vez de logo após a confirmação da
+    # transação que gravou a mudança. As tentativas e a reserva dos eventos seguem as
+    # configurações das notificações acima. Ao ativar, o comando deve ser
+    # executado continuamente (`--loop`), ou os eventos não serão enviados.
+    "PAGSEGURO_DEFER_EVENTS": False,
+
+    # Tempo, em segundos, que o evento de um pedido aguarda antes de ser
+    # enviado: mudanças seguintes do mesmo pedido nesse intervalo são
+    # agrupadas em um único evento (do primeiro ao último estado)
+    "PAGSEGURO_EVENT_COALESCE_WINDOW": 60,
+
+    # Quantidade de códigos de notificação recentes mantidos em memória
+    # para descartar notificações repetidas sem consultar o banco de dados
+    "PAGSEGURO_NOTIFICATION_DEDUP_CACHE_SIZE": 10000,
+
+    # Intervalo base, em segundos, entre as consultas de uma transação,
+    # de acordo com o seu estado (PagSeguroTransactionStatus.value)
+    "PAGSEGURO_CHECK_INTERVALS": {
+        1: 15 * 60,             # WaitingPayment
+        2: 10 * 60,             # InAnalysis
+        3: 6 * 60 * 60,         # Paid
+        4: 7 * 24 * 60 * 60,    # Available
+        5: 6 * 60 * 60,         # InDispute
+        6: 30 * 24 * 60 * 60,   # Refunded
+        7: 30 * 24 * 60 * 60,   # Canceled
+        8: 30 * 24 * 60 * 60,   # Debited
+        9: 6 * 60 * 60,         # TempRetention
+    },
+
+    # Intervalo máximo, em segundos, entre as consultas de uma transação
+    "PAGSEGURO_CHECK_MAX_INTERVAL": 30 * 24 * 60 * 60,
+
+    # Fator de multiplicação do intervalo quando a transação não mudou
+    "PAGSEGURO_CHECK_BACKOFF": 2,
+
+    # Fração do tempo desde o último evento da transação usada como
+    # intervalo mínimo entre as consultas (transações antigas são
+    # consultadas com menos frequência)
+    "PAGSEGURO_CHECK_AGE_FACTOR": 0.1,
+
+    # Idade, em segundos, a partir da qual transações em estado final
+    # deixam de ser consultadas
+    "PAGSEGURO_CHECK_MAX_AGE": 180 * 24 * 60 * 60,
+}
+
+
+def get_setting(name):
+    """
+    Obtém uma configuração do add-on, permitindo sobrescrevê-la
+    através do settings do Django
+    """
+    return getattr(settings, name, DEFAULTS[name])
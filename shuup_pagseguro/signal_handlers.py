@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from shuup_pagseguro.models import PagSeguroConfig
+from shuup_pagseguro.registry import registry
+from shuup_pagseguro.session_pool import invalidate_session_id_pool, start_session_id_pool_maintainer
+
+
+@receiver(post_save, sender=PagSeguroConfig, dispatch_uid="pagseguro_config_saved")
+@receiver(post_delete, sender=PagSeguroConfig, dispatch_uid="pagseguro_config_deleted")
+def invalidate_pagseguro_config(sender, instance, **kwargs):
+    registry.invalidate(instance.shop_id)
+    invalidate_session_id_pool(instance.shop_id)
+
+
+@receiver(request_started, dispatch_uid="pagseguro_start_session_pool_maintainer")
+def start_session_pool_maintainer(sender, **kwargs):
+    # iniciado na primeira requisição: apenas processos que atendem
+    # checkouts mantêm os pools (e não comandos como `migrate`)
+    start_session_id_pool_maintainer()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Máquina de estados das transações do PagSeguro
+
+A tabela de transições indica as ações aplicadas ao pedido em cada mudança
+de estado da transação. Cada regra é uma lista `[estado anterior, novo
+estado, [ações]]`, onde `"*"` vale para qualquer estado, por exemplo:
+
+    PAGSEGURO_STATUS_TRANSITIONS = [
+        ["*", 7, ["cancel"]],
+        ["*", 3, ["pay"]],
+        [3, 6, []],
+    ]
+
+A regra mais específica prevalece: (anterior, novo), ("*", novo),
+(anterior, "*") e, por fim, ("*", "*").
+"""
+from __future__ import unicode_literals
+
+from django.db import transaction
+import six
+
+from shuup.core.models import Order
+from shuup_pagseguro.events import queue_status_changed_event
+from shuup_pagseguro.registry import get_pagseguro_config
+from shuup_pagseguro.settings import get_setting
+
+ANY = "*"
+
+
+def cancel_order(payment):
+    if payment.order.can_set_canceled():
+        payment.order.set_canceled()
+
+
+def create_order_payment(payment):
+    if payment.order.can_create_payment():
+        payment.order.create_payment(payment.order.get_total_unpaid_amount(), payment.code)
+
+
+# ações disponíveis para a tabela de transições
+ACTIONS = {
+    "cancel": cancel_order,
+    "pay": create_order_payment,
+}
+
+
+def _parse_status(value):
+    return (ANY if value == ANY else int(value))
+
+
+class TransitionTable(object):
+    """
+    Tabela de transições de estado de uma loja
+    """
+
+    def __init__(self, rules):
+        """
+        :param rules: lista de regras `[estado anterior, novo estado, [ações]]`
+        :raises ValueError: se uma regra for inválida ou usar uma ação desconhecida
+        """
+        self._rules = {}
+
+        for rule in rules:
+            old_status, new_status, actions = rule
+            for action in actions:
+                if action not in ACTIONS:
+                    raise ValueError("Unknown PagSeguro transition action: {0}".format(action))
+            self._rules[(_parse_status(old_status), _parse_status(new_status))] = list(actions)
+
+    def get_actions(self, old_status, new_status):
+        """
+        :rtype: list[str]
+        """
+        for key in ((old_status, new_status), (ANY, new_status), (old_status, ANY), (ANY, ANY)):
+            actions = self._rules.get(key)
+            if actions is not None:
+                return actions
+        return []
+
+
+def get_transition_table(shop):
+    """
+    Tabela de transições da loja (da configuração do PagSeguro da loja ou,
+    se não houver, do setting `PAGSEGURO_STATUS_TRANSITIONS`)
+    :type shop: shuup.core.models.Shop|int
+    :rtype: TransitionTable
+    """
+    rules = get_pagseguro_config(shop).status_transitions
+    return TransitionTable(get_setting("PAGSEGURO_STATUS_TRANSITIONS") if rules is None else rules)
+
+
+class StatusChange(object):
+    __slots__ = ("payment", "old_status", "new_status")
+
+    def __init__(self, payment, old_status, new_status):
+        self.payment = payment
+        self.old_status = old_status
+        self.new_status = new_status
+
+
+class StatusChangeProcessor(object):
+    """
+    Aplica a tabela de transições a um lote de pagamentos
+
+    Os pedidos do lote são bloqueados (`select_for_update`) em uma única
+    consulta, na ordem da chave primária: workers simultâneos sempre
+    bloqueiam os pedidos na mesma ordem, sem risco de deadlock, e cada
+    ação verifica o estado do pedido já bloqueado, de forma que os seus
+    efeitos são aplicados uma única vez.
+    """
+
+    def __init__(self):
+        self._tables = {}
+
+    def get_table(self, shop_id):
+        table = self._tables.get(shop_id)
+        if table is None:
+            table = self._tables[shop_id] = get_transition_table(shop_id)
+        return table
+
+    def lock_orders(self, payments):
+        """
+        Bloqueia os pedidos dos pagamentos (deve ser chamado dentro de uma transação)
+        :type payments: list[shuup_pagseguro.models.PagSeguroPayment]
+        """
+        order_ids = sorted(set(payment.order_id for payment in payments))
+        orders = dict((order.pk, order) for order in
+                      Order.objects.select_for_update().filter(pk__in=order_ids).order_by("pk"))
+
+        for payment in payments:
+            payment.order = orders[payment.order_id]
+
+    def apply(self, change):
+        """
+        Aplica ao pedido as ações da mudança de estado e enfileira o evento
+        correspondente do Shuup Notify
+        :type change: StatusChange
+        """
+        payment = change.payment
+        for action in self.get_table(payment.order.shop_id).get_actions(change.old_status, change.new_status):
+            ACTIONS[action](payment)
+
+        queue_status_changed_event(payment.order, change.old_status, change.new_status)
+
+    def process(self, changes):
+        """
+        Aplica as mudanças de estado em uma única transação
+        :type changes: list[StatusChange]
+        """
+        if not changes:
+            return
+
+        with transaction.atomic():
+            self.lock_orders([change.payment for change in changes])
+            for change in changes:
+                self.apply(change)
+
+
+def apply_status_changes(changes):
+    """
+    :type changes: list[StatusChange]
+    """
+    StatusChangeProcessor().process(changes)
+
+
+def validate_transition_rules(rules):
+    """
+    :raises ValueError: se as regras forem inválidas
+    """
+    if not isinstance(rules, (list, tuple)):
+        raise ValueError("The transition rules must be a list")
+
+    for rule in rules:
+        if not isinstance(rule, (list, tuple)) or len(rule) != 3 or isinstance(rule[2], six.string_types):
+            raise ValueError("Invalid transition rule: {0}".format(rule))
+
+    TransitionTable(rules)
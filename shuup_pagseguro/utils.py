@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from decimal import Decimal
+import threading
+
+import iso8601
+
+
+class LRUCache(object):
+    """
+    Cache limitado que descarta os itens usados há mais tempo,
+    seguro para uso entre threads
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return True
+            return False
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+            return default
+
+    def set(self, key, value=True):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# colunas de `PagSeguroPayment` extraídas dos dados da transação
+TRANSACTION_FIELDS = (
+    "status", "reference", "last_event_date", "payment_method_code", "gross_amount", "fee_amount", "net_amount"
+)
+
+
+def extract_transaction_fields(data):
+    """
+    Extrai dos dados de uma transação (como retornados pelo PagSeguro)
+    os valores das colunas indexadas de `PagSeguroPayment`
+    :type data: dict|None
+    :rtype: dict
+    """
+    transaction = (data or {}).get("transaction") or {}
+    payment_method = transaction.get("paymentMethod") or {}
+
+    status = transaction.get("status")
+    last_event_date = transaction.get("lastEventDate")
+    payment_method_code = payment_method.get("code")
+    gross_amount = transaction.get("grossAmount")
+    fee_amount = transaction.get("feeAmount")
+    net_amount = transaction.get("netAmount")
+
+    return {
+        "status": (int(status) if status else None),
+        "reference": (transaction.get("reference") or ""),
+        "last_event_date": (iso8601.parse_date(last_event_date) if last_event_date else None),
+        "payment_method_code": (int(payment_method_code) if payment_method_code else None),
+        "gross_amount": (Decimal(gross_amount) if gross_amount else None),
+        "fee_amount": (Decimal(fee_amount) if fee_amount else None),
+        "net_amount": (Decimal(net_amount) if net_amount else None),
+    }
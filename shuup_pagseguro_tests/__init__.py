@@ -86,3 +86,38 @@ ERROR_XML = """
     </error>
 </errors>
 """.strip()
+
+SEARCH_XML = """
+<?xml version="1.0" encoding="ISO-8859-1" standalone="yes"?>
+<transactionSearchResult>
+    <date>2011-02-16T20:14:35.000-02:00</date>
+    <currentPage>{page}</currentPage>
+    <resultsInThisPage>{count}</resultsInThisPage>
+    <totalPages>{total_pages}</totalPages>
+    <transactions>{transactions}</transactions>
+</transactionSearchResult>
+""".strip()
+
+SEARCH_TRANSACTION_XML = """
+<transaction>
+    <date>2011-02-05T15:46:12.000-02:00</date>
+    <lastEventDate>2011-02-15T17:39:14.000-03:00</lastEventDate>
+    <code>{code}</code>
+    <reference>REF1234</reference>
+    <type>1</type>
+    <status>3</status>
+    <paymentMethod>
+        <type>1</type>
+    </paymentMethod>
+    <grossAmount>49900.00</grossAmount>
+    <discountAmount>0.00</discountAmount>
+    <feeAmount>0.00</feeAmount>
+    <netAmount>49900.00</netAmount>
+    <extraAmount>0.00</extraAmount>
+</transaction>
+""".strip()
+
+
+def get_search_xml(codes, page=1, total_pages=1):
+    transactions = "".join(SEARCH_TRANSACTION_XML.format(code=code) for code in codes)
+    return SEARCH_XML.format(page=page, count=len(codes), total_pages=total_pages, transactions=transactions)
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Servidor local que simula o web service do PagSeguro
+
+Atende às sessões, à criação e consulta de transações (v2/v3), às
+notificações e à busca de transações usando os XMLs de exemplo deste
+pacote, com latência, taxa de erros e ciclo de vida dos estados
+configuráveis. Opcionalmente envia as notificações para a loja:
+
+    python -m shuup_pagseguro_tests.fake_server --port 8999 --latency 0.05 \\
+        --error-rate 0.01 --lifecycle 1,2,3,4 --step 5 \\
+        --notification-url http://localhost:8000/pagseguro/notify/
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+from datetime import datetime
+import random
+import re
+import threading
+import time
+import uuid
+
+import six
+from six.moves import socketserver
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.urllib.parse import parse_qs, urlencode, urlparse
+from six.moves.urllib.request import urlopen
+
+from shuup_pagseguro_tests import ERROR_XML, SEARCH_TRANSACTION_XML, SEARCH_XML, SESSION_XML, TRANSACTION_XML
+
+FIXTURE_CODE = "9E884542-81B3-4419-9A75-BCC6FB495EF1"
+FIXTURE_REFERENCE = "REF1234"
+FIXTURE_LAST_EVENT_DATE = "2011-02-15T17:39:14.000-03:00"
+
+TRANSACTION_PATH = re.compile(r"^/v3/transactions/(?P<code>[\w-]+)/?$")
+NOTIFICATION_PATH = re.compile(r"^/v3/transactions/notifications/(?P<code>[\w-]+)/?$")
+REFERENCE_TAG = re.compile(r"<reference>(.*?)</reference>", re.S)
+
+
+class FakeTransaction(object):
+    __slots__ = ("code", "reference", "status", "date", "last_event_date", "step")
+
+    def __init__(self, code, reference, status):
+        self.code = code
+        self.reference = reference
+        self.status = status
+        self.date = self.last_event_date = datetime.now()
+        self.step = 0
+
+
+class FakePagSeguro(object):
+    """
+    Estado do PagSeguro simulado, compartilhado pelas requisições
+    """
+
+    def __init__(self, latency=0, error_rate=0, lifecycle=(1, 3), step=0, notification_url=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lifecycle = list(lifecycle)
+        self.step = step
+        self.notification_url = notification_url
+        self.transactions = {}
+        self.notifications = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def create_transaction(self, reference):
+        transaction = FakeTransaction(uuid.uuid4().hex.upper(), reference, self.lifecycle[0])
+        with self._lock:
+            self.transactions[transaction.code] = transaction
+        self._schedule_step(transaction)
+        return transaction
+
+    def advance(self, transaction):
+        """
+        Passa a transação para o próximo estado do ciclo de vida e notifica a loja
+        :rtype: str|None
+        :return: o código da notificação
+        """
+        with self._lock:
+            if transaction.step + 1 >= len(self.lifecycle):
+                return None
+            transaction.step += 1
+            transaction.status = self.lifecycle[transaction.step]
+            transaction.last_event_date = datetime.now()
+            notification_code = uuid.uuid4().hex.upper()
+            self.notifications[notification_code] = transaction.code
+
+        self._notify(notification_code)
+        self._schedule_step(transaction)
+        return notification_code
+
+    def _schedule_step(self, transaction):
+        if self.step and transaction.step + 1 < len(self.lifecycle):
+            timer = threading.Timer(self.step, self.advance, args=(transaction,))
+            timer.daemon = True
+            timer.start()
+
+    def _notify(self, notification_code):
+        if not self.notification_url:
+            return
+        data = urlencode({"notificationCode": notification_code, "notificationType": "transaction"})
+        try:
+            urlopen(self.notification_url, data.encode("utf-8"), timeout=10).close()
+        except Exception as exc:
+            print("Notification {0} failed: {1}".format(notification_code, exc))
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def get_transaction(self, code):
+        with self._lock:
+            return self.transactions.get(code)
+
+    def get_notification_transaction(self, notification_code):
+        with self._lock:
+            return self.transactions.get(self.notifications.get(notification_code))
+
+    def search(self, initial_date, final_date):
+        with self._lock:
+            transactions = [
+                transaction for transaction in self.transactions.values()
+                if initial_date <= transaction.date.strftime("%Y-%m-%dT%H:%M") <= final_date
+            ]
+        return sorted(transactions, key=lambda transaction: transaction.date)
+
+
+def render_transaction(transaction, template=TRANSACTION_XML):
+    return (template
+            .replace(FIXTURE_CODE, transaction.code)
+            .replace("<reference>{0}</reference>".format(FIXTURE_REFERENCE),
+                     "<reference>{0}</reference>".format(transaction.reference))
+            .replace("<status>3</status>", "<status>{0}</status>".format(transaction.status))
+            .replace(FIXTURE_LAST_EVENT_DATE, transaction.last_event_date.strftime("%Y-%m-%dT%H:%M:%S.000-03:00")))
+
+
+class FakePagSeguroHandler(BaseHTTPRequestHandler):
+    server_version = "FakePagSeguro/1.0"
+
+    @property
+    def pagseguro(self):
+        return self.server.pagseguro
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send_xml(self, status_code, content):
+        # respeita a codificação declarada nos XMLs de exemplo
+        encoding = ("ISO-8859-1" if 'encoding="ISO-8859-1"' in content[:100] else "UTF-8")
+        body = content.encode(encoding, "xmlcharrefreplace")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/xml; charset={0}".format(encoding))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _before_request(self):
+        """
+        :rtype: bool
+        :return: False se a requisição deve falhar (erro simulado)
+        """
+        self.pagseguro.count_request()
+        if self.pagseguro.latency:
+            time.sleep(self.pagseguro.latency)
+        if self.pagseguro.error_rate and random.random() < self.pagseguro.error_rate:
+            self.send_xml(random.choice((500, 503)), "<error>simulated</error>")
+            return False
+        return True
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+
+        if not self._before_request():
+            return
+
+        if url.path.rstrip("/") == "/v2/sessions":
+            self.send_xml(200, SESSION_XML.replace("620f99e348c24f07877c927b353e49d3", uuid.uuid4().hex))
+        elif url.path.rstrip("/") == "/v2/transactions":
+            match = REFERENCE_TAG.search(body)
+            transaction = self.pagseguro.create_transaction(match.group(1) if match else "")
+            self.send_xml(200, render_transaction(transaction))
+        else:
+            self.send_xml(404, ERROR_XML)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict((key, values[0]) for key, values in six.iteritems(parse_qs(url.query)))
+
+        if not self._before_request():
+            return
+
+        notification_match = NOTIFICATION_PATH.match(url.path)
+        transaction_match = TRANSACTION_PATH.match(url.path)
+
+        if notification_match:
+            transaction = self.pagseguro.get_notification_transaction(notification_match.group("code"))
+            self._send_transaction(transaction)
+        elif transaction_match:
+            self._send_transaction(self.pagseguro.get_transaction(transaction_match.group("code")))
+        elif url.path.rstrip("/") == "/v2/transactions":
+            self._send_search(query)
+        else:
+            self.send_xml(404, ERROR_XML)
+
+    def _send_transaction(self, transaction):
+        if transaction is None:
+            self.send_xml(404, ERROR_XML)
+        else:
+            self.send_xml(200, render_transaction(transaction))
+
+    def _send_search(self, query):
+        page = int(query.get("page") or 1)
+        page_size = int(query.get("maxPageResults") or 100)
+        transactions = self.pagseguro.search(query.get("initialDate", ""), query.get("finalDate", "~"))
+        total_pages = (len(transactions) + page_size - 1) // page_size
+        page_transactions = transactions[(page - 1) * page_size:page * page_size]
+
+        self.send_xml(200, SEARCH_XML.format(
+            page=page,
+            count=len(page_transactions),
+            total_pages=total_pages,
+            transactions="".join(render_transaction(transaction, SEARCH_TRANSACTION_XML.format(code=transaction.code))
+                                 for transaction in page_transactions)
+        ))
+
+
+class FakePagSeguroServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pagseguro, verbose=False):
+        HTTPServer.__init__(self, address, FakePagSeguroHandler)
+        self.pagseguro = pagseguro
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        return "http://{0}:{1}".format(*self.server_address[:2])
+
+
+def start_server(pagseguro=None, host="127.0.0.1", port=0):
+    """
+    Inicia o servidor em uma thread, para uso nos testes
+    :rtype: FakePagSeguroServer
+    """
+    server = FakePagSeguroServer((host, port), pagseguro or FakePagSeguro())
+    thread = threading.Thread(target=server.serve_forever, name="fake-pagseguro")
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the PagSeguro web service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--latency", type=float, default=0, help="Seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with 5xx")
+    parser.add_argument("--lifecycle", default="1,3",
+                        help="Comma-separated statuses each new transaction goes through")
+    parser.add_argument("--step", type=float, default=0,
+                        help="Seconds between status changes (0 keeps the first status)")
+    parser.add_argument("--notification-url", help="Shop URL that receives the status change notifications")
+    parser.add_argument("--verbose", action="store_true")
+    options = parser.parse_args(argv)
+
+    pagseguro = FakePagSeguro(
+        latency=options.latency,
+        error_rate=options.error_rate,
+        lifecycle=[int(status) for status in options.lifecycle.split(",")],
+        step=options.step,
+        notification_url=options.notification_url
+    )
+    server = FakePagSeguroServer((options.host, options.port), pagseguro, verbose=options.verbose)
+    print("Fake PagSeguro listening on {0}".format(server.base_url))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("{0} requests served".format(pagseguro.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -134,3 +134,9 @@ MIDDLEWARE_CLASSES = [
     'shuup.front.middleware.ProblemMiddleware',
     'shuup.front.middleware.ShuupFrontMiddleware',
 ]
+
+# os IDs de sessão são obtidos sob demanda nos testes, sem threads em segundo plano
+PAGSEGURO_SESSION_POOL_SIZE = 0
+
+# novas tentativas sem espera
+PAGSEGURO_RETRY_BACKOFF = 0
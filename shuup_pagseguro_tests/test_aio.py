@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+import asyncio
+from datetime import datetime
+import threading
+
+from django.test.utils import override_settings
+from mock import patch
+import pytest
+
+from shuup_pagseguro.pagseguro import PagSeguroException
+from shuup_pagseguro.pagseguro.ratelimit import DatabaseTokenBucket, reset_rate_limiters
+from shuup_pagseguro.pagseguro.resilience import CircuitBreaker, get_circuit_breaker, reset_circuit_breakers
+from shuup_pagseguro_tests import ERROR_XML, get_search_xml, SESSION_XML, TRANSACTION_XML
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from shuup_pagseguro.pagseguro.aio import AsyncPagSeguro, AsyncSingleFlight  # noqa (E402)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def get_fetch(responses):
+    calls = []
+
+    async def fetch(self, request, timeout):
+        calls.append((request, timeout))
+        response = responses.pop(0)
+        if isinstance(response, BaseException):
+            raise response
+        return response
+
+    return fetch, calls
+
+
+def test_async_client():
+    reset_circuit_breakers()
+    pagseguro = AsyncPagSeguro("loja@rockho.com.br", "token", session=object())
+
+    fetch, calls = get_fetch([(200, SESSION_XML), (200, TRANSACTION_XML), (200, TRANSACTION_XML)])
+    with patch.object(AsyncPagSeguro, "_fetch", fetch):
+        assert run(pagseguro.get_session_id()) == "620f99e348c24f07877c927b353e49d3"
+        assert run(pagseguro.get_transaction_info("XXXX"))["transaction"]["status"] == "3"
+        assert run(pagseguro.get_notification_info("XXXX"))["transaction"]["status"] == "3"
+
+    # mesmas requisições do cliente síncrono
+    assert calls[0][0].method == "post"
+    assert calls[0][0].params == {"email": "loja@rockho.com.br", "token": "token"}
+    assert calls[1][0].url.endswith("/v3/transactions/XXXX")
+    assert calls[2][0].url.endswith("/v3/transactions/notifications/XXXX")
+    assert calls[1][1] == (3.05, 20)
+
+    fetch, calls = get_fetch([(400, ERROR_XML)])
+    with patch.object(AsyncPagSeguro, "_fetch", fetch):
+        with pytest.raises(PagSeguroException):
+            run(pagseguro.get_transaction_info("XXXX"))
+
+
+def test_async_client_retries():
+    reset_circuit_breakers()
+    pagseguro = AsyncPagSeguro("loja@rockho.com.br", "token", session=object())
+
+    fetch, calls = get_fetch([(503, ""), aiohttp.ClientConnectionError(), (200, TRANSACTION_XML)])
+    with patch.object(AsyncPagSeguro, "_fetch", fetch):
+        assert run(pagseguro.get_transaction_info("XXXX"))["transaction"]["status"] == "3"
+    assert len(calls) == 3
+
+    reset_circuit_breakers()
+
+
+def test_async_client_circuit_breaker_probe():
+    reset_circuit_breakers()
+    pagseguro = AsyncPagSeguro("loja@rockho.com.br", "token", session=object())
+    breaker = get_circuit_breaker("ws.pagseguro.uol.com.br")
+    breaker.state = CircuitBreaker.OPEN
+    breaker.opened_at = 0
+
+    # a requisição de teste cancelada não mantém o circuito aguardando o seu resultado
+    fetch, calls = get_fetch([asyncio.CancelledError(), ValueError(), (200, SESSION_XML)])
+    with patch.object(AsyncPagSeguro, "_fetch", fetch):
+        with pytest.raises(asyncio.CancelledError):
+            run(pagseguro.get_session_id())
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.failures == 0
+
+        # erros inesperados contam como falha
+        with pytest.raises(ValueError):
+            run(pagseguro.get_session_id())
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.failures == 1
+
+        breaker.opened_at = 0
+        assert run(pagseguro.get_session_id())
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    reset_circuit_breakers()
+
+
+def test_async_client_database_rate_limit():
+    reset_circuit_breakers()
+    reset_rate_limiters()
+    pagseguro = AsyncPagSeguro("loja@rockho.com.br", "token", session=object())
+    threads = []
+
+    def try_acquire(self, reserve=0):
+        threads.append(threading.current_thread())
+        return 0
+
+    fetch, calls = get_fetch([(200, SESSION_XML)])
+    with override_settings(PAGSEGURO_RATE_LIMIT_RATE=10, PAGSEGURO_RATE_LIMIT_MODE="database"):
+        with patch.object(DatabaseTokenBucket, "try_acquire", try_acquire):
+            with patch.object(AsyncPagSeguro, "_fetch", fetch):
+                assert run(pagseguro.get_session_id())
+
+    reset_rate_limiters()
+
+    # a transação do limitador não bloqueia a thread do event loop
+    assert len(threads) == 1
+    assert threads[0] is not threading.current_thread()
+
+
+def test_async_pay_builds_payload_in_executor():
+    reset_circuit_breakers()
+    reset_rate_limiters()
+    pagseguro = AsyncPagSeguro("loja@rockho.com.br", "token", session=object())
+    threads = []
+
+    def get_payment_xml(self, service, order):
+        threads.append(threading.current_thread())
+        return "<payment></payment>"
+
+    fetch, calls = get_fetch([(200, TRANSACTION_XML)])
+    with patch.object(AsyncPagSeguro, "_get_payment_xml", get_payment_xml):
+        with patch.object(AsyncPagSeguro, "_fetch", fetch):
+            result = run(pagseguro.pay(object(), object()))
+
+    assert not result.error
+    assert calls[0][0].data == "<payment></payment>"
+
+    # as consultas do pedido não bloqueiam a thread do event loop
+    assert len(threads) == 1
+    assert threads[0] is not threading.current_thread()
+
+
+def test_async_search_transactions():
+    pagseguro = AsyncPagSeguro("loja@rockho.com.br", "token", session=object())
+    responses = [
+        (200, get_search_xml(["A", "B"], page=1, total_pages=2)),
+        (200, get_search_xml(["C"], page=2, total_pages=2)),
+        (200, get_search_xml([], page=1, total_pages=0)),
+    ]
+
+    async def collect():
+        codes = []
+        async for transaction in pagseguro.search_transactions(datetime(2016, 1, 1), datetime(2016, 2, 15)):
+            codes.append(transaction["code"])
+        return codes
+
+    fetch, calls = get_fetch(responses)
+    with patch.object(AsyncPagSeguro, "_fetch", fetch):
+        assert run(collect()) == ["A", "B", "C"]
+
+    assert [request.params["page"] for request, timeout in calls] == [1, 2, 1]
+    assert calls[2][0].params["initialDate"] == "2016-01-31T00:00"
+
+
+def test_async_coalesced_lookups():
+    reset_circuit_breakers()
+    pagseguro = AsyncPagSeguro("loja@rockho.com.br", "token", session=object())
+    calls = []
+
+    async def fetch(self, request, timeout):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return (200, TRANSACTION_XML)
+
+    async def lookup_all():
+        return await asyncio.gather(*[pagseguro.get_transaction_info("XXXX") for __ in range(10)])
+
+    with patch.object(AsyncPagSeguro, "_fetch", fetch):
+        results = run(lookup_all())
+
+    assert len(calls) == 1
+    assert all(result["transaction"]["status"] == "3" for result in results)
+
+
+def test_async_single_flight_cancelled_leader():
+    single_flight = AsyncSingleFlight()
+    calls = []
+
+    async def lookup():
+        calls.append(None)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def cancel_leader():
+        leader = asyncio.ensure_future(single_flight.do("XXXX", lookup))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(single_flight.do("XXXX", lookup)) for __ in range(3)]
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    # as demais corrotinas refazem a consulta, uma única vez
+    assert run(cancel_leader()) == [2, 2, 2]
+    assert len(calls) == 2
+    assert not single_flight._futures
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from mock import Mock, patch
+import pytest
+import requests
+
+from shuup_pagseguro.pagseguro import PagSeguro, PagSeguroException
+from shuup_pagseguro.pagseguro.coalescing import get_transaction_cache, SingleFlight
+from shuup_pagseguro_tests import ERROR_XML, TRANSACTION_XML
+
+
+def get_response(status_code, content):
+    response = Mock()
+    response.status_code = status_code
+    response.content = content
+    return response
+
+
+def test_single_flight():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return len(calls)
+
+    threads_done = []
+
+    def call():
+        threads_done.append(flight.do("key", slow))
+
+    threads = [threading.Thread(target=call) for __ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert threads_done == [1] * 5
+
+    # terminada a chamada, a próxima executa novamente
+    assert flight.do("key", slow) == 2
+
+    # exceções também são compartilhadas
+    with pytest.raises(ValueError):
+        flight.do("key", Mock(side_effect=ValueError()))
+
+
+def test_single_flight_base_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+    errors = []
+
+    def interrupted():
+        started.set()
+        release.wait(5)
+        raise KeyboardInterrupt()
+
+    def call(function):
+        try:
+            flight.do("key", function)
+        except BaseException as exc:
+            errors.append(exc)
+
+    leader = threading.Thread(target=call, args=(interrupted,))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=call, args=(Mock(),)) for __ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    # quem aguardava recebe a mesma exceção, não um resultado vazio
+    assert len(errors) == 4
+    assert all(isinstance(error, KeyboardInterrupt) for error in errors)
+
+    # a chave é liberada para a próxima chamada
+    assert flight.do("key", Mock(return_value=1)) == 1
+
+
+def test_coalesced_transaction_lookups():
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+    release = threading.Event()
+
+    def get(url, **kwargs):
+        release.wait(5)
+        return get_response(200, TRANSACTION_XML)
+
+    with patch.object(requests.Session, "get", side_effect=get) as mocked:
+        threads = []
+        results = []
+        for __ in range(5):
+            thread = threading.Thread(target=lambda: results.append(pagseguro.get_transaction_info("XXXX")))
+            thread.start()
+            threads.append(thread)
+
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert mocked.call_count == 1
+        assert len(results) == 5
+        assert all(result["transaction"]["status"] == "3" for result in results)
+
+        # cada chamada recebe o seu próprio resultado
+        assert len(set(id(result) for result in results)) == 5
+
+
+def test_transaction_cache(settings):
+    get_transaction_cache().clear()
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+
+    # sem cache por padrão
+    with patch.object(requests.Session, "get", return_value=get_response(200, TRANSACTION_XML)) as mocked:
+        pagseguro.get_transaction_info("XXXX")
+        pagseguro.get_transaction_info("XXXX")
+        assert mocked.call_count == 2
+
+    settings.PAGSEGURO_TRANSACTION_CACHE_TTL = 60
+    with patch.object(requests.Session, "get", return_value=get_response(200, TRANSACTION_XML)) as mocked:
+        pagseguro.get_transaction_info("XXXX")
+        assert pagseguro.get_transaction("XXXX").status == 3
+        assert mocked.call_count == 1
+
+        # uma notificação processada descarta o cache
+        pagseguro.invalidate_transaction_cache("XXXX")
+        pagseguro.get_transaction_info("XXXX")
+        assert mocked.call_count == 2
+
+    # erros não são guardados
+    with patch.object(requests.Session, "get", return_value=get_response(400, ERROR_XML)) as mocked:
+        for __ in range(2):
+            with pytest.raises(PagSeguroException):
+                pagseguro.get_transaction_info("YYYY")
+        assert mocked.call_count == 2
+
+    get_transaction_cache().clear()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+import threading
+
+from django.test.utils import override_settings
+
+from shuup_pagseguro.pagseguro import PagSeguro
+from shuup_pagseguro.pagseguro.connection import (
+    close_connection_pools, ConnectionPool, get_connection_pool
+)
+
+
+def test_connection_pool_per_account():
+    close_connection_pools()
+
+    pool = get_connection_pool("loja@rockho.com.br")
+    assert get_connection_pool("loja@rockho.com.br") is pool
+    assert get_connection_pool("loja@rockho.com.br", sandbox=True) is not pool
+    assert get_connection_pool("outra@rockho.com.br") is not pool
+
+    # o cliente utiliza o pool da sua conta
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+    assert pagseguro.session is pool.get_session()
+
+    close_connection_pools()
+    assert get_connection_pool("loja@rockho.com.br") is not pool
+
+
+def test_connection_pool_threads():
+    pool = ConnectionPool(pool_connections=1, pool_maxsize=4)
+    sessions = []
+
+    def get_session():
+        sessions.append(pool.get_session())
+
+    threads = [threading.Thread(target=get_session) for _ in range(3)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    # uma sessão por thread, todas sobre o mesmo adaptador
+    assert len(set(id(session) for session in sessions)) == 3
+    for session in sessions:
+        assert session.get_adapter("https://ws.pagseguro.uol.com.br") is pool.adapter
+
+    assert pool.get_session() is pool.get_session()
+
+
+@override_settings(PAGSEGURO_HTTP_KEEP_ALIVE=False, PAGSEGURO_HTTP_POOL_MAXSIZE=3)
+def test_connection_pool_settings():
+    pool = ConnectionPool()
+    assert pool.adapter._pool_maxsize == 3
+    assert pool.get_session().headers["Connection"] == "close"
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils.timezone import now
+from mock import patch
+import pytest
+
+from shuup.testing.factories import (
+    create_order_with_product, get_default_product, get_default_shop, get_default_supplier
+)
+from shuup_pagseguro.constants import PagSeguroNotificationStatus, PagSeguroTransactionStatus
+from shuup_pagseguro.events import dispatch_pending_events, get_event_stats, queue_status_changed_event
+from shuup_pagseguro.models import PagSeguroQueuedEvent
+from shuup_pagseguro.notify_events import PagSeguroPaymentStatusChanged
+from shuup_pagseguro_tests.utils import initialize
+
+
+def create_order():
+    return create_order_with_product(get_default_product(), get_default_supplier(), 1, 10, shop=get_default_shop())
+
+
+@pytest.mark.django_db
+def test_events_coalesced():
+    initialize()
+    order = create_order()
+    other_order = create_order()
+
+    with override_settings(PAGSEGURO_DEFER_EVENTS=True, PAGSEGURO_EVENT_COALESCE_WINDOW=60):
+        queue_status_changed_event(order, 1, 2)
+        queue_status_changed_event(order, 2, 3)
+        queue_status_changed_event(other_order, 1, 3)
+        queue_status_changed_event(other_order, 3, 1)
+
+    # um evento por pedido, do primeiro ao último estado
+    event = PagSeguroQueuedEvent.objects.get(order=order)
+    assert (event.old_status, event.new_status, event.coalesced) == (1, 3, 1)
+    assert get_event_stats() == {"queued": 2, "coalesced": 2, "delivered": 0, "failed": 0}
+
+    with patch.object(PagSeguroPaymentStatusChanged, "run") as run:
+        # o intervalo de agrupamento ainda não terminou
+        assert dispatch_pending_events() == {"delivered": 0, "skipped": 0, "failed": 0}
+
+        PagSeguroQueuedEvent.objects.update(dispatch_after=now())
+        assert dispatch_pending_events() == {"delivered": 1, "skipped": 1, "failed": 0}
+        assert run.call_count == 1
+
+    event.refresh_from_db()
+    assert event.status == PagSeguroNotificationStatus.Done
+    assert get_event_stats() == {"queued": 0, "coalesced": 2, "delivered": 1, "failed": 0}
+
+    # depois do envio, uma nova mudança gera um novo evento
+    with override_settings(PAGSEGURO_DEFER_EVENTS=True):
+        queue_status_changed_event(order, 3, 4)
+    assert PagSeguroQueuedEvent.objects.filter(order=order).count() == 2
+
+    call_command("pagseguro_dispatch_events", stats=True)
+
+
+@pytest.mark.django_db
+def test_events_retry():
+    initialize()
+    order = create_order()
+
+    with override_settings(PAGSEGURO_DEFER_EVENTS=True, PAGSEGURO_EVENT_COALESCE_WINDOW=0):
+        queue_status_changed_event(order, 1, 3)
+
+    with patch.object(PagSeguroPaymentStatusChanged, "run", side_effect=Exception("boom")):
+        assert dispatch_pending_events() == {"delivered": 0, "skipped": 0, "failed": 1}
+
+    event = PagSeguroQueuedEvent.objects.get()
+    assert event.status == PagSeguroNotificationStatus.Pending
+    assert event.attempts == 1
+    assert "boom" in event.last_error
+
+    # novas mudanças ainda podem ser agrupadas ao evento não enviado
+    with override_settings(PAGSEGURO_DEFER_EVENTS=True):
+        queue_status_changed_event(order, 3, 4)
+    event.refresh_from_db()
+    assert event.new_status == PagSeguroTransactionStatus.Available.value
+
+
+@pytest.mark.django_db(transaction=True)
+def test_events_inline():
+    initialize()
+    order = create_order()
+
+    # padrão: o evento é enviado após a confirmação da transação
+    with patch.object(PagSeguroPaymentStatusChanged, "run") as run:
+        with transaction.atomic():
+            queue_status_changed_event(order, 1, 3)
+            assert run.call_count == 0
+        assert run.call_count == 1
+
+        # mudanças desfeitas não geram eventos
+        with pytest.raises(ValueError):
+            with transaction.atomic():
+                queue_status_changed_event(order, 3, 7)
+                raise ValueError()
+        assert run.call_count == 1
+
+    # falhas nos scripts não afetam a mudança já gravada
+    with patch.object(PagSeguroPaymentStatusChanged, "run", side_effect=Exception("boom")):
+        with transaction.atomic():
+            queue_status_changed_event(order, 3, 4)
+
+    assert not PagSeguroQueuedEvent.objects.exists()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from django.test.utils import override_settings
+import requests
+import xmltodict
+
+from shuup_pagseguro.pagseguro import (
+    PagSeguro, PAGSEGURO_WS_SESSION_URL, PAGSEGURO_WS_SESSION_URL_SANDBOX, PAGSEGURO_WS_TRANSACTION_URL
+)
+from shuup_pagseguro_tests import TRANSACTION_XML
+from shuup_pagseguro_tests.fake_server import FakePagSeguro, start_server
+
+
+def test_fake_server_flow():
+    fake_server = start_server(FakePagSeguro(lifecycle=(1, 2, 3)))
+    try:
+        check_fake_server_flow(fake_server)
+    finally:
+        fake_server.shutdown()
+        fake_server.server_close()
+
+
+def check_fake_server_flow(fake_server):
+    base_url = fake_server.base_url
+    params = {"email": "loja@rockho.com.br", "token": "token"}
+
+    session = xmltodict.parse(requests.post(base_url + "/v2/sessions", params=params).content)
+    assert session["session"]["id"]
+
+    response = requests.post(base_url + "/v2/transactions", params=params,
+                             data="<payment><reference>ORDER-1</reference></payment>")
+    transaction = xmltodict.parse(response.content)["transaction"]
+    assert transaction["reference"] == "ORDER-1"
+    assert transaction["status"] == "1"
+
+    # o ciclo de vida gera uma notificação a cada mudança de estado
+    notification_code = fake_server.pagseguro.advance(fake_server.pagseguro.get_transaction(transaction["code"]))
+    response = requests.get(base_url + "/v3/transactions/notifications/" + notification_code, params=params)
+    assert xmltodict.parse(response.content)["transaction"]["status"] == "2"
+
+    response = requests.get(base_url + "/v3/transactions/" + transaction["code"], params=params)
+    sender = xmltodict.parse(TRANSACTION_XML)["transaction"]["sender"]
+    assert xmltodict.parse(response.content)["transaction"]["sender"] == sender
+
+    search_params = dict(params, initialDate="2000-01-01T00:00", finalDate="2100-01-01T00:00",
+                         page=1, maxPageResults=10)
+    result = xmltodict.parse(requests.get(base_url + "/v2/transactions", params=search_params).content)
+    assert result["transactionSearchResult"]["transactions"]["transaction"]["code"] == transaction["code"]
+
+    assert requests.get(base_url + "/v3/transactions/UNKNOWN", params=params).status_code == 404
+    assert fake_server.pagseguro.requests == 6
+
+
+def test_fake_server_errors():
+    server = start_server(FakePagSeguro(error_rate=1))
+    try:
+        assert requests.get(server.base_url + "/v3/transactions/XXXX").status_code in (500, 503)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_base_urls():
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+    assert pagseguro._build_session_request().url == PAGSEGURO_WS_SESSION_URL
+    assert PagSeguro("loja@rockho.com.br", "token", sandbox=True)._build_session_request().url == \
+        PAGSEGURO_WS_SESSION_URL_SANDBOX
+
+    with override_settings(PAGSEGURO_BASE_URLS={"default": "http://proxy/", "search": "http://search"}):
+        assert pagseguro._build_session_request().url == "http://proxy/v2/sessions"
+        assert pagseguro._build_search_request("a", "b", 1, 10).url == "http://search/v2/transactions"
+
+        # a configuração da loja tem precedência sobre o setting
+        pagseguro.base_urls = {"transaction": "http://local:8999"}
+        assert pagseguro._build_transaction_request("XPTO").url == "http://local:8999/v3/transactions/XPTO"
+        assert pagseguro._build_notification_request("XPTO").url == \
+            "http://proxy/v3/transactions/notifications/XPTO"
+
+    pagseguro.base_urls = None
+    assert pagseguro._build_transaction_request("XPTO").url == PAGSEGURO_WS_TRANSACTION_URL.format("XPTO")
+
+
+def test_client_with_fake_server():
+    fake_server = start_server(FakePagSeguro(lifecycle=(1, 3)))
+    try:
+        pagseguro = PagSeguro("loja@rockho.com.br", "token", base_urls={"default": fake_server.base_url})
+        assert pagseguro.get_session_id()
+
+        transaction = fake_server.pagseguro.create_transaction("ORDER-2")
+        assert pagseguro.get_transaction(transaction.code).reference == "ORDER-2"
+
+        notification_code = fake_server.pagseguro.advance(transaction)
+        assert pagseguro.get_notification(notification_code).status == 3
+    finally:
+        fake_server.shutdown()
+        fake_server.server_close()
@@ -8,19 +8,25 @@
 # LICENSE file in the root directory of this source tree.
 from __future__ import unicode_literals
 
+from decimal import Decimal
+from importlib import import_module
+
+from django.apps import apps
 from django.core.urlresolvers import reverse
+import iso8601
 from mock import patch
 import pytest
 import xmltodict
 
 from shuup.core.models._orders import Order
 from shuup.testing.factories import (
-    get_default_product, get_default_shipping_method, get_default_shop, get_default_supplier,
+    create_empty_order, get_default_product, get_default_shipping_method, get_default_shop, get_default_supplier,
     get_default_tax_class
 )
 from shuup.testing.soup_utils import extract_form_fields
 from shuup_pagseguro.constants import (
-    PagSeguroPaymentMethod, PagSeguroPaymentMethodCode, PagSeguroPaymentMethodIdentifier
+    PagSeguroPaymentMethod, PagSeguroPaymentMethodCode, PagSeguroPaymentMethodIdentifier,
+    PagSeguroTransactionStatus
 )
 from shuup_pagseguro.models import PagSeguroPayment
 from shuup_pagseguro.pagseguro import PagSeguro
@@ -101,6 +107,23 @@ def test_payment_refresh():
     # testa o refresh do pagamento
     payment = PagSeguroPayment.objects.get(order=order)
 
+    # o pedido guarda apenas a referência da transação
+    order.refresh_from_db()
+    assert order.payment_data["pagseguro"]["code"] == payment.code
+    assert order.payment_data["pagseguro"]["payment_link"]
+    assert "_data" not in order.payment_data["pagseguro"]
+    assert payment.data["transaction"]["code"] == payment.code
+
+    # colunas indexadas extraídas dos dados da transação
+    assert payment.status == PagSeguroTransactionStatus.Paid.value
+    assert payment.reference == "REF1234"
+    assert payment.payment_method_code == 101
+    assert payment.gross_amount == Decimal("49900.00")
+    assert payment.fee_amount == Decimal("0.00")
+    assert payment.net_amount == Decimal("49900.50")
+    assert payment.last_event_date == iso8601.parse_date("2011-02-15T17:39:14.000-03:00")
+    assert PagSeguroPayment.objects.filter(status=PagSeguroTransactionStatus.Paid.value).count() == 1
+
     transaction_info = xmltodict.parse("""
         <?xml version="1.0" encoding="ISO-8859-1" standalone="yes"?>
         <transaction>
@@ -113,6 +136,53 @@ def test_payment_refresh():
         assert payment.data['transaction']['status'] == "3"
         payment.refresh()
         assert payment.data['transaction']['status'] == "2"
+        assert PagSeguroPayment.objects.get(pk=payment.pk).status == PagSeguroTransactionStatus.InAnalysis.value
+
+    # o histórico começa na criação do pagamento e registra a mudança de estado
+    assert list(payment.events.values_list("old_status", "new_status")) == [
+        (None, PagSeguroTransactionStatus.Paid.value),
+        (PagSeguroTransactionStatus.Paid.value, PagSeguroTransactionStatus.InAnalysis.value),
+    ]
 
     # format string
     "{0}".format(payment)
+
+
+@pytest.mark.django_db
+def test_strip_order_payment_payloads():
+    initialize()
+    order = create_empty_order(shop=get_default_shop())
+    order.payment_data = {"pagseguro": {"code": "XPTO", "payment_link": "http://link", "_data": {"transaction": {}}}}
+    order.save()
+    PagSeguroPayment.objects.create(order=order, code="XPTO", data={"transaction": {"code": "XPTO", "status": "1"}})
+
+    migration = import_module("shuup_pagseguro.migrations.0016_strip_order_payment_payloads")
+    migration.strip_order_payment_payloads(apps, None)
+
+    order = Order.objects.get(pk=order.pk)
+    assert order.payment_data == {"pagseguro": {"code": "XPTO", "payment_link": "http://link"}}
+
+
+@pytest.mark.django_db
+def test_backfill_migrations():
+    initialize()
+    order = create_empty_order(shop=get_default_shop())
+    order.save()
+    payment = PagSeguroPayment.objects.create(order=order, code="XPTO", data={"transaction": {
+        "code": "XPTO", "status": "3", "reference": "1", "lastEventDate": "2016-10-05T12:39:00.000-03:00",
+        "paymentMethod": {"type": "1", "code": "101"}, "grossAmount": "10.00", "feeAmount": "0.90",
+        "netAmount": "9.10"
+    }})
+    payment.events.all().delete()
+    PagSeguroPayment.objects.filter(pk=payment.pk).update(status=None, reference="", gross_amount=None,
+                                                          fee_amount=None, net_amount=None)
+
+    import_module("shuup_pagseguro.migrations.0006_backfill_payment_lookup_columns").backfill_lookup_columns(apps, None)
+    import_module("shuup_pagseguro.migrations.0013_backfill_payment_events").backfill_payment_events(apps, None)
+
+    payment = PagSeguroPayment.objects.get(pk=payment.pk)
+    assert (payment.status, payment.reference, payment.payment_method_code) == (3, "1", 101)
+    assert (payment.gross_amount, payment.fee_amount, payment.net_amount) == (
+        Decimal("10.00"), Decimal("0.90"), Decimal("9.10")
+    )
+    assert list(payment.events.values_list("old_status", "new_status", "fee_amount")) == [(None, 3, Decimal("0.90"))]
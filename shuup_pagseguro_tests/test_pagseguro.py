@@ -8,6 +8,7 @@
 # LICENSE file in the root directory of this source tree.
 from __future__ import unicode_literals
 
+from datetime import datetime
 from unittest.mock import Mock
 
 from django.contrib.auth import get_user_model
@@ -28,7 +29,7 @@ from shuup_pagseguro.constants import (
     PagSeguroPaymentMethod, PagSeguroPaymentMethodCode, PagSeguroPaymentMethodIdentifier
 )
 from shuup_pagseguro.pagseguro import PagSeguro, PagSeguroException, PagSeguroPaymentResult
-from shuup_pagseguro_tests import ERROR_XML, TRANSACTION_XML
+from shuup_pagseguro_tests import ERROR_XML, get_search_xml, TRANSACTION_XML
 from shuup_pagseguro_tests.utils import (
     get_pagseguro_config, get_payment_provider, initialize, patch_pagseguro
 )
@@ -126,7 +127,7 @@ def test_pagseguro():
     response = Mock()
     response.status_code = 200
     response.content = session_xml_fake
-    with patch.object(requests, 'post', return_value=response):
+    with patch.object(requests.Session, 'post', return_value=response):
         session_id = xmltodict.parse(session_xml_fake)['session']['id']
         assert pagseguro.get_session_id() == session_id
 
@@ -134,7 +135,7 @@ def test_pagseguro():
     response = Mock()
     response.status_code = 500
     response.content = ERROR_XML
-    with patch.object(requests, 'post', return_value=response):
+    with patch.object(requests.Session, 'post', return_value=response):
         with pytest.raises(PagSeguroException) as exc:
             pagseguro.get_session_id()
         assert exc.value.status_code == 500
@@ -146,14 +147,14 @@ def test_pagseguro():
     response = Mock()
     response.status_code = 200
     response.content = transaction_xml_fake
-    with patch.object(requests, 'get', return_value=response):
+    with patch.object(requests.Session, 'get', return_value=response):
         assert pagseguro.get_notification_info("XXXX") == xmltodict.parse(transaction_xml_fake)
 
     # Test: get_notification_info - EXCEPTION
     response = Mock()
     response.status_code = 500
     response.content = ERROR_XML
-    with patch.object(requests, 'get', return_value=response):
+    with patch.object(requests.Session, 'get', return_value=response):
         with pytest.raises(PagSeguroException) as exc:
             pagseguro.get_notification_info("ZZZZ")
         assert exc.value.status_code == 500
@@ -166,14 +167,14 @@ def test_pagseguro():
     response = Mock()
     response.status_code = 200
     response.content = transaction_xml_fake
-    with patch.object(requests, 'get', return_value=response):
+    with patch.object(requests.Session, 'get', return_value=response):
         assert pagseguro.get_transaction_info("XXXX") == xmltodict.parse(transaction_xml_fake)
 
     # Test: get_transaction_info - EXCEPTION
     response = Mock()
     response.status_code = 500
     response.content = ERROR_XML
-    with patch.object(requests, 'get', return_value=response):
+    with patch.object(requests.Session, 'get', return_value=response):
         with pytest.raises(PagSeguroException) as exc:
             pagseguro.get_transaction_info("ZZZZ")
         assert exc.value.status_code == 500
@@ -185,7 +186,7 @@ def test_pagseguro():
     response = Mock()
     response.status_code = 200
     response.content = TRANSACTION_XML
-    with patch.object(requests, 'post', return_value=response):
+    with patch.object(requests.Session, 'post', return_value=response):
         parsed_xml = xmltodict.parse(TRANSACTION_XML)
         result = pagseguro.pay(payment_method, order)
         assert isinstance(result, PagSeguroPaymentResult)
@@ -198,7 +199,7 @@ def test_pagseguro():
     response = Mock()
     response.status_code = 400
     response.content = ERROR_XML
-    with patch.object(requests, 'post', return_value=response):
+    with patch.object(requests.Session, 'post', return_value=response):
         parsed_xml = xmltodict.parse(ERROR_XML)
         result = pagseguro.pay(payment_method, order)
         assert isinstance(result, PagSeguroPaymentResult)
@@ -210,7 +211,7 @@ def test_pagseguro():
     response = Mock()
     response.status_code = 500
     response.content = "A BIG MISTAKE"
-    with patch.object(requests, 'post', return_value=response):
+    with patch.object(requests.Session, 'post', return_value=response):
         with pytest.raises(PagSeguroException) as exc:
             pagseguro.pay(payment_method, order)
         assert exc.value.status_code == 500
@@ -238,3 +239,62 @@ def test_pagseguro():
 
     assert payment_xml['payment']['sender']['phone']['areaCode'] == "47"
     assert payment_xml['payment']['sender']['phone']['number'] == "988212231"
+
+
+def test_search_transactions():
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+    pages = [
+        get_search_xml(["A", "B"], page=1, total_pages=2),
+        get_search_xml(["C"], page=2, total_pages=2),
+        get_search_xml([], page=1, total_pages=0),
+    ]
+
+    def get_page(url, params, **kwargs):
+        response = Mock()
+        response.status_code = 200
+        response.content = pages.pop(0)
+        return response
+
+    initial_date = datetime(2016, 1, 1)
+    final_date = datetime(2016, 2, 15)
+
+    with patch.object(requests.Session, 'get', side_effect=get_page) as mocked:
+        transactions = pagseguro.search_transactions(initial_date, final_date, page_size=2)
+        # gerador: nenhuma consulta até ser consumido
+        assert mocked.call_count == 0
+
+        codes = [transaction["code"] for transaction in transactions]
+        assert codes == ["A", "B", "C"]
+
+        # duas páginas da primeira janela de 30 dias e uma da segunda
+        assert mocked.call_count == 3
+        params = [call[1]["params"] for call in mocked.call_args_list]
+        assert [param["page"] for param in params] == [1, 2, 1]
+        assert params[0]["initialDate"] == "2016-01-01T00:00"
+        assert params[0]["finalDate"] == "2016-01-31T00:00"
+        assert params[2]["initialDate"] == "2016-01-31T00:01"
+        assert params[2]["finalDate"] == "2016-02-15T00:00"
+        assert params[0]["maxPageResults"] == 2
+
+    response = Mock()
+    response.status_code = 400
+    response.content = ERROR_XML
+    with patch.object(requests.Session, 'get', return_value=response):
+        with pytest.raises(PagSeguroException):
+            list(pagseguro.search_transactions(initial_date, final_date))
+
+
+def test_search_windows_boundary():
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+
+    # os limites são inclusivos: o minuto da divisa pertence a uma única janela
+    windows = list(pagseguro._get_search_windows(datetime(2016, 1, 1, 0, 0, 30), datetime(2016, 3, 1, 0, 0, 59)))
+    assert windows == [
+        (datetime(2016, 1, 1), datetime(2016, 1, 31)),
+        (datetime(2016, 1, 31, 0, 1), datetime(2016, 3, 1)),
+    ]
+
+    # um período dentro do mesmo minuto ainda é consultado
+    assert list(pagseguro._get_search_windows(datetime(2016, 1, 1, 0, 0, 10), datetime(2016, 1, 1, 0, 0, 50))) == [
+        (datetime(2016, 1, 1), datetime(2016, 1, 1))
+    ]
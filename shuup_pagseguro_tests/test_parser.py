@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from datetime import datetime
+from decimal import Decimal
+
+from mock import Mock, patch
+import pytest
+import requests
+
+from shuup_pagseguro.pagseguro import PagSeguro, PagSeguroException
+from shuup_pagseguro.pagseguro.parser import parse_session_id, parse_transaction, Transaction
+from shuup_pagseguro_tests import ERROR_XML, SESSION_XML, TRANSACTION_XML
+
+
+def test_parse_transaction():
+    transaction = parse_transaction(TRANSACTION_XML)
+
+    assert isinstance(transaction, Transaction)
+    assert transaction.code == "9E884542-81B3-4419-9A75-BCC6FB495EF1"
+    assert transaction.reference == "REF1234"
+    assert transaction.type == 1
+    assert transaction.status == 3
+    assert transaction.last_event_date.replace(tzinfo=None) == datetime(2011, 2, 15, 17, 39, 14)
+    assert transaction.last_event_date.utcoffset().total_seconds() == -3 * 3600
+    assert transaction.payment_method_type == 1
+    assert transaction.payment_method_code == 101
+    assert transaction.gross_amount == Decimal("49900.00")
+    assert transaction.net_amount == Decimal("49900.50")
+    assert transaction.fees.fee_amount == Decimal("0.00")
+    assert transaction.installment_count == 1
+
+    assert [(item.id, item.quantity, item.amount) for item in transaction.items] == [
+        ("0001", 1, Decimal("24300.00")),
+        ("0002", 1, Decimal("25600.00")),
+    ]
+    assert transaction.sender.email == "comprador@uol.com.br"
+    assert transaction.sender.phone_area_code == "11"
+    assert transaction.sender.phone_number == "56273440"
+
+    # campos ausentes e objetos compactos
+    assert transaction.escrow_end_date is None
+    assert not hasattr(transaction, "__dict__")
+
+    # o mesmo resultado a partir dos bytes, como retornados pelo PagSeguro
+    assert parse_transaction(TRANSACTION_XML.encode("utf-8")).items[1].description == "Notebook Rosa"
+
+
+def test_parse_session_id():
+    assert parse_session_id(SESSION_XML) == "620f99e348c24f07877c927b353e49d3"
+
+
+def test_get_transaction():
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+
+    response = Mock()
+    response.status_code = 200
+    response.content = TRANSACTION_XML
+    with patch.object(requests.Session, "get", return_value=response):
+        assert pagseguro.get_transaction("XXXX").status == 3
+        assert pagseguro.get_notification("XXXX").gross_amount == Decimal("49900.00")
+
+    response.status_code = 400
+    response.content = ERROR_XML
+    with patch.object(requests.Session, "get", return_value=response):
+        with pytest.raises(PagSeguroException):
+            pagseguro.get_transaction("XXXX")
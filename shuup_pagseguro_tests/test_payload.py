@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+import xmltodict
+
+from shuup.core.models import Order, OrderLine, OrderLineType
+from shuup.testing.factories import (
+    create_order_with_product, create_product, get_default_product, get_default_shop, get_default_supplier
+)
+from shuup_pagseguro.constants import PagSeguroPaymentMethod
+from shuup_pagseguro.pagseguro import PagSeguro
+from shuup_pagseguro.payload import load_payment_order
+from shuup_pagseguro_tests.utils import get_payment_provider, initialize
+
+
+def create_order(product_count):
+    shop = get_default_shop()
+    supplier = get_default_supplier()
+    order = create_order_with_product(get_default_product(), supplier, 1, 10, shop=shop)
+
+    for index in range(product_count - 1):
+        product = create_product("product-{0}".format(index), shop=shop, supplier=supplier, default_price=5)
+        OrderLine.objects.create(order=order, product=product, supplier=supplier, type=OrderLineType.PRODUCT,
+                                 text=product.name, quantity=2, base_unit_price=shop.create_price(5),
+                                 ordering=(index + 10))
+
+    # linhas sem valor não são enviadas ao PagSeguro
+    OrderLine.objects.create(order=order, type=OrderLineType.OTHER, text="Free gift", quantity=1,
+                             base_unit_price=shop.create_price(0), ordering=100)
+    return order
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("product_count", [1, 5, 20])
+def test_payment_xml_queries(product_count):
+    initialize()
+    service = get_payment_provider().create_service(
+        PagSeguroPaymentMethod.BOLETO.value, identifier="pagseguro_boleto", shop=get_default_shop(),
+        name="boleto", enabled=True
+    )
+    order = Order.objects.get(pk=create_order(product_count).pk)
+
+    with CaptureQueriesContext(connection) as context:
+        payment_xml = PagSeguro("loja@rockho.com.br", "token")._get_payment_xml(service, order)
+
+    # pedido (endereço, criador e documentos), linhas e impostos das linhas
+    assert len(context.captured_queries) <= 3
+
+    items = xmltodict.parse(payment_xml)["payment"]["items"]["item"]
+    items = (items if isinstance(items, list) else [items])
+    assert len(items) == product_count
+    assert "Free gift" not in [item["description"] for item in items]
+
+
+@pytest.mark.django_db
+def test_load_payment_order_reuses_loaded_relations():
+    initialize()
+    order = Order.objects.select_related("shipping_address", "creator").get(pk=create_order(2).pk)
+
+    with CaptureQueriesContext(connection) as context:
+        lines = load_payment_order(order)
+
+    # somente as linhas e os impostos
+    assert len(context.captured_queries) == 2
+    assert len(lines) == 2
+    assert all(line.taxful_price.value > 0 for line in lines)
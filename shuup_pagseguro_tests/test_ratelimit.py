@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from django.db import transaction
+from mock import Mock, patch
+import pytest
+import requests
+
+from shuup_pagseguro.models import PagSeguroRateLimitBucket
+from shuup_pagseguro.pagseguro import deadline, PagSeguro, PagSeguroDeadlineExceeded
+from shuup_pagseguro.pagseguro.ratelimit import (
+    _get_token_executor, BACKGROUND, DatabaseTokenBucket, get_rate_limiter, RateLimiter, request_priority,
+    reset_rate_limiters, TokenBucket
+)
+from shuup_pagseguro_tests import TRANSACTION_XML
+
+RESERVES = {"checkout": 0, "notification": 0.2, "background": 0.5}
+
+
+def get_limiter(bucket):
+    return RateLimiter(bucket, reserves=RESERVES, priorities={"checkout": "checkout", "transaction": "background"})
+
+
+def test_token_bucket_priorities():
+    limiter = get_limiter(TokenBucket("loja@rockho.com.br", rate=1, capacity=10))
+
+    with patch("time.time", return_value=1000):
+        limiter.bucket.updated_at = 1000
+
+        # as tarefas em segundo plano consomem somente até a sua reserva
+        waits = [limiter.try_acquire("transaction") for __ in range(6)]
+        assert waits[:5] == [0] * 5
+        assert waits[5] > 0
+
+        # o checkout ainda dispõe da reserva
+        assert [limiter.try_acquire("checkout") for __ in range(5)] == [0] * 5
+        assert limiter.try_acquire("checkout") > 0
+
+    # as fichas são repostas com o tempo
+    with patch("time.time", return_value=1002):
+        assert limiter.try_acquire("checkout") == 0
+
+
+def test_request_priority():
+    limiter = get_limiter(TokenBucket("loja@rockho.com.br", rate=1, capacity=10))
+    assert limiter.get_priority("checkout") == "checkout"
+
+    with request_priority(BACKGROUND):
+        assert limiter.get_priority("checkout") == BACKGROUND
+        assert limiter.get_reserve("checkout") == RESERVES["background"]
+
+    assert limiter.get_priority("checkout") == "checkout"
+
+
+def test_rate_limit_deadline():
+    limiter = get_limiter(TokenBucket("loja@rockho.com.br", rate=0.1, capacity=1))
+    assert limiter.try_acquire("checkout") == 0
+
+    # a próxima ficha só estará disponível depois do prazo
+    with deadline(1):
+        with pytest.raises(PagSeguroDeadlineExceeded):
+            limiter.acquire("checkout")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_database_token_bucket():
+    limiter = get_limiter(DatabaseTokenBucket("loja@rockho.com.br", rate=1, capacity=4))
+
+    with patch("time.time", return_value=1000):
+        assert [limiter.try_acquire("transaction") for __ in range(2)] == [0, 0]
+        assert limiter.try_acquire("transaction") > 0
+
+        # outro processo compartilha o mesmo bucket
+        other = get_limiter(DatabaseTokenBucket("loja@rockho.com.br", rate=1, capacity=4))
+        assert [other.try_acquire("checkout") for __ in range(2)] == [0, 0]
+        assert other.try_acquire("checkout") > 0
+
+    assert PagSeguroRateLimitBucket.objects.get(key="loja@rockho.com.br").tokens == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_database_token_bucket_outer_transaction():
+    bucket = DatabaseTokenBucket("loja@rockho.com.br", rate=1, capacity=4)
+
+    with patch("time.time", return_value=1000):
+        with pytest.raises(ValueError):
+            with transaction.atomic():
+                assert bucket.try_acquire() == 0
+                # a linha do bucket não fica bloqueada até o fim da transação externa
+                assert _get_token_executor().submit(bucket._take_token_in_worker, 0).result() == 0
+                raise ValueError()
+
+    # as fichas foram retiradas em transações próprias, já confirmadas
+    assert PagSeguroRateLimitBucket.objects.get(key="loja@rockho.com.br").tokens == 2
+
+
+def test_client_rate_limit(settings):
+    reset_rate_limiters()
+    settings.PAGSEGURO_RATE_LIMIT_RATE = 5
+    settings.PAGSEGURO_RATE_LIMIT_BURST = 2
+    settings.PAGSEGURO_RATE_LIMIT_RESERVES = {"background": 0}
+
+    response = Mock()
+    response.status_code = 200
+    response.content = TRANSACTION_XML
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+
+    assert get_rate_limiter("loja@rockho.com.br") is get_rate_limiter("loja@rockho.com.br")
+    assert get_rate_limiter("outra@rockho.com.br") is not get_rate_limiter("loja@rockho.com.br")
+
+    with patch.object(requests.Session, "get", return_value=response) as mocked:
+        with patch("time.sleep") as sleep:
+            for __ in range(3):
+                pagseguro.get_transaction_info("XXXX")
+        assert mocked.call_count == 3
+
+        # a terceira requisição aguarda a reposição de uma ficha
+        assert sleep.call_count >= 1
+        assert 0 < sleep.call_args_list[0][0][0] <= 0.2
+
+    reset_rate_limiters()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from datetime import datetime, timedelta
+
+from django.core.management import call_command
+from django.utils.timezone import now, utc
+from mock import patch
+import pytest
+import xmltodict
+
+from shuup.core.models import PaymentStatus
+from shuup.testing.factories import (
+    create_order_with_product, get_default_product, get_default_shop, get_default_supplier
+)
+from shuup_pagseguro.models import PagSeguroPayment, PagSeguroReconciliationCheckpoint
+from shuup_pagseguro.pagseguro import PagSeguro
+from shuup_pagseguro.reconciliation import Drift, Reconciler
+from shuup_pagseguro_tests.utils import initialize
+
+
+def create_order():
+    return create_order_with_product(get_default_product(), get_default_supplier(), 1, 10, shop=get_default_shop())
+
+
+def get_summary(code, status, reference=""):
+    return {"code": code, "status": "{0}".format(status), "reference": reference}
+
+
+def get_transaction_info(code):
+    status = {"B": 3, "D": 3}.get(code, 1)
+    return xmltodict.parse(
+        "<transaction><code>{0}</code><status>{1}</status></transaction>".format(code, status)
+    )
+
+
+@pytest.mark.django_db
+def test_reconciliation():
+    initialize()
+    shop = get_default_shop()
+
+    order_a = create_order()
+    order_b = create_order()
+    order_c = create_order()
+    order_d = create_order()
+
+    # A: sem divergências; B: estado desatualizado; C: pago sem pagamento no Shuup
+    for code, order, status in (("A", order_a, 1), ("B", order_b, 1), ("C", order_c, 3)):
+        PagSeguroPayment.objects.create(order=order, code=code, data={
+            "transaction": {"code": code, "status": "{0}".format(status)}
+        })
+
+    # D: transação sem pagamento local, mas com referência a um pedido
+    # E: transação sem pagamento local e sem pedido
+    remote = [
+        get_summary("D", 3, order_d.identifier),
+        get_summary("C", 3),
+        get_summary("A", 1),
+        get_summary("E", 1, "XXXX"),
+        get_summary("B", 3),
+    ]
+
+    since = now() - timedelta(days=2)
+    until = now()
+
+    with patch.object(PagSeguro, "search_transactions", return_value=remote):
+        reconciler = Reconciler(shop, window=timedelta(days=1))
+        drifts = [(drift.kind, drift.code) for drift in reconciler.reconcile_window(since, until)]
+        assert drifts == [
+            (Drift.STALE_STATUS, "B"),
+            (Drift.MISSING_ORDER_PAYMENT, "B"),
+            (Drift.MISSING_ORDER_PAYMENT, "C"),
+            (Drift.MISSING_PAYMENT, "D"),
+            (Drift.MISSING_PAYMENT, "E"),
+        ]
+
+    # nada foi alterado
+    assert PagSeguroPayment.objects.get(code="B").status == 1
+    assert not PagSeguroPayment.objects.filter(code="D").exists()
+
+    # corrige as divergências, uma janela por dia
+    with patch.object(PagSeguro, "search_transactions", side_effect=[remote, []]) as search:
+        with patch.object(PagSeguro, "get_transaction_info", side_effect=get_transaction_info):
+            drifts = list(Reconciler(shop, fix=True, window=timedelta(days=1)).reconcile(since, until))
+            assert search.call_count == 2
+
+    assert [(drift.kind, drift.code, drift.fixed) for drift in drifts] == [
+        (Drift.STALE_STATUS, "B", True),
+        (Drift.MISSING_ORDER_PAYMENT, "C", True),
+        (Drift.MISSING_PAYMENT, "D", True),
+        (Drift.MISSING_PAYMENT, "E", False),
+    ]
+
+    for order in (order_b, order_c, order_d):
+        order.refresh_from_db()
+        assert order.payment_status == PaymentStatus.FULLY_PAID
+    assert PagSeguroPayment.objects.get(code="D").order == order_d
+
+    # a conciliação é retomada a partir da última janela
+    assert PagSeguroReconciliationCheckpoint.objects.get(shop=shop).window_end == until
+    with patch.object(PagSeguro, "search_transactions", return_value=[]) as search:
+        assert list(Reconciler(shop).reconcile(since, until, resume=True)) == []
+        assert search.call_count == 0
+
+        call_command("pagseguro_reconcile", shop=shop.pk, resume=True)
+        assert search.call_count == 1
+
+
+@pytest.mark.django_db
+def test_reconciliation_window_boundary():
+    initialize()
+    shop = get_default_shop()
+    since = datetime(2016, 1, 1, tzinfo=utc)
+    until = datetime(2016, 1, 3, tzinfo=utc)
+
+    # janelas consecutivas não consultam o mesmo minuto
+    with patch.object(PagSeguro, "search_transactions", return_value=[]) as search:
+        list(Reconciler(shop, window=timedelta(days=1)).reconcile(since, until))
+
+    assert [call[0] for call in search.call_args_list] == [
+        (since, datetime(2016, 1, 1, 23, 59, tzinfo=utc)),
+        (datetime(2016, 1, 2, tzinfo=utc), datetime(2016, 1, 2, 23, 59, tzinfo=utc)),
+    ]
+
+
+@pytest.mark.django_db
+def test_reconciliation_concurrent_change():
+    initialize()
+    order = create_order()
+    payment = PagSeguroPayment.objects.create(order=order, code="B", data={
+        "transaction": {"code": "B", "status": "1"}
+    })
+
+    def get_changed_transaction_info(code):
+        # uma notificação atualiza o pagamento enquanto o PagSeguro é consultado
+        PagSeguroPayment.objects.filter(pk=payment.pk).update(status=7)
+        return get_transaction_info(code)
+
+    with patch.object(PagSeguro, "search_transactions", return_value=[get_summary("B", 3)]):
+        with patch.object(PagSeguro, "get_transaction_info", side_effect=get_changed_transaction_info):
+            drifts = list(Reconciler(get_default_shop(), fix=True).reconcile_window(now() - timedelta(days=1), now()))
+
+    # a correção é descartada: o estado gravado pela notificação é mantido
+    assert (drifts[0].kind, drifts[0].fixed) == (Drift.STALE_STATUS, False)
+    assert PagSeguroPayment.objects.get(pk=payment.pk).status == 7
+    assert not payment.events.filter(new_status=3).exists()
+
+
+@pytest.mark.django_db
+def test_reconciliation_code_ordering():
+    initialize()
+    # a ordem dos códigos no banco de dados depende da collation ("a" < "B" ou "B" < "a")
+    for code in ("a1", "B1", "b2"):
+        PagSeguroPayment.objects.create(order=create_order(), code=code, data={
+            "transaction": {"code": code, "status": "1"}
+        })
+
+    remote = [get_summary(code, 1) for code in ("b2", "a1", "B1")]
+    with patch.object(PagSeguro, "search_transactions", return_value=remote):
+        drifts = list(Reconciler(get_default_shop()).reconcile_window(now() - timedelta(days=1), now()))
+
+    assert drifts == []
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from mock import patch
+import pytest
+import xmltodict
+
+from shuup.core.models import PaymentStatus
+from shuup.testing.factories import (
+    create_empty_order, create_order_with_product, get_default_product, get_default_shop, get_default_supplier
+)
+from shuup_pagseguro.constants import PagSeguroTransactionStatus
+from shuup_pagseguro.models import PagSeguroPayment
+from shuup_pagseguro.pagseguro import PagSeguro, PagSeguroException
+from shuup_pagseguro.refresh import get_stale_payments, parse_age, refresh_payments
+from shuup_pagseguro_tests.utils import initialize
+
+
+def create_payment(code, status):
+    order = create_empty_order(shop=get_default_shop())
+    order.save()
+    payment = PagSeguroPayment.objects.create(order=order, code=code, data={
+        "transaction": {"code": code, "status": "{0}".format(status)}
+    })
+    # simula um pagamento antigo
+    PagSeguroPayment.objects.filter(pk=payment.pk).update(last_update=now() - timedelta(days=1))
+    return payment
+
+
+def get_transaction_info(code):
+    if code == "ERROR":
+        raise PagSeguroException(500, "error")
+    return xmltodict.parse("<transaction><code>{0}</code><status>3</status></transaction>".format(code))
+
+
+def test_parse_age():
+    assert parse_age("30m") == timedelta(minutes=30)
+    assert parse_age("6h") == timedelta(hours=6)
+    assert parse_age("2d") == timedelta(days=2)
+    assert parse_age("15") == timedelta(minutes=15)
+
+
+@pytest.mark.django_db
+def test_refresh_payments():
+    initialize()
+    waiting = create_payment("WAITING", PagSeguroTransactionStatus.WaitingPayment.value)
+    paid = create_payment("PAID", PagSeguroTransactionStatus.Paid.value)
+    create_payment("AVAILABLE", PagSeguroTransactionStatus.Available.value)
+    create_payment("ERROR", PagSeguroTransactionStatus.InAnalysis.value)
+
+    # pagamentos em estado final não são selecionados
+    queryset = get_stale_payments(older_than=timedelta(hours=1))
+    assert set(queryset.values_list("code", flat=True)) == set(["WAITING", "PAID", "ERROR"])
+    assert get_stale_payments(older_than=timedelta(days=2)).count() == 0
+    assert get_stale_payments(statuses=[PagSeguroTransactionStatus.Paid.value]).get() == paid
+
+    with patch.object(PagSeguro, "get_transaction_info", side_effect=get_transaction_info) as mocked:
+        stats = refresh_payments(queryset, dry_run=True)
+        assert stats.selected == 3
+        assert mocked.call_count == 0
+
+        stats = refresh_payments(queryset, concurrency=2, batch_size=2)
+        assert stats.selected == 3
+        assert stats.refreshed == 2
+        assert stats.changed == 1
+        assert stats.unchanged == 1
+        assert stats.errors == 1
+        assert mocked.call_count == 3
+
+    waiting.refresh_from_db()
+    assert waiting.status == PagSeguroTransactionStatus.Paid.value
+    assert waiting.last_update > now() - timedelta(hours=1)
+
+    with patch.object(PagSeguro, "get_transaction_info", side_effect=get_transaction_info):
+        call_command("pagseguro_refresh", older_than=timedelta(0), shop=get_default_shop().pk)
+        call_command("pagseguro_refresh", dry_run=True, limit=1)
+
+
+@pytest.mark.django_db
+def test_refresh_without_changes():
+    initialize()
+    payment = create_payment("PAID", PagSeguroTransactionStatus.Paid.value)
+    payment.refresh_from_db()
+
+    with patch.object(PagSeguro, "get_transaction_info", side_effect=get_transaction_info):
+        with CaptureQueriesContext(connection) as context:
+            payment.refresh()
+
+    # apenas o agendamento e a data da última atualização são gravados
+    updates = [query["sql"] for query in context.captured_queries if query["sql"].startswith("UPDATE")]
+    assert len(updates) == 1
+    assert '"data"' not in updates[0]
+    assert '"next_check"' in updates[0]
+    assert not payment.events.exists()
+
+    # o estado mudou: os dados e as colunas alteradas são gravados
+    transaction_info = xmltodict.parse("<transaction><code>PAID</code><status>4</status></transaction>")
+    with patch.object(PagSeguro, "get_transaction_info", return_value=transaction_info):
+        payment.refresh()
+
+    payment = PagSeguroPayment.objects.get(pk=payment.pk)
+    assert payment.status == PagSeguroTransactionStatus.Available.value
+    assert payment.data["transaction"]["status"] == "4"
+    assert payment.events.get().new_status == PagSeguroTransactionStatus.Available.value
+
+
+@pytest.mark.django_db
+def test_refresh_applies_transitions():
+    initialize()
+    payments = []
+    for code in ("WAITING-1", "WAITING-2"):
+        order = create_order_with_product(get_default_product(), get_default_supplier(), 1, 10, shop=get_default_shop())
+        payments.append(PagSeguroPayment.objects.create(order=order, code=code, data={
+            "transaction": {"code": code, "status": "{0}".format(PagSeguroTransactionStatus.WaitingPayment.value)}
+        }))
+
+    # a atualização que detecta o pagamento registra o pagamento no pedido
+    with patch.object(PagSeguro, "get_transaction_info", side_effect=get_transaction_info):
+        refresh_payments(PagSeguroPayment.objects.filter(pk=payments[0].pk))
+        PagSeguroPayment.objects.get(pk=payments[1].pk).refresh()
+
+    for payment in payments:
+        payment = PagSeguroPayment.objects.get(pk=payment.pk)
+        assert payment.status == PagSeguroTransactionStatus.Paid.value
+        assert payment.order.payment_status == PaymentStatus.FULLY_PAID
+        assert payment.order.payments.get().payment_identifier == payment.code
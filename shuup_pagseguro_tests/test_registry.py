@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+import pytest
+
+from shuup.testing.factories import get_default_shop
+from shuup_pagseguro.models import PagSeguroConfig
+from shuup_pagseguro.registry import get_pagseguro, get_pagseguro_config, registry
+
+
+@pytest.mark.django_db
+def test_registry():
+    registry.clear()
+    shop = get_default_shop()
+    config = PagSeguroConfig.objects.create(shop=shop, email="loja@rockho.com.br", token="ABC")
+
+    pagseguro = get_pagseguro(shop)
+    assert pagseguro.email == "loja@rockho.com.br"
+    assert get_pagseguro_config(shop.pk) == config
+
+    # nenhuma consulta ao banco enquanto a entrada estiver em cache
+    with CaptureQueriesContext(connection) as context:
+        assert get_pagseguro(shop) is pagseguro
+        assert get_pagseguro_config(shop).token == "ABC"
+    assert len(context.captured_queries) == 0
+
+    # alterar a configuração invalida a entrada
+    config.token = "XYZ"
+    config.save()
+    assert get_pagseguro(shop) is not pagseguro
+    assert get_pagseguro(shop).token == "XYZ"
+
+    # excluir também
+    config.delete()
+    with pytest.raises(PagSeguroConfig.DoesNotExist):
+        get_pagseguro(shop)
+
+
+@pytest.mark.django_db
+def test_registry_ttl():
+    registry.clear()
+    shop = get_default_shop()
+    PagSeguroConfig.objects.create(shop=shop, email="loja@rockho.com.br", token="ABC")
+    pagseguro = get_pagseguro(shop)
+
+    # alteração feita por outro processo (sem sinais)
+    PagSeguroConfig.objects.filter(shop=shop).update(token="XYZ")
+    assert get_pagseguro(shop) is pagseguro
+
+    with override_settings(PAGSEGURO_REGISTRY_TTL=-1):
+        assert get_pagseguro(shop).token == "XYZ"
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from mock import Mock, patch
+import pytest
+import requests
+
+from shuup_pagseguro.pagseguro import (
+    deadline, get_remaining_time, PagSeguro, PagSeguroDeadlineExceeded, PagSeguroException, PagSeguroUnavailable
+)
+from shuup_pagseguro.pagseguro.resilience import (
+    CircuitBreaker, get_circuit_breaker, reset_circuit_breakers, RetryPolicy
+)
+from shuup_pagseguro_tests import SESSION_XML, TRANSACTION_XML
+
+
+def get_response(status_code, content=""):
+    response = Mock()
+    response.status_code = status_code
+    response.content = content
+    return response
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_attempts=3, backoff=1, max_backoff=3)
+    for __ in range(20):
+        assert 0 <= policy.get_delay(1) <= 1
+        assert 0 <= policy.get_delay(2) <= 2
+        assert 0 <= policy.get_delay(5) <= 3
+
+    assert RetryPolicy.for_endpoint("transaction").max_attempts == 3
+    assert RetryPolicy.for_endpoint("checkout").max_attempts == 1
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker("ws.pagseguro.uol.com.br", failure_threshold=2, reset_timeout=10)
+    breaker.before_request()
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(PagSeguroUnavailable) as exc:
+        breaker.before_request()
+    assert exc.value.host == "ws.pagseguro.uol.com.br"
+    assert 0 < exc.value.retry_after <= 10
+
+    # passado o tempo, libera uma única requisição de teste
+    breaker.opened_at -= 10
+    breaker.before_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(PagSeguroUnavailable):
+        breaker.before_request()
+
+    # a requisição de teste falhou: o circuito volta a abrir
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # a requisição de teste foi interrompida: a próxima requisição a substitui
+    breaker.opened_at -= 10
+    breaker.before_request()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_client_retries():
+    reset_circuit_breakers()
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+
+    # consultas são repetidas em caso de erro
+    responses = [get_response(503), requests.ConnectionError(), get_response(200, TRANSACTION_XML)]
+    with patch.object(requests.Session, "get", side_effect=responses) as mocked:
+        assert pagseguro.get_transaction_info("XXXX")["transaction"]["status"] == "3"
+        assert mocked.call_count == 3
+
+    responses = [get_response(500), get_response(500), get_response(500, "error")]
+    with patch.object(requests.Session, "get", side_effect=responses) as mocked:
+        with pytest.raises(PagSeguroException) as exc:
+            pagseguro.get_notification_info("XXXX")
+        assert exc.value.status_code == 500
+        assert mocked.call_count == 3
+
+    # erros do cliente não são repetidos
+    with patch.object(requests.Session, "post", return_value=get_response(401, "Unauthorized")) as mocked:
+        with pytest.raises(PagSeguroException):
+            pagseguro.get_session_id()
+        assert mocked.call_count == 1
+
+    # a criação de transações nunca é repetida
+    with patch.object(requests.Session, "post", return_value=get_response(500, "error")) as mocked:
+        with patch.object(PagSeguro, "_get_payment_xml", return_value="<payment/>"):
+            with pytest.raises(PagSeguroException):
+                pagseguro.pay(None, None)
+        assert mocked.call_count == 1
+
+
+def test_client_circuit_breaker():
+    reset_circuit_breakers()
+    pagseguro = PagSeguro("loja@rockho.com.br", "token", sandbox=True)
+
+    with patch.object(requests.Session, "get", side_effect=requests.ConnectionError()) as mocked:
+        with pytest.raises(requests.ConnectionError):
+            pagseguro.get_transaction_info("XXXX")
+        assert mocked.call_count == 3
+
+        # a quinta falha consecutiva abre o circuito no meio das tentativas
+        with pytest.raises(PagSeguroUnavailable):
+            pagseguro.get_transaction_info("XXXX")
+        assert mocked.call_count == 5
+
+        # circuito aberto: falha imediatamente, sem acessar o PagSeguro
+        with pytest.raises(PagSeguroUnavailable):
+            pagseguro.get_transaction_info("XXXX")
+        assert mocked.call_count == 5
+
+    # o circuito é por host: produção continua disponível
+    assert get_circuit_breaker("ws.sandbox.pagseguro.uol.com.br").state == CircuitBreaker.OPEN
+    with patch.object(requests.Session, "post", return_value=get_response(200, SESSION_XML)):
+        assert PagSeguro("loja@rockho.com.br", "token").get_session_id()
+
+    # erros inesperados também encerram a requisição de teste
+    breaker = get_circuit_breaker("ws.sandbox.pagseguro.uol.com.br")
+    breaker.opened_at -= breaker.reset_timeout
+    with patch.object(requests.Session, "get", side_effect=requests.TooManyRedirects()):
+        with pytest.raises(requests.TooManyRedirects):
+            pagseguro.get_notification_info("XXXX")
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.opened_at -= breaker.reset_timeout
+    with patch.object(requests.Session, "get", side_effect=KeyboardInterrupt()):
+        with pytest.raises(KeyboardInterrupt):
+            pagseguro.get_notification_info("XXXX")
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # e a requisição seguinte é liberada como teste
+    with patch.object(requests.Session, "get", return_value=get_response(200, TRANSACTION_XML)):
+        assert pagseguro.get_notification_info("XXXX")
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    reset_circuit_breakers()
+
+
+def test_deadline():
+    assert get_remaining_time() is None
+
+    with deadline(10):
+        assert 9 < get_remaining_time() <= 10
+
+        # prazos aninhados nunca estendem o prazo externo
+        with deadline(60):
+            assert get_remaining_time() <= 10
+        with deadline(2):
+            assert get_remaining_time() <= 2
+        with deadline(None):
+            assert 9 < get_remaining_time() <= 10
+
+        # ajustes no relógio do sistema não alteram o prazo
+        with patch("time.time", return_value=0):
+            assert 9 < get_remaining_time() <= 10
+
+    assert get_remaining_time() is None
+
+
+def test_client_timeouts():
+    reset_circuit_breakers()
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+
+    with patch.object(requests.Session, "get", return_value=get_response(200, TRANSACTION_XML)) as mocked:
+        pagseguro.get_transaction_info("XXXX")
+        assert mocked.call_args[1]["timeout"] == (3.05, 20)
+
+        # os timeouts são limitados ao prazo
+        with deadline(5):
+            pagseguro.get_transaction_info("XXXX")
+        connect_timeout, read_timeout = mocked.call_args[1]["timeout"]
+        assert connect_timeout == 3.05
+        assert 4 < read_timeout <= 5
+
+    # timeouts da configuração da loja
+    pagseguro = PagSeguro("loja@rockho.com.br", "token", connect_timeout=1, read_timeout=2)
+    with patch.object(requests.Session, "get", return_value=get_response(200, TRANSACTION_XML)) as mocked:
+        pagseguro.get_transaction_info("XXXX")
+        assert mocked.call_args[1]["timeout"] == (1, 2)
+
+
+def test_client_deadline_exceeded():
+    reset_circuit_breakers()
+    pagseguro = PagSeguro("loja@rockho.com.br", "token")
+
+    with patch.object(requests.Session, "get", side_effect=requests.Timeout()) as mocked:
+        with deadline(0.05):
+            # não há tempo para as novas tentativas
+            with patch("shuup_pagseguro.pagseguro.resilience.RetryPolicy.get_delay", return_value=1):
+                with pytest.raises(requests.Timeout):
+                    pagseguro.get_transaction_info("XXXX")
+            assert mocked.call_count == 1
+
+        with deadline(0):
+            with pytest.raises(PagSeguroDeadlineExceeded):
+                pagseguro.get_transaction_info("XXXX")
+        assert mocked.call_count == 1
+
+    reset_circuit_breakers()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.utils.timezone import now
+import pytest
+
+from shuup.testing.factories import create_empty_order, get_default_shop
+from shuup_pagseguro.constants import PagSeguroTransactionStatus
+from shuup_pagseguro.models import PagSeguroPayment
+from shuup_pagseguro.scheduler import get_check_interval, get_due_payments, schedule_next_check
+
+
+def test_check_interval():
+    current_time = now()
+    payment = PagSeguroPayment(status=PagSeguroTransactionStatus.WaitingPayment.value,
+                               last_event_date=current_time)
+
+    # intervalo base do estado
+    schedule_next_check(payment, changed=True, current_time=current_time)
+    assert payment.check_interval == 15 * 60
+    assert payment.next_check == current_time + timedelta(minutes=15)
+
+    # sem alterações: o intervalo dobra
+    schedule_next_check(payment, changed=False, current_time=current_time)
+    assert payment.check_interval == 30 * 60
+    schedule_next_check(payment, changed=False, current_time=current_time)
+    assert payment.check_interval == 60 * 60
+
+    # alteração: volta ao intervalo base do novo estado
+    payment.status = PagSeguroTransactionStatus.InAnalysis.value
+    schedule_next_check(payment, changed=True, current_time=current_time)
+    assert payment.check_interval == 10 * 60
+
+    # transações paradas há muito tempo são consultadas com menos frequência
+    payment.last_event_date = current_time - timedelta(days=10)
+    assert get_check_interval(payment, changed=True, current_time=current_time) == 24 * 60 * 60
+
+    # mas nunca além do intervalo máximo
+    payment.last_event_date = current_time - timedelta(days=1000)
+    payment.status = PagSeguroTransactionStatus.InDispute.value
+    assert get_check_interval(payment, changed=True, current_time=current_time) == 30 * 24 * 60 * 60
+
+    # transações finalizadas e antigas deixam de ser consultadas
+    payment.status = PagSeguroTransactionStatus.Canceled.value
+    schedule_next_check(payment, changed=False, current_time=current_time)
+    assert payment.next_check is None
+
+
+@pytest.mark.django_db
+def test_due_payments():
+    order = create_empty_order(shop=get_default_shop())
+    order.save()
+
+    # a primeira consulta é agendada ao salvar o pagamento
+    payment = PagSeguroPayment.objects.create(order=order, code="XPTO", data={
+        "transaction": {"code": "XPTO", "status": "1"}
+    })
+    assert payment.next_check is not None
+    assert get_due_payments().count() == 0
+    assert get_due_payments(current_time=now() + timedelta(hours=1)).get() == payment
+
+    # transações em estado final não são agendadas ao serem criadas
+    payment = PagSeguroPayment.objects.create(order=order, code="XPTO2", data={
+        "transaction": {"code": "XPTO2", "status": "7"}
+    })
+    assert payment.next_check is None
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from mock import Mock
+
+from shuup_pagseguro.constants import PagSeguroPaymentMethod
+from shuup_pagseguro.pagseguro.serializer import format_amount, serialize_payment
+
+# O XML gerado não é uma cópia byte a byte do antigo template
+# `pagseguro/xml/payment.jinja`. O contrato garantido é:
+#   - mesmos elementos, na mesma ordem e com o mesmo escape do autoescape do Jinja;
+#   - nenhum espaço ou quebra de linha entre as tags;
+#   - valores arredondados como Decimal com ROUND_HALF_UP (o template usava float,
+#     e `'%0.2f' % 2.675` resulta em "2.67");
+#   - valores nulos geram elementos vazios (o template escrevia "None").
+PAYMENT_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<payment><currency>BRL</currency><method>eft</method><mode>default</mode>'
+    '<items><item><id>1</id><description>Caneca &#34;P&amp;B&#34; &lt;azul&gt;</description>'
+    '<amount>8.18</amount><quantity>2</quantity></item></items>'
+    '<reference>ABC123</reference><extraAmount>10.00</extraAmount>'
+    '<sender><name>José D&#39;Avila</name><email>jose@rockho.com.br</email>'
+    '<documents><document><type>CPF</type><value>12345678909</value></document></documents>'
+    '<phone><areaCode>47</areaCode><number>988212231</number></phone>'
+    '<hash>abcdef</hash></sender>'
+    '<shipping><type>3</type><address><street>Rua XV</street><number>100</number>'
+    '<complement></complement><district>Centro</district><postalCode>89010000</postalCode>'
+    '<city>Blumenau</city><state>SC</state><country>BRA</country></address></shipping>'
+    '<bank><name>itau</name></bank></payment>'
+)
+
+
+def test_format_amount():
+    assert format_amount(Decimal("8.181818")) == "8.18"
+    assert format_amount(Decimal("2.675")) == "2.68"
+    assert format_amount(Decimal("10")) == "10.00"
+    assert format_amount(3) == "3.00"
+
+
+def test_serialize_payment():
+    service = Mock(choice_identifier=PagSeguroPaymentMethod.ONLINE_DEBIT.value)
+    line = Mock(ordering=1, text='Caneca "P&B" <azul>', base_unit_price_value=Decimal("8.181818"),
+                quantity=Decimal("2.00"))
+    address = Mock(street="Rua XV", street2="", street3="Centro", city="Blumenau", region="SC",
+                   extra={"numero": "100"})
+    address.name = "José D'Avila"
+    order = Mock(identifier="ABC123", email="jose@rockho.com.br", shipping_address=address,
+                 payment_data={"pagseguro": {"sender_hash": "abcdef", "bank_name": "itau"}})
+
+    payment_xml = serialize_payment(service, order, [line], Decimal("10"), "89010000",
+                                    phone_area_code="47", phone_number="988212231",
+                                    customer_cpf="12345678909")
+    assert payment_xml == PAYMENT_XML
+
+    # boleto, sem documentos, telefone inválido e sem número no endereço
+    service.choice_identifier = PagSeguroPaymentMethod.BOLETO.value
+    address.extra = None
+    payment_xml = serialize_payment(service, order, [line], Decimal("10"), "89010000",
+                                    phone_area_code="47", phone_number="123")
+    assert "<method>boleto</method>" in payment_xml
+    assert "<documents>" not in payment_xml
+    assert "<phone>" not in payment_xml
+    assert "<number>" not in payment_xml
+    assert "<bank>" not in payment_xml
+
+
+def test_serialize_payment_empty_values():
+    service = Mock(choice_identifier=PagSeguroPaymentMethod.BOLETO.value)
+    address = Mock(street="Rua XV", street2=None, street3="Centro", city="Blumenau", region="SC", extra={})
+    address.name = "Jose"
+    order = Mock(identifier="ABC123", email="jose@rockho.com.br", shipping_address=address, payment_data={})
+
+    payment_xml = serialize_payment(service, order, [], Decimal("2.675"), "89010000")
+    assert "<items></items>" in payment_xml
+    assert "<extraAmount>2.68</extraAmount>" in payment_xml
+    assert "<complement></complement>" in payment_xml
+    assert "<hash></hash>" in payment_xml
+    assert "None" not in payment_xml
+    assert payment_xml.count("\n") == 1  # apenas após a declaração XML
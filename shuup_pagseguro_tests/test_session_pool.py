@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+import time
+
+from django.test.utils import override_settings
+from mock import patch
+import pytest
+
+from shuup.testing.factories import get_default_shop
+from shuup_pagseguro import session_pool
+from shuup_pagseguro.pagseguro import PagSeguro
+from shuup_pagseguro.pagseguro.ratelimit import BACKGROUND, get_request_priority
+from shuup_pagseguro.registry import registry
+from shuup_pagseguro.session_pool import (
+    get_session_id, get_session_id_pool, maintain_session_id_pools, SessionIdPool,
+    start_session_id_pool_maintainer
+)
+from shuup_pagseguro_tests.utils import get_pagseguro_config
+
+
+class FakeStorage(dict):
+    def set(self, key, value):
+        self[key] = value
+
+
+def get_session_ids():
+    return ("session-%d" % index for index in range(100))
+
+
+@pytest.mark.django_db
+def test_session_id_pool():
+    registry.clear()
+    shop = get_default_shop()
+    get_pagseguro_config()
+
+    with patch.object(PagSeguro, "get_session_id", side_effect=get_session_ids()) as get_session_id_mock:
+        pool = SessionIdPool(shop.pk, size=3, ttl=60, margin=10)
+
+        # pool vazio: o primeiro ID é obtido na hora
+        with patch.object(SessionIdPool, "refill_async"):
+            session_id, expires = pool.acquire()
+        assert session_id == "session-0"
+        assert expires > time.time()
+
+        # completa o pool e passa a entregar os IDs pré-obtidos
+        pool.refill(registry.get_client(shop))
+        assert len(pool) == 3
+        with patch.object(SessionIdPool, "refill_async"):
+            assert pool.acquire()[0] == "session-1"
+        assert len(pool) == 2
+        assert get_session_id_mock.call_count == 4
+
+        # IDs expirados são descartados
+        pool.refill(registry.get_client(shop))
+        pool._ids[0] = ("expired", time.time() - 1)
+        with patch.object(SessionIdPool, "refill_async"):
+            assert pool.acquire()[0] == "session-3"
+
+        # assim como os que expiram dentro da margem de renovação
+        pool._ids[0] = ("expiring", time.time() + 5)
+        with patch.object(SessionIdPool, "refill_async"):
+            assert pool.acquire()[0] == "session-5"
+
+
+@pytest.mark.django_db
+def test_session_id_pool_maintain():
+    registry.clear()
+    shop = get_default_shop()
+    get_pagseguro_config()
+    priorities = []
+
+    def get_session_id_with_priority(self):
+        priorities.append(get_request_priority())
+        return next(session_ids)
+
+    session_ids = get_session_ids()
+    with override_settings(PAGSEGURO_SESSION_POOL_SIZE=2, PAGSEGURO_SESSION_REFRESH_MARGIN=10,
+                           PAGSEGURO_SESSION_POOL_IDLE_TIMEOUT=60):
+        with patch.object(PagSeguro, "get_session_id", get_session_id_with_priority):
+            # pools sem uso não são preenchidos
+            session_pool.invalidate_session_id_pool(shop)
+            pool = get_session_id_pool(shop)
+            maintain_session_id_pools()
+            assert len(pool) == 0
+
+            # o primeiro checkout obtém o ID na hora, com a prioridade do checkout
+            with patch.object(SessionIdPool, "refill_async"):
+                assert pool.acquire()[0] == "session-0"
+            maintain_session_id_pools()
+            assert [entry[0] for entry in pool._ids] == ["session-1", "session-2"]
+            assert priorities == [None, BACKGROUND, BACKGROUND]
+
+            # IDs próximos de expirar são substituídos
+            pool._ids[0] = ("expiring", time.time() + 5)
+            pool.maintain()
+            assert [entry[0] for entry in pool._ids] == ["session-2", "session-3"]
+
+            # pools ociosos deixam de ser renovados
+            pool.last_used -= 61
+            pool.clear()
+            pool.maintain()
+            assert len(pool) == 0
+
+            # falhas no PagSeguro não interrompem a manutenção
+            with patch.object(PagSeguro, "get_session_id", side_effect=Exception("boom")):
+                pool.last_used = time.time()
+                pool.maintain()
+                assert len(pool) == 0
+                assert not pool._refilling
+
+        session_pool.invalidate_session_id_pool(shop)
+
+
+def test_session_id_pool_maintainer():
+    with patch.object(session_pool, "_maintainer", None):
+        with patch.object(session_pool.threading, "Thread") as thread:
+            # desativado quando não há pool
+            with override_settings(PAGSEGURO_SESSION_POOL_SIZE=0):
+                assert not start_session_id_pool_maintainer()
+
+            with override_settings(PAGSEGURO_SESSION_POOL_SIZE=2, PAGSEGURO_SESSION_POOL_MAINTAIN_INTERVAL=0):
+                assert not start_session_id_pool_maintainer()
+
+            # iniciado uma única vez por processo
+            with override_settings(PAGSEGURO_SESSION_POOL_SIZE=2, PAGSEGURO_SESSION_POOL_MAINTAIN_INTERVAL=30):
+                assert start_session_id_pool_maintainer()
+                assert not start_session_id_pool_maintainer()
+
+        assert thread.call_count == 1
+        assert thread.return_value.start.call_count == 1
+
+
+@pytest.mark.django_db
+def test_session_id_storage():
+    registry.clear()
+    shop = get_default_shop()
+    get_pagseguro_config()
+    storage = FakeStorage()
+
+    with override_settings(PAGSEGURO_SESSION_POOL_SIZE=0):
+        with patch.object(PagSeguro, "get_session_id", side_effect=get_session_ids()) as get_session_id_mock:
+            # o mesmo checkout reutiliza o ID guardado
+            assert get_session_id(shop, storage) == "session-0"
+            assert get_session_id(shop, storage) == "session-0"
+            assert get_session_id_mock.call_count == 1
+
+            # até que ele esteja prestes a expirar
+            storage["ps_session"]["expires"] = time.time() + 5
+            with override_settings(PAGSEGURO_SESSION_REFRESH_MARGIN=10):
+                assert get_session_id(shop, storage) == "session-1"
+
+            # outro checkout recebe outro ID
+            assert get_session_id(shop, FakeStorage()) == "session-2"
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# This file is part of Shuup PagSeguro.
+#
+# Copyright (c) 2016, Rockho Team. All rights reserved.
+# Author: Christian Hess
+#
+# This source code is licensed under the AGPLv3 license found in the
+# LICENSE file in the root directory of this source tree.
+from __future__ import unicode_literals
+
+from django.core.exceptions import ValidationError
+from mock import Mock, patch
+import pytest
+import xmltodict
+
+from shuup.core.models import PaymentStatus
+from shuup.testing.factories import (
+    create_order_with_product, get_default_product, get_default_shop, get_default_supplier
+)
+from shuup_pagseguro.constants import PagSeguroNotificationStatus
+from shuup_pagseguro.models import PagSeguroConfig, PagSeguroNotification, PagSeguroPayment
+from shuup_pagseguro.notifications import process_pending_notifications
+from shuup_pagseguro.pagseguro import PagSeguro
+from shuup_pagseguro.registry import registry
+from shuup_pagseguro.transitions import ACTIONS, TransitionTable, validate_transition_rules
+from shuup_pagseguro_tests.utils import initialize
+
+
+def get_notification_info(notification_code):
+    # código da notificação: <transação>-<estado>
+    code, status = notification_code.rsplit("-", 1)
+    return xmltodict.parse(
+        "<transaction><code>{0}</code><status>{1}</status></transaction>".format(code, status)
+    )
+
+
+def create_payment(code, status):
+    order = create_order_with_product(get_default_product(), get_default_supplier(), 1, 10, shop=get_default_shop())
+    return PagSeguroPayment.objects.create(order=order, code=code, data={
+        "transaction": {"code": code, "status": "{0}".format(status)}
+    })
+
+
+def test_transition_table():
+    table = TransitionTable([["*", 7, ["cancel"]], ["*", 3, ["pay"]], [3, 7, []], ["5", "*", ["cancel"]]])
+    assert table.get_actions(1, 7) == ["cancel"]
+    assert table.get_actions(1, 3) == ["pay"]
+    assert table.get_actions(1, 2) == []
+
+    # a regra mais específica prevalece
+    assert table.get_actions(3, 7) == []
+    assert table.get_actions(5, 6) == ["cancel"]
+    assert table.get_actions(5, 3) == ["pay"]
+
+    with pytest.raises(ValueError):
+        TransitionTable([["*", 3, ["refund"]]])
+
+    for rules in ({"3": "pay"}, [["*", 3]], [["*", 3, "pay"]], [["x", 3, []]]):
+        with pytest.raises(ValueError):
+            validate_transition_rules(rules)
+
+
+@pytest.mark.django_db
+def test_config_transitions_validation():
+    initialize()
+    config = PagSeguroConfig.objects.get(shop=get_default_shop())
+    config.status_transitions = [["*", 3, ["refund"]]]
+    with pytest.raises(ValidationError):
+        config.clean()
+
+    config.status_transitions = [["*", 3, []]]
+    config.clean()
+
+
+@pytest.mark.django_db
+def test_transitions_per_shop():
+    initialize()
+    payment = create_payment("T1", 1)
+
+    # a loja não registra o pagamento automaticamente
+    PagSeguroConfig.objects.filter(shop=get_default_shop()).update(status_transitions=[["*", 3, []]])
+    registry.clear()
+
+    PagSeguroNotification.objects.create(shop=get_default_shop(), code="T1-3")
+    with patch.object(PagSeguro, "get_notification_info", side_effect=get_notification_info):
+        assert process_pending_notifications() == {"processed": 1, "failed": 0}
+
+    payment = PagSeguroPayment.objects.get(pk=payment.pk)
+    assert payment.status == 3
+    assert payment.order.payment_status == PaymentStatus.NOT_PAID
+
+
+@pytest.mark.django_db
+def test_batch_applies_effects_once():
+    initialize()
+    create_payment("T1", 1)
+    create_payment("T2", 1)
+
+    # o PagSeguro notificou a mesma mudança de estado duas vezes
+    for code in ("T1-3", "T1-3-again", "T2-2", "UNKNOWN-3"):
+        PagSeguroNotification.objects.create(shop=get_default_shop(), code=code)
+
+    def get_info(notification_code):
+        return get_notification_info(notification_code.replace("-again", ""))
+
+    pay = Mock()
+    with patch.dict(ACTIONS, {"pay": pay}):
+        with patch.object(PagSeguro, "get_notification_info", side_effect=get_info):
+            assert process_pending_notifications() == {"processed": 3, "failed": 1}
+
+    assert pay.call_count == 1
+    assert pay.call_args[0][0].code == "T1"
+    assert PagSeguroPayment.objects.get(code="T2").status == 2
+    assert PagSeguroNotification.objects.get(code="UNKNOWN-3").status == PagSeguroNotificationStatus.Pending
+    assert list(PagSeguroPayment.objects.get(code="T1").events.values_list("old_status", "new_status")) == [(1, 3)]
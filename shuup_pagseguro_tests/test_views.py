@@ -6,7 +6,11 @@
 #
 # This source code is licensed under the AGPLv3 license found in the
 # LICENSE file in the root directory of this source tree.
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.timezone import now
 from mock import patch
 import pytest
 import xmltodict
@@ -18,9 +22,13 @@ from shuup.testing.factories import (
 )
 from shuup.testing.soup_utils import extract_form_fields
 from shuup_pagseguro.constants import (
-    PagSeguroPaymentMethod, PagSeguroPaymentMethodCode, PagSeguroPaymentMethodIdentifier
+    PagSeguroNotificationStatus, PagSeguroPaymentMethod, PagSeguroPaymentMethodCode,
+    PagSeguroPaymentMethodIdentifier
+)
+from shuup_pagseguro.models import PagSeguroNotification, PagSeguroPayment
+from shuup_pagseguro.notifications import (
+    _seen_notifications, enqueue_notification, process_pending_notifications
 )
-from shuup_pagseguro.models import PagSeguroPayment
 from shuup_pagseguro.pagseguro import PagSeguro
 from shuup_pagseguro_tests.utils import get_payment_provider, initialize, patch_pagseguro
 from shuup_tests.front.test_checkout_flow import fill_address_inputs
@@ -106,6 +114,7 @@ def test_views(rf):
     assert response.status_code == 200
     assert len(response.content.decode("utf-8")) == 0
     assert response["Access-Control-Allow-Origin"] == 'https://sandbox.pagseguro.uol.com.br'
+    assert PagSeguroNotification.objects.count() == 0
 
 
     # Sucesso 1
@@ -119,10 +128,21 @@ def test_views(rf):
 
     # altera retorno do get_notification_info
     with patch.object(PagSeguro, 'get_notification_info', return_value=transaction_info):
-        response = c.post(notify_path, {"notificationCode": "it-does-not-mattter"})
+        response = c.post(notify_path, {"notificationCode": "notification-1"})
         assert response.status_code == 200
         assert response["Access-Control-Allow-Origin"] == 'https://sandbox.pagseguro.uol.com.br'
 
+        # a notificação fica na caixa de entrada até ser processada
+        notification = PagSeguroNotification.objects.get()
+        assert notification.status == PagSeguroNotificationStatus.Pending
+        payment.refresh_from_db()
+        assert payment.data['transaction']['status'] == "1"
+
+        assert process_pending_notifications() == {"processed": 1, "failed": 0}
+        notification.refresh_from_db()
+        assert notification.status == PagSeguroNotificationStatus.Done
+        assert notification.attempts == 1
+
         payment.refresh_from_db()
         order.refresh_from_db()
         assert payment.data['transaction']['status'] == "2"
@@ -139,8 +159,9 @@ def test_views(rf):
         </transaction>
     """.format(transaction_code).strip())
     with patch.object(PagSeguro, 'get_notification_info', return_value=transaction_info):
-        response = c.post(notify_path, {"notificationCode": "it-does-not-mattter"})
+        response = c.post(notify_path, {"notificationCode": "notification-2"})
         assert response.status_code == 200
+        process_pending_notifications()
 
         payment.refresh_from_db()
         order.refresh_from_db()
@@ -162,11 +183,66 @@ def test_views(rf):
         </transaction>
     """.format(transaction_code).strip())
     with patch.object(PagSeguro, 'get_notification_info', return_value=transaction_info):
-        response = c.post(notify_path, {"notificationCode": "it-does-not-mattter"})
+        response = c.post(notify_path, {"notificationCode": "notification-3"})
         assert response.status_code == 200
+        process_pending_notifications()
 
         payment.refresh_from_db()
         order.refresh_from_db()
 
         assert payment.data['transaction']['status'] == "7"
         assert order.status.role == OrderStatusRole.CANCELED
+
+    # o histórico guarda cada mudança de estado com a notificação que a originou
+    assert list(payment.events.values_list("old_status", "new_status", "notification_code")) == [
+        (1, 2, "notification-1"),
+        (2, 3, "notification-2"),
+        (3, 7, "notification-3"),
+    ]
+
+
+@pytest.mark.django_db
+def test_notification_retry():
+    initialize()
+    notification = PagSeguroNotification.objects.create(shop=get_default_shop(), code="XPTO")
+
+    # pagamento inexistente: a notificação é reagendada
+    with override_settings(PAGSEGURO_NOTIFICATION_MAX_ATTEMPTS=2):
+        call_command("pagseguro_process_notifications", concurrency=1)
+        notification.refresh_from_db()
+        assert notification.status == PagSeguroNotificationStatus.Pending
+        assert notification.attempts == 1
+        assert notification.next_attempt > now()
+        assert "DoesNotExist" in notification.last_error
+
+        # ainda não é hora de tentar novamente
+        assert process_pending_notifications() == {"processed": 0, "failed": 0}
+
+        # esgota as tentativas
+        PagSeguroNotification.objects.filter(pk=notification.pk).update(next_attempt=now())
+        assert process_pending_notifications() == {"processed": 0, "failed": 1}
+        notification.refresh_from_db()
+        assert notification.status == PagSeguroNotificationStatus.Failed
+        assert notification.attempts == 2
+
+
+@pytest.mark.django_db
+def test_notification_deduplication():
+    initialize()
+    c = SmartClient()
+    notify_path = reverse("shuup:pagseguro_notification")
+
+    response = c.post(notify_path, {"notificationCode": "XPTO-1"})
+    assert response.status_code == 200
+    assert PagSeguroNotification.objects.filter(code="XPTO-1").count() == 1
+
+    # reenvio: descartado pelo cache em memória, sem consultar o banco
+    with CaptureQueriesContext(connection) as context:
+        assert enqueue_notification(get_default_shop(), "XPTO-1") is None
+    assert len(context.captured_queries) == 0
+
+    # reenvio recebido por outro processo: descartado pelo banco de dados
+    _seen_notifications.clear()
+    response = c.post(notify_path, {"notificationCode": "XPTO-1"})
+    assert response.status_code == 200
+    assert PagSeguroNotification.objects.filter(code="XPTO-1").count() == 1
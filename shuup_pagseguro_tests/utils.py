@@ -17,6 +17,11 @@ from shuup.testing.mock_population import populate_if_required
 from shuup.xtheme._theme import set_current_theme
 from shuup_pagseguro.models import PagSeguroConfig, PagSeguroPaymentProcessor
 from shuup_pagseguro.pagseguro import PagSeguro, PagSeguroPaymentResult
+from shuup_pagseguro.pagseguro.coalescing import get_transaction_cache
+from shuup_pagseguro.pagseguro.ratelimit import reset_rate_limiters
+from shuup_pagseguro.pagseguro.resilience import reset_circuit_breakers
+from shuup_pagseguro.notifications import _seen_notifications
+from shuup_pagseguro.registry import registry
 from shuup_pagseguro_tests import PRODUCT_PRICE, SESSION_XML, TRANSACTION_XML
 
 session_patcher = patch.object(PagSeguro, 'get_session_id', return_value=xmltodict.parse(SESSION_XML)['session']['id'])
@@ -32,6 +37,11 @@ def get_pagseguro_config(**kwargs):
     return PagSeguroConfig.objects.get_or_create(shop=get_default_shop(), **kwargs)[0]
 
 def initialize():
+    registry.clear()
+    _seen_notifications.clear()
+    reset_circuit_breakers()
+    reset_rate_limiters()
+    get_transaction_cache().clear()
     get_default_shop()
     get_pagseguro_config()
     set_current_theme('shuup.themes.classic_gray')